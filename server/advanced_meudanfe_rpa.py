@@ -1,56 +1,52 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote, urlencode
 from bs4 import BeautifulSoup
 import base64
+import asyncio
+from async_http_engine import AsyncHTTPEngine, Probe
+from nfe_xml_cache import lookup_failure, clear_failure, negative_result
+from http_session import create_session
+from xml_stream_extractor import stream_xml, fetch_xml, body_contains_any
+from nfe_access_key import validate_nfe_key
 
 class MeuDanfeRPA:
+    # Sondas de uma consulta, quase todas em meudanfe.com.br: página principal,
+    # 5 URLs diretas, 5 POSTs, 5 AJAX e até 10 endpoints achados no JavaScript
+    MAX_PROBES = 26
+    
     def __init__(self):
-        self.session = requests.Session()
+        # Sessão própria (cookies) sobre o pool de conexões compartilhado
+        self.session = create_session("browser")
         self.base_url = "https://meudanfe.com.br"
-        self.setup_session()
-    
-    def setup_session(self):
-        """Configura sessão simulando navegador real"""
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1'
-        })
+        # Limite por host cobre todas as sondas: uma única rodada concorrente
+        self.engine = AsyncHTTPEngine(self.session, per_host_limit=self.MAX_PROBES)
+        self._main_page = None
     
-    def execute_consultation(self, invoice_key):
-        """Executa consulta usando múltiplas estratégias"""
-        
-        # Estratégia 1: Consulta direta via URL GET
-        result = self.strategy_direct_url(invoice_key)
-        if result.get('success'):
-            return result
-        
-        # Estratégia 2: Simulação de POST com formulário
-        result = self.strategy_form_post(invoice_key)
-        if result.get('success'):
-            return result
-        
-        # Estratégia 3: Requisições AJAX/JSON
-        result = self.strategy_ajax_request(invoice_key)
-        if result.get('success'):
-            return result
+    def execute_consultation(self, invoice_key, force_refresh=False):
+        """
+        Executa consulta usando múltiplas estratégias
+
+        Chaves que falharam recentemente são respondidas pelo cache negativo
+        até o TTL expirar; force_refresh=True ignora a entrada e consulta de novo.
+        Esta consulta não grava no cache negativo: as sondas vão a endpoints
+        adivinhados do meudanfe.com.br, cujo 404/403 não diz se a chave existe,
+        e a entrada barraria também a consulta à SEFAZ (simple_nfe_api).
+        """
+        if force_refresh:
+            clear_failure(invoice_key)
+        else:
+            failure = lookup_failure(invoice_key)
+            if failure:
+                print(f"Chave {invoice_key} barrada pelo cache negativo ({failure['failure_class']})")
+                return negative_result(failure)
         
-        # Estratégia 4: Análise de JavaScript e endpoints dinâmicos
-        result = self.strategy_javascript_analysis(invoice_key)
-        if result.get('success'):
+        result = asyncio.run(self.execute_consultation_async(invoice_key))
+        if result and result.get('success'):
+            clear_failure(invoice_key)
             return result
         
         # Se todas falharam, retorna resposta informativa
@@ -66,7 +62,40 @@ class MeuDanfeRPA:
             ]
         }
     
-    def strategy_direct_url(self, invoice_key):
+    async def execute_consultation_async(self, invoice_key):
+        """Dispara as quatro estratégias ao mesmo tempo; a primeira com XML vence"""
+        self._main_page = None
+        
+        strategies = [
+            self.strategy_direct_url,            # Estratégia 1: Consulta direta via URL GET
+            self.strategy_form_post,             # Estratégia 2: Simulação de POST com formulário
+            self.strategy_ajax_request,          # Estratégia 3: Requisições AJAX/JSON
+            self.strategy_javascript_analysis    # Estratégia 4: Análise de JavaScript e endpoints dinâmicos
+        ]
+        
+        tasks = [asyncio.ensure_future(strategy(invoice_key)) for strategy in strategies]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result.get('success'):
+                    return result
+            return {"success": False}
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def load_main_page(self):
+        """Carrega a página principal uma única vez por consulta (estratégias 2 e 4)"""
+        if self._main_page is None:
+            self._main_page = asyncio.ensure_future(
+                self.engine.fetch(Probe('GET', self.base_url, timeout=15))
+            )
+        main_page = await asyncio.shield(self._main_page)
+        if main_page is None or main_page.status_code != 200:
+            return None
+        return main_page
+    
+    async def strategy_direct_url(self, invoice_key):
         """Estratégia 1: Consulta direta via URL"""
         try:
             print("Estratégia 1: Consulta direta via URL")
@@ -79,54 +108,60 @@ class MeuDanfeRPA:
                 f"{self.base_url}/danfe/{invoice_key}",
                 f"{self.base_url}/xml/{invoice_key}"
             ]
+            # Corpo completo: a página também é usada para achar o link de download
+            probes = [Probe('GET', url, timeout=20) for url in urls_to_try]
             
-            for url in urls_to_try:
-                print(f"Tentando: {url}")
+            def handle(probe, response):
+                if response.status_code != 200:
+                    return None
                 
-                response = self.session.get(url, timeout=20)
+                # Verifica se encontrou a NFe
+                if not self.is_nfe_found(response.content, invoice_key):
+                    return None
+                print(f"NFe encontrada em {probe.url}!")
                 
-                if response.status_code == 200:
-                    # Verifica se encontrou a NFe
-                    if self.is_nfe_found(response.text, invoice_key):
-                        print("NFe encontrada!")
-                        
-                        # Tenta extrair XML
-                        xml_content = self.extract_xml_content(response.text, invoice_key)
-                        if xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": "XML obtido via consulta direta"
-                            }
-                        
-                        # Tenta encontrar link de download
-                        download_url = self.find_download_link(response.text, response.url)
-                        if download_url:
-                            xml_content = self.download_xml(download_url)
-                            if xml_content:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": "XML baixado via link encontrado"
-                                }
+                # Tenta extrair XML
+                xml_content = self.extract_xml_content(response, invoice_key)
+                if xml_content:
+                    return {
+                        "success": True,
+                        "xml_content": xml_content,
+                        "message": "XML obtido via consulta direta"
+                    }
+                
+                # Tenta encontrar link de download
+                download_url = self.find_download_link(response.content, response.url)
+                if download_url:
+                    xml_content = self.download_xml(download_url)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML baixado via link encontrado"
+                        }
+                return None
+            
+            result = await self.engine.first_match(probes, handle)
+            if result:
+                return result
         
         except Exception as e:
             print(f"Erro na estratégia 1: {e}")
         
         return {"success": False}
     
-    def strategy_form_post(self, invoice_key):
+    async def strategy_form_post(self, invoice_key):
         """Estratégia 2: Simulação de POST com formulário"""
         try:
             print("Estratégia 2: Simulação de formulário POST")
             
             # Primeiro carrega a página principal
-            main_page = self.session.get(self.base_url, timeout=15)
-            if main_page.status_code != 200:
+            main_page = await self.load_main_page()
+            if main_page is None:
                 return {"success": False}
             
             # Extrai possíveis tokens CSRF ou viewstate
-            csrf_token = self.extract_csrf_token(main_page.text)
+            csrf_token = self.extract_csrf_token(main_page.content)
             
             # Dados do formulário
             form_data = {
@@ -141,12 +176,12 @@ class MeuDanfeRPA:
                 form_data['_token'] = csrf_token
                 form_data['csrf_token'] = csrf_token
             
-            # Headers para POST
-            self.session.headers.update({
+            # Headers para POST (por requisição, pois as estratégias rodam juntas)
+            headers = {
                 'Content-Type': 'application/x-www-form-urlencoded',
                 'Origin': self.base_url,
                 'Referer': self.base_url
-            })
+            }
             
             # Endpoints para tentar POST
             post_endpoints = [
@@ -156,44 +191,44 @@ class MeuDanfeRPA:
                 '/search',
                 '/nfe/consulta'
             ]
+            probes = [
+                Probe('POST', f"{self.base_url}{endpoint}", data=form_data, headers=headers, timeout=20, stream=True)
+                for endpoint in post_endpoints
+            ]
             
-            for endpoint in post_endpoints:
-                print(f"POST para: {endpoint}")
-                
-                response = self.session.post(
-                    f"{self.base_url}{endpoint}",
-                    data=form_data,
-                    timeout=20
-                )
-                
+            def handle(probe, response):
                 if response.status_code == 200:
-                    if self.is_nfe_found(response.text, invoice_key):
-                        xml_content = self.extract_xml_content(response.text, invoice_key)
-                        if xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": "XML obtido via formulário POST"
-                            }
+                    xml_content = self.extract_xml_content(response, invoice_key)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML obtido via formulário POST"
+                        }
+                return None
+            
+            result = await self.engine.first_match(probes, handle)
+            if result:
+                return result
         
         except Exception as e:
             print(f"Erro na estratégia 2: {e}")
         
         return {"success": False}
     
-    def strategy_ajax_request(self, invoice_key):
+    async def strategy_ajax_request(self, invoice_key):
         """Estratégia 3: Requisições AJAX/JSON"""
         try:
             print("Estratégia 3: Requisições AJAX/JSON")
             
-            # Headers para AJAX
-            self.session.headers.update({
+            # Headers para AJAX (por requisição, pois as estratégias rodam juntas)
+            headers = {
                 'Accept': 'application/json, text/javascript, */*; q=0.01',
                 'Content-Type': 'application/json',
                 'X-Requested-With': 'XMLHttpRequest',
                 'Origin': self.base_url,
                 'Referer': self.base_url
-            })
+            }
             
             # Payload JSON
             json_payload = {
@@ -210,92 +245,97 @@ class MeuDanfeRPA:
                 '/consulta/ajax',
                 '/buscar/ajax'
             ]
+            probes = [
+                Probe('POST', f"{self.base_url}{endpoint}", json=json_payload, headers=headers, timeout=20)
+                for endpoint in ajax_endpoints
+            ]
             
-            for endpoint in ajax_endpoints:
-                print(f"AJAX para: {endpoint}")
-                
-                response = self.session.post(
-                    f"{self.base_url}{endpoint}",
-                    json=json_payload,
-                    timeout=20
-                )
-                
-                if response.status_code == 200:
-                    try:
-                        json_response = response.json()
-                        
-                        if json_response.get('success') and json_response.get('xml'):
+            def handle(probe, response):
+                if response.status_code != 200:
+                    return None
+                try:
+                    json_response = response.json()
+                except ValueError:
+                    # Resposta não é JSON válido, mas pode conter dados úteis
+                    if self.is_nfe_found(response.content, invoice_key):
+                        xml_content = self.extract_xml_content(response, invoice_key)
+                        if xml_content:
                             return {
                                 "success": True,
-                                "xml_content": json_response['xml'],
-                                "message": "XML obtido via requisição AJAX"
+                                "xml_content": xml_content,
+                                "message": "XML extraído de resposta AJAX"
                             }
-                        
-                        if json_response.get('download_url'):
-                            xml_content = self.download_xml(json_response['download_url'])
-                            if xml_content:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": "XML baixado via URL AJAX"
-                                }
-                    
-                    except:
-                        # Resposta não é JSON válido, mas pode conter dados úteis
-                        if self.is_nfe_found(response.text, invoice_key):
-                            xml_content = self.extract_xml_content(response.text, invoice_key)
-                            if xml_content:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": "XML extraído de resposta AJAX"
-                                }
+                    return None
+                
+                if not isinstance(json_response, dict):
+                    return None
+                
+                if json_response.get('success') and json_response.get('xml'):
+                    return {
+                        "success": True,
+                        "xml_content": json_response['xml'],
+                        "message": "XML obtido via requisição AJAX"
+                    }
+                
+                if json_response.get('download_url'):
+                    xml_content = self.download_xml(json_response['download_url'])
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML baixado via URL AJAX"
+                        }
+                return None
+            
+            result = await self.engine.first_match(probes, handle)
+            if result:
+                return result
         
         except Exception as e:
             print(f"Erro na estratégia 3: {e}")
         
         return {"success": False}
     
-    def strategy_javascript_analysis(self, invoice_key):
+    async def strategy_javascript_analysis(self, invoice_key):
         """Estratégia 4: Análise de JavaScript e endpoints dinâmicos"""
         try:
             print("Estratégia 4: Análise de JavaScript")
             
             # Carrega página principal para analisar JavaScript
-            main_page = self.session.get(self.base_url, timeout=15)
-            if main_page.status_code != 200:
+            main_page = await self.load_main_page()
+            if main_page is None:
                 return {"success": False}
             
             # Procura por endpoints JavaScript
-            js_endpoints = self.extract_js_endpoints(main_page.text)
+            js_endpoints = self.extract_js_endpoints(main_page.content)
+            probes = [
+                Probe('GET', f"{self.base_url}{endpoint}?chave={invoice_key}", timeout=15, stream=True)
+                for endpoint in js_endpoints
+            ]
             
-            for endpoint in js_endpoints:
-                print(f"Testando endpoint JS: {endpoint}")
-                
-                # Tenta GET
-                try:
-                    url = f"{self.base_url}{endpoint}?chave={invoice_key}"
-                    response = self.session.get(url, timeout=15)
-                    
-                    if response.status_code == 200 and self.is_nfe_found(response.text, invoice_key):
-                        xml_content = self.extract_xml_content(response.text, invoice_key)
-                        if xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": "XML obtido via endpoint JavaScript"
-                            }
-                except:
-                    continue
+            def handle(probe, response):
+                if response.status_code == 200:
+                    xml_content = self.extract_xml_content(response, invoice_key)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML obtido via endpoint JavaScript"
+                        }
+                return None
+            
+            result = await self.engine.first_match(probes, handle)
+            if result:
+                return result
         
         except Exception as e:
             print(f"Erro na estratégia 4: {e}")
         
         return {"success": False}
     
-    def is_nfe_found(self, html_content, invoice_key):
-        """Verifica se a NFe foi encontrada na resposta"""
-        if not html_content or not invoice_key:
+    def is_nfe_found(self, content, invoice_key):
+        """Verifica se a NFe foi encontrada no corpo bruto da resposta"""
+        if not content or not invoice_key:
             return False
         
         # Indicadores de sucesso
@@ -310,62 +350,36 @@ class MeuDanfeRPA:
             invoice_key
         ]
         
-        html_lower = html_content.lower()
-        return any(indicator in html_lower for indicator in success_indicators)
+        return body_contains_any(content, *success_indicators, ignore_case=True)
     
-    def extract_xml_content(self, html_content, invoice_key):
-        """Extrai conteúdo XML da resposta"""
+    def extract_xml_content(self, response, invoice_key):
+        """Extrai conteúdo XML da resposta, lendo o corpo em pedaços até o fechamento do envelope"""
         try:
-            # Padrões para XML completo
-            xml_patterns = [
-                r'<\?xml[^>]*>.*?</nfeProc>',
-                r'<\?xml[^>]*>.*?</NFe>',
-                r'<nfeProc[^>]*>.*?</nfeProc>',
-                r'<NFe[^>]*>.*?</NFe>'
-            ]
-            
-            for pattern in xml_patterns:
-                match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-                if match and invoice_key in match.group(0):
-                    xml_content = match.group(0)
-                    if len(xml_content) > 2000:  # XML válido deve ter tamanho significativo
-                        return xml_content
-            
-            # Procura em dados JavaScript
-            js_patterns = [
-                rf'xmlData\s*[=:]\s*[\'"]([^\'"]+)[\'"]',
-                rf'xmlContent\s*[=:]\s*[\'"]([^\'"]+)[\'"]',
-                rf'"xml"\s*:\s*"([^"]+)"'
-            ]
-            
-            for pattern in js_patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
-                if match:
-                    xml_data = match.group(1)
-                    if invoice_key in xml_data and len(xml_data) > 1000:
-                        # Decodifica escapes
-                        xml_data = xml_data.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
-                        if xml_data.startswith('<?xml') or '<NFe' in xml_data:
-                            return xml_data
+            # XML válido deve ter tamanho significativo
+            xml_content = stream_xml(response, invoice_key, min_length=2000)
+            if xml_content and '\\"' in xml_content:
+                # XML embutido em string JavaScript (xmlData = "..."): decodifica escapes
+                xml_content = xml_content.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
+            return xml_content
         
         except Exception as e:
             print(f"Erro ao extrair XML: {e}")
         
         return None
     
-    def find_download_link(self, html_content, base_url):
-        """Encontra link de download do XML"""
+    def find_download_link(self, content, base_url):
+        """Encontra link de download do XML no corpo bruto da resposta"""
         try:
             patterns = [
-                r'href\s*=\s*["\']([^"\']*download[^"\']*xml[^"\']*)["\']',
-                r'href\s*=\s*["\']([^"\']*xml[^"\']*download[^"\']*)["\']',
-                r'href\s*=\s*["\']([^"\']*baixar[^"\']*xml[^"\']*)["\']'
+                rb'href\s*=\s*["\']([^"\']*download[^"\']*xml[^"\']*)["\']',
+                rb'href\s*=\s*["\']([^"\']*xml[^"\']*download[^"\']*)["\']',
+                rb'href\s*=\s*["\']([^"\']*baixar[^"\']*xml[^"\']*)["\']'
             ]
             
             for pattern in patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
+                match = re.search(pattern, content, re.IGNORECASE)
                 if match:
-                    link = match.group(1)
+                    link = match.group(1).decode('utf-8', errors='replace')
                     if link.startswith('/'):
                         return f"{self.base_url}{link}"
                     elif link.startswith('http'):
@@ -381,72 +395,62 @@ class MeuDanfeRPA:
     def download_xml(self, url):
         """Baixa XML de uma URL"""
         try:
-            response = self.session.get(url, timeout=15)
-            if response.status_code == 200:
-                content = response.text.strip()
-                if content.startswith('<?xml') and len(content) > 1000:
-                    return content
+            return fetch_xml(self.session, url, min_length=1000)
         except Exception as e:
             print(f"Erro ao baixar XML: {e}")
         
         return None
     
-    def extract_csrf_token(self, html_content):
-        """Extrai token CSRF da página"""
+    def extract_csrf_token(self, content):
+        """Extrai token CSRF do corpo bruto da página"""
         try:
             patterns = [
-                r'name="_token"\s+value="([^"]+)"',
-                r'name="csrf_token"\s+value="([^"]+)"',
-                r'csrf-token"\s+content="([^"]+)"'
+                rb'name="_token"\s+value="([^"]+)"',
+                rb'name="csrf_token"\s+value="([^"]+)"',
+                rb'csrf-token"\s+content="([^"]+)"'
             ]
             
             for pattern in patterns:
-                match = re.search(pattern, html_content)
+                match = re.search(pattern, content)
                 if match:
-                    return match.group(1)
+                    return match.group(1).decode('ascii', errors='replace')
         except:
             pass
         
         return None
     
-    def extract_js_endpoints(self, html_content):
-        """Extrai endpoints JavaScript da página"""
+    def extract_js_endpoints(self, content):
+        """Extrai endpoints JavaScript do corpo bruto da página"""
         try:
             endpoints = set()
             
             # Padrões para encontrar URLs em JavaScript
             patterns = [
-                r'["\'](/[^"\']*(?:consulta|nfe|xml|danfe)[^"\']*)["\']',
-                r'url\s*:\s*["\']([^"\']*)["\']',
-                r'action\s*:\s*["\']([^"\']*)["\']'
+                rb'["\'](/[^"\']*(?:consulta|nfe|xml|danfe)[^"\']*)["\']',
+                rb'url\s*:\s*["\']([^"\']*)["\']',
+                rb'action\s*:\s*["\']([^"\']*)["\']'
             ]
             
             for pattern in patterns:
-                matches = re.findall(pattern, html_content, re.IGNORECASE)
+                matches = re.findall(pattern, content, re.IGNORECASE)
                 for match in matches:
-                    if match.startswith('/') and len(match) > 1:
-                        endpoints.add(match)
+                    if match.startswith(b'/') and len(match) > 1:
+                        endpoints.add(match.decode('utf-8', errors='replace'))
             
             return list(endpoints)[:10]  # Limita a 10 endpoints
         except:
             return []
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def main():
     """Ponto de entrada"""
-    if len(sys.argv) != 2:
+    args = sys.argv[1:]
+    force_refresh = "--force" in args
+    args = [arg for arg in args if arg != "--force"]
+    
+    if len(args) != 1:
         result = {"success": False, "error": "Chave NFe é obrigatória"}
     else:
-        invoice_key = sys.argv[1].strip()
+        invoice_key = args[0].strip()
         
         # Valida a chave
         is_valid, message = validate_nfe_key(invoice_key)
@@ -455,7 +459,7 @@ def main():
         else:
             print(f"Iniciando RPA avançado para chave: {invoice_key}")
             rpa = MeuDanfeRPA()
-            result = rpa.execute_consultation(invoice_key)
+            result = rpa.execute_consultation(invoice_key, force_refresh=force_refresh)
     
     print(json.dumps(result, ensure_ascii=False))
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Motor HTTP assíncrono para sondagem concorrente de endpoints
+Executa várias requisições ao mesmo tempo sobre uma única requests.Session
+(criada pelo http_session, com pool de conexões compartilhado), limitando a concorrência por host, e
+devolve o primeiro resultado aceito, cancelando o restante.
+
+As chamadas bloqueantes do requests rodam em threads daemon ligadas ao loop,
+o que evita uma dependência extra (aiohttp), mantém cookies e headers da
+sessão existente e não segura o fim do processo esperando sondas abandonadas.
+
+O limite por host (padrão NFE_ASYNC_PER_HOST_LIMIT=8) protege hosts
+alheios, mas sondas além dele esperam em ondas: quem dispara N sondas ao
+mesmo host e quer uma só ida e volta deve passar per_host_limit >= N (o
+motor monta um pool de conexões desse tamanho na sessão).
+
+Uso:
+    engine = AsyncHTTPEngine(session)
+    result = asyncio.run(engine.first_match(probes, handler))
+"""
+
+import os
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import http_session
+from fetch_metrics import current_context
+
+DEFAULT_PER_HOST_LIMIT = int(os.environ.get("NFE_ASYNC_PER_HOST_LIMIT", "8"))
+DEFAULT_TOTAL_LIMIT = 32
+
+
+def run_in_thread(func, *args, **kwargs):
+    """Executa uma função bloqueante numa thread daemon e devolve um awaitable"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            result, error = func(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            # Loop já encerrado: a sonda foi abandonada
+            pass
+
+    threading.Thread(target=current_context().run, args=(target,), daemon=True).start()
+    return future
+
+
+class Probe:
+    """Uma requisição candidata (método, URL e kwargs do requests)"""
+    __slots__ = ("method", "url", "kwargs", "label")
+
+    def __init__(self, method, url, label=None, **kwargs):
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.label = label or f"{method} {url}"
+
+
+class AsyncHTTPEngine:
+    def __init__(self, session, per_host_limit=DEFAULT_PER_HOST_LIMIT, total_limit=DEFAULT_TOTAL_LIMIT):
+        self.session = session
+        self.per_host_limit = per_host_limit
+        self.total_limit = total_limit
+        self._host_semaphores = {}
+        self._total_semaphore = None
+        self._loop = None
+        # Contadores de respostas e erros de rede (ex.: fonte fora do ar)
+        self.responses = 0
+        self.errors = 0
+
+        # Sessões do http_session já usam o pool compartilhado; só monta um
+        # pool maior quando a concorrência por host passa do tamanho dele
+        if per_host_limit > http_session.POOL_PER_HOST:
+            http_session.mount(session, http_session.create_adapter(
+                pool_maxsize=per_host_limit, pool_connections=total_limit
+            ))
+
+    def _semaphores(self, url):
+        # Semáforos pertencem ao loop em execução; cada asyncio.run cria um novo
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._host_semaphores = {}
+            self._total_semaphore = asyncio.Semaphore(self.total_limit)
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._total_semaphore, self._host_semaphores[host]
+
+    async def fetch(self, probe):
+        """Executa uma sonda; devolve a resposta ou None em caso de erro"""
+        total, per_host = self._semaphores(probe.url)
+        async with total, per_host:
+            try:
+                response = await run_in_thread(
+                    self.session.request, probe.method, probe.url, **probe.kwargs
+                )
+            except Exception as e:
+                print(f"Erro em {probe.label}: {e}")
+                self.errors += 1
+                return None
+            if response.status_code < 500:
+                self.responses += 1
+            else:
+                self.errors += 1
+            return response
+
+    async def first_match(self, probes, handler):
+        """
+        Dispara todas as sondas ao mesmo tempo e devolve o primeiro resultado aceito
+
+        Args:
+            probes: lista de Probe
+            handler: função(probe, response) -> resultado ou None
+
+        Returns:
+            O primeiro resultado não-None do handler, ou None
+        """
+        async def run(probe):
+            response = await self.fetch(probe)
+            if response is None:
+                return None
+            try:
+                return await run_in_thread(handler, probe, response)
+            except Exception as e:
+                print(f"Erro ao processar {probe.label}: {e}")
+                return None
+            finally:
+                # Devolve a conexão ao pool mesmo se o corpo (stream=True) não foi lido
+                response.close()
+
+        tasks = [asyncio.ensure_future(run(probe)) for probe in probes]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result is not None:
+                    return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Suíte de benchmarks dos buscadores de NFe contra o servidor local
+Sobe o nfe_fake_server numa thread, roteia meudanfe, SEFAZ e APIs para ele
+(nfe_endpoints) e mede, com chaves novas a cada chamada (sem cache):
+
+    strategies    latência e taxa de sucesso de cada estratégia HTTP
+    entry_points  p50/p95/p99 ponta a ponta dos get_nfe_xml-like
+    extractors    vazão de extract_xml_content, extract_xml_from_response e
+                  find_download_link sobre páginas e XMLs realistas
+    startup       tempo de import de cada módulo num processo novo
+
+Fluxos Selenium não entram: navegação do Chrome não passa pelo roteamento.
+Cache de XML e estatísticas de estratégia vão para um diretório temporário,
+sem tocar nos dados reais. O relatório sai em JSON, para comparar entre
+mudanças.
+
+Uso:
+    python3 benchmark_suite.py --runs 30 --latency meudanfe=150,sefaz=400,api=80
+    python3 benchmark_suite.py --sections extractors,startup --output bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import platform
+import subprocess
+
+SECTIONS = ('strategies', 'entry_points', 'extractors', 'startup')
+
+# Módulos medidos no startup: buscadores e os processos residentes/lote
+STARTUP_MODULES = (
+    'simple_nfe_api', 'nfe_consultation_service', 'nfe_api_service', 'official_nfe_service',
+    'nfe_scraper_service', 'meudanfe_http_rpa', 'optimized_rpa_final', 'hybrid_rpa_system',
+    'advanced_meudanfe_rpa', 'meudanfe_javascript_rpa', 'meudanfe_rpa', 'xml_scraper',
+    'xml_fetch_worker', 'nfe_batch_fetch',
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentiles(samples):
+    """min/mean/p50/p95/p99/max em ms (posto mais próximo) de durações em segundos"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+
+    return {
+        "min_ms": round(ordered[0] * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(rank(50) * 1000, 2),
+        "p95_ms": round(rank(95) * 1000, 2),
+        "p99_ms": round(rank(99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def succeeded(result):
+    """Resultado de estratégia/entrada aceito: XML (str) ou dict com success"""
+    if isinstance(result, dict):
+        return bool(result.get('success'))
+    return bool(result)
+
+
+def fresh_keys(count, seed, cuf='35', modelo='55'):
+    """
+    Chaves válidas e distintas (nenhuma cai no cache de XML)
+
+    UF e modelo fixos deixam o roteamento por chave igual entre execuções;
+    o padrão (SP, NF-e) tem URL em todos os mapas de SEFAZ dos buscadores.
+    """
+    from nfe_access_key import sample_keys, check_digit
+    keys = []
+    for key in sample_keys(count, invalid_ratio=0, seed=seed):
+        body = cuf + key[2:20] + modelo + key[22:43]
+        keys.append(body + str(check_digit(body)))
+    return keys
+
+
+def timed_calls(function, keys):
+    durations, successes, errors = [], 0, 0
+    for key in keys:
+        started = time.perf_counter()
+        try:
+            ok = succeeded(function(key))
+        except Exception:
+            ok = False
+            errors += 1
+        durations.append(time.perf_counter() - started)
+        successes += ok
+    report = {"calls": len(keys), "success_rate": round(successes / len(keys), 3) if keys else 0,
+              "exceptions": errors}
+    report.update(percentiles(durations))
+    return report
+
+
+def strategy_functions():
+    """nome -> função(chave) de cada estratégia HTTP, com sessão/instância própria"""
+    import simple_nfe_api
+    import nfe_consultation_service
+    import meudanfe_http_rpa
+    import optimized_rpa_final
+
+    rpa = optimized_rpa_final.OptimizedRPAFinal()
+    return {
+        "simple_nfe_api.try_sefaz_webservice": simple_nfe_api.try_sefaz_webservice,
+        "simple_nfe_api.try_receita_federal_api": simple_nfe_api.try_receita_federal_api,
+        "simple_nfe_api.try_portal_consultation": simple_nfe_api.try_portal_consultation,
+        "simple_nfe_api.try_public_nfe_apis": simple_nfe_api.try_public_nfe_apis,
+        "nfe_consultation_service.try_public_apis": nfe_consultation_service.try_public_apis,
+        "nfe_consultation_service.try_sefaz_consultation": nfe_consultation_service.try_sefaz_consultation,
+        "nfe_consultation_service.try_qr_code_consultation": nfe_consultation_service.try_qr_code_consultation,
+        "meudanfe_http_rpa.try_meudanfe_direct_access":
+            lambda key: meudanfe_http_rpa.try_meudanfe_direct_access(meudanfe_http_rpa.create_session(), key),
+        "meudanfe_http_rpa.try_meudanfe_api_endpoints":
+            lambda key: meudanfe_http_rpa.try_meudanfe_api_endpoints(meudanfe_http_rpa.create_session(), key),
+        "meudanfe_http_rpa.try_meudanfe_form_submission":
+            lambda key: meudanfe_http_rpa.try_meudanfe_form_submission(meudanfe_http_rpa.create_session(), key),
+        "optimized_rpa_final.try_direct_consultation": lambda key: rpa.try_direct_consultation(key, []),
+        "optimized_rpa_final.try_form_submission": lambda key: rpa.try_form_submission(key, []),
+        "optimized_rpa_final.try_api_endpoints": lambda key: rpa.try_api_endpoints(key, []),
+        "optimized_rpa_final.try_xml_discovery": lambda key: rpa.try_xml_discovery(key, []),
+    }
+
+
+def entry_point_functions():
+    """nome -> função(chave) dos pontos de entrada HTTP (o que o main() de cada script chama)"""
+    import simple_nfe_api
+    import nfe_consultation_service
+    import meudanfe_http_rpa
+    import optimized_rpa_final
+
+    return {
+        "simple_nfe_api.get_nfe_xml_simple": simple_nfe_api.get_nfe_xml_simple,
+        "nfe_consultation_service.get_nfe_xml": nfe_consultation_service.get_nfe_xml,
+        "meudanfe_http_rpa.get_xml_from_meudanfe_http": meudanfe_http_rpa.get_xml_from_meudanfe_http,
+        "optimized_rpa_final.execute_rpa": lambda key: optimized_rpa_final.OptimizedRPAFinal().execute_rpa(key),
+    }
+
+
+def bench_strategies(runs, seed, cuf):
+    keys = fresh_keys(runs, seed, cuf)
+    return {name: timed_calls(function, keys) for name, function in strategy_functions().items()}
+
+
+def bench_entry_points(runs, seed, cuf):
+    report = {}
+    for offset, (name, function) in enumerate(entry_point_functions().items(), start=1):
+        report[name] = timed_calls(function, fresh_keys(runs, seed + offset, cuf))
+    return report
+
+
+def extractor_corpora(items, page_kb):
+    """nome -> (html/xml, chave): páginas do servidor local e o XML em vários contextos"""
+    from nfe_fake_server import FakeSettings, home_page, result_page, nfe_document
+    from nfe_record_parser import SAMPLE_KEY
+
+    settings = FakeSettings(items=items, page_kb=page_kb)
+    document = nfe_document(SAMPLE_KEY, items).decode('utf-8')
+    page = result_page(SAMPLE_KEY, settings)
+    embedded = page.replace('</body>', f'<textarea id="xml-nfe">{document}</textarea></body>')
+    return {
+        "result_page": (page, SAMPLE_KEY),
+        "page_with_xml": (embedded, SAMPLE_KEY),
+        "xml_document": (document, SAMPLE_KEY),
+        "no_match_page": (home_page(settings), SAMPLE_KEY),
+    }
+
+
+def extractor_functions():
+    """nome -> função(conteúdo, chave)"""
+    import optimized_rpa_final
+    import hybrid_rpa_system
+    import meudanfe_javascript_rpa
+    import advanced_meudanfe_rpa
+    from xml_stream_extractor import extract_xml
+
+    optimized = optimized_rpa_final.OptimizedRPAFinal()
+    hybrid = hybrid_rpa_system.HybridRPASystem()
+    advanced = advanced_meudanfe_rpa.MeuDanfeRPA()
+    return {
+        "xml_stream_extractor.extract_xml": extract_xml,
+        "optimized_rpa_final.extract_xml_content": optimized.extract_xml_content,
+        "hybrid_rpa_system.extract_xml_from_response": hybrid.extract_xml_from_response,
+        "meudanfe_javascript_rpa.extract_xml_from_response": meudanfe_javascript_rpa.extract_xml_from_response,
+        "optimized_rpa_final.find_download_link": lambda content, key: optimized.find_download_link(content),
+        "advanced_meudanfe_rpa.find_download_link":
+            lambda content, key: advanced.find_download_link(content, advanced.base_url),
+        "hybrid_rpa_system.extract_download_link": hybrid.extract_download_link,
+    }
+
+
+def throughput(function, content, key, min_seconds):
+    """Repete a chamada por pelo menos min_seconds; chamadas/s e MB/s"""
+    size = len(content.encode('utf-8'))
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        result = function(content, key)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+    return {
+        "bytes": size,
+        "calls_per_second": round(calls / elapsed, 1),
+        "mb_per_second": round(size * calls / elapsed / 1e6, 1),
+        "found": result is not None,
+    }
+
+
+def bench_extractors(items, page_kb, min_seconds):
+    corpora = extractor_corpora(items, page_kb)
+    return {
+        name: {corpus: throughput(function, content, key, min_seconds)
+               for corpus, (content, key) in corpora.items()}
+        for name, function in extractor_functions().items()
+    }
+
+
+def bench_startup(runs, python=sys.executable):
+    """Melhor tempo de `python -c "import módulo"` menos o de um interpretador vazio"""
+    def best(code):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            completed = subprocess.run([python, '-c', code], cwd=HERE, capture_output=True)
+            timings.append(time.perf_counter() - started)
+            if completed.returncode != 0:
+                return None, completed.stderr.decode('utf-8', errors='replace').strip().splitlines()[-1:]
+        return min(timings), None
+
+    baseline, _ = best('pass')
+    report = {"interpreter_ms": round(baseline * 1000, 1), "modules": {}}
+    for module in STARTUP_MODULES:
+        seconds, error = best(f'import {module}')
+        if seconds is None:
+            report["modules"][module] = {"error": error[0] if error else "falhou"}
+        else:
+            report["modules"][module] = {
+                "total_ms": round(seconds * 1000, 1),
+                "import_ms": round((seconds - baseline) * 1000, 1),
+            }
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks de estratégias, extratores e latência ponta a ponta")
+    parser.add_argument("--sections", default=','.join(SECTIONS), help=f"Seções (padrão: {','.join(SECTIONS)})")
+    parser.add_argument("--runs", type=int, default=20, help="Chamadas por estratégia/entrada (padrão: 20)")
+    parser.add_argument("--latency", default="meudanfe=100,sefaz=250,api=60",
+                        help="Latência do servidor local em ms, total ou por serviço")
+    parser.add_argument("--error-rate", default="0", help="Fração de 503 do servidor local")
+    parser.add_argument("--items", type=int, default=10, help="Itens do XML servido (padrão: 10)")
+    parser.add_argument("--page-kb", type=int, default=40, help="Tamanho das páginas HTML (padrão: 40)")
+    parser.add_argument("--extractor-seconds", type=float, default=0.5,
+                        help="Tempo mínimo por medição de extrator (padrão: 0.5)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Processos por módulo (padrão: 5)")
+    parser.add_argument("--uf", default="35", help="cUF das chaves geradas (padrão: 35, SP)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Grava o JSON também neste arquivo")
+    parser.add_argument("--verbose", action="store_true", help="Mantém os prints dos buscadores")
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.sections.split(',') if s.strip()]
+    unknown = [s for s in sections if s not in SECTIONS]
+    if unknown:
+        parser.error(f"seções desconhecidas: {', '.join(unknown)}")
+
+    # Antes de importar os buscadores: cache e estatísticas isolados
+    workdir = tempfile.mkdtemp(prefix="nfe-bench-")
+    os.environ["NFE_XML_CACHE_DIR"] = os.path.join(workdir, "xml_cache")
+    os.environ["NFE_STRATEGY_STATS_DB"] = os.path.join(workdir, "strategy_stats.db")
+    os.environ.setdefault("NFE_LEARNED_SELECTORS", os.path.join(workdir, "learned_selectors.json"))
+    # Sem disjuntor nem cache negativo: um 503 injetado não pode encurtar as
+    # chamadas seguintes e distorcer latência e taxa de sucesso
+    os.environ["NFE_BREAKER_FAILURES"] = "0"
+    for failure_class in ("INVALID_KEY", "NOT_FOUND", "SOURCE_DOWN"):
+        os.environ[f"NFE_NEGATIVE_TTL_{failure_class}"] = "0"
+
+    import nfe_endpoints
+    import circuit_breaker
+    from nfe_fake_server import start_server
+
+    circuit_breaker.reset()
+
+    server = start_server(latency=args.latency, error_rate=args.error_rate, items=args.items,
+                          page_kb=args.page_kb, seed=args.seed)
+    nfe_endpoints.configure(base=server.base_url)
+
+    # Os buscadores imprimem o andamento; o stdout fica só para o JSON
+    report_stream = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    report = {
+        "python": platform.python_version(),
+        "settings": server.settings.to_dict(),
+        "runs": args.runs,
+        "uf": args.uf,
+    }
+    try:
+        if 'strategies' in sections:
+            report["strategies"] = bench_strategies(args.runs, args.seed, args.uf)
+        if 'entry_points' in sections:
+            report["entry_points"] = bench_entry_points(args.runs, args.seed, args.uf)
+        if 'extractors' in sections:
+            report["extractors"] = bench_extractors(args.items, args.page_kb, args.extractor_seconds)
+        if 'startup' in sections:
+            report["startup"] = bench_startup(args.startup_runs)
+        report["server_hits"] = dict(server.hits)
+    finally:
+        server.shutdown()
+        if sys.stdout is not report_stream:
+            sys.stdout.close()
+            sys.stdout = report_stream
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
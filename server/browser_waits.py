@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Esperas por condição para os fluxos Selenium (no lugar de time.sleep fixo)
+Cada espera termina assim que a condição é satisfeita (elemento presente,
+valor digitado, documento pronto, rede ociosa, resultado da busca, download
+iniciado) ou quando o prazo vence, sem levantar exceção: o chamador recebe o
+valor da condição ou None e segue o fluxo que já tinha.
+
+As condições por XPath avaliam a lista inteira num único execute_script por
+volta: find_elements esperaria o implicitly_wait do driver (5-10 s nos
+fluxos RPA) em cada XPath sem resultado.
+
+Uso:
+    wait_for_value(input_element, chave)
+    before = search_state(driver)
+    search_button.click()
+    wait_for_search_result(driver, before)
+    wait_until(driver, network_idle(), timeout=5)
+"""
+
+import os
+import time
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import (
+    TimeoutException, NoSuchElementException, StaleElementReferenceException
+)
+
+DEFAULT_TIMEOUT = float(os.environ.get("NFE_BROWSER_WAIT_TIMEOUT", "15"))
+POLL_INTERVAL = float(os.environ.get("NFE_BROWSER_WAIT_POLL", "0.1"))
+
+# Indicadores de que a busca terminou: link/botão do XML, XML na página ou erro.
+# Os genéricos ("XML", "Baixar", "erro") já podem casar no formulário, por isso
+# só contam os que surgem depois do clique (ver search_state)
+SEARCH_RESULT_XPATHS = [
+    "//a[contains(@href, '.xml')]",
+    "//a[contains(text(), 'XML') or contains(text(), 'Baixar')]",
+    "//button[contains(text(), 'XML') or contains(text(), 'Baixar')]",
+    "//*[contains(text(), '<?xml')]",
+    "//*[contains(text(), 'Erro') or contains(text(), 'erro') or contains(text(), 'não encontrada') or contains(text(), 'inválida')]",
+]
+
+# Elementos que casam com os XPaths, na ordem da lista (só os visíveis se pedido)
+XPATH_NODES_SCRIPT = """
+const xpaths = arguments[0];
+const requireVisible = arguments[1];
+const nodes = [];
+for (const xpath of xpaths) {
+    let found;
+    try {
+        found = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    } catch (e) {
+        continue;
+    }
+    for (let i = 0; i < found.snapshotLength; i++) {
+        const node = found.snapshotItem(i);
+        if (node.nodeType !== 1) continue;
+        if (requireVisible && !(node.offsetWidth || node.offsetHeight || node.getClientRects().length)) continue;
+        nodes.push(node);
+    }
+}
+return nodes;
+"""
+
+
+def find_by_xpaths(driver, xpaths, visible=True):
+    """Elementos dos XPaths numa única consulta ao navegador (sem implicitly_wait)"""
+    return driver.execute_script(XPATH_NODES_SCRIPT, list(xpaths), visible) or []
+
+
+def wait_until(driver, condition, timeout=DEFAULT_TIMEOUT, poll=POLL_INTERVAL):
+    """
+    Espera condition(driver) ser verdadeira
+
+    Returns:
+        O valor da condição, ou None se o prazo vencer
+    """
+    try:
+        return WebDriverWait(
+            driver, timeout, poll_frequency=poll,
+            ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)
+        ).until(condition)
+    except TimeoutException:
+        return None
+
+
+def any_of(*conditions):
+    """Primeira condição verdadeira"""
+    def check(driver):
+        for condition in conditions:
+            result = condition(driver)
+            if result:
+                return result
+        return False
+    return check
+
+
+def element_present(*xpaths):
+    """Primeiro elemento visível encontrado entre os XPaths"""
+    def check(driver):
+        found = find_by_xpaths(driver, xpaths)
+        return found[0] if found else False
+    return check
+
+
+def document_ready(driver):
+    """DOM carregado (readyState interactive ou complete)"""
+    return driver.execute_script("return document.readyState") in ("interactive", "complete")
+
+
+def new_element_present(seen, *xpaths):
+    """Primeiro elemento visível entre os XPaths que não estava em `seen` (ids)"""
+    def check(driver):
+        for element in find_by_xpaths(driver, xpaths):
+            if element.id not in seen:
+                return element
+        return False
+    return check
+
+
+def url_changed(previous_url):
+    def check(driver):
+        return driver.current_url != previous_url and driver.current_url
+    return check
+
+
+def network_idle(idle_seconds=0.5):
+    """
+    Rede ociosa: nenhum recurso novo carregado por `idle_seconds`
+    (contagem de performance.getEntriesByType('resource') estável)
+    """
+    state = {"count": -1, "since": time.monotonic()}
+
+    def check(driver):
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != state["count"]:
+            state["count"] = count
+            state["since"] = now
+            return False
+        return now - state["since"] >= idle_seconds
+    return check
+
+
+def download_started(directory):
+    """Algum arquivo (inclusive .crdownload) apareceu no diretório de download"""
+    existing = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+
+    def check(driver):
+        try:
+            return bool(set(os.listdir(directory)) - existing)
+        except OSError:
+            return False
+    return check
+
+
+def wait_for_value(element, value, timeout=2):
+    """Espera o campo refletir o valor digitado (substitui a pausa após send_keys)"""
+    def check(_):
+        return element.get_attribute('value') == value
+    return wait_until(element.parent, check, timeout=timeout)
+
+
+def search_state(driver):
+    """
+    Estado da página logo antes de submeter a busca: (URL, ids dos
+    indicadores de resultado já presentes). Capturar antes do clique.
+    """
+    seen = frozenset(element.id for element in find_by_xpaths(driver, SEARCH_RESULT_XPATHS, visible=False))
+    return driver.current_url, seen
+
+
+def wait_for_search_result(driver, before, timeout=DEFAULT_TIMEOUT):
+    """
+    Espera a página de resultado da busca (XML, link de download ou erro)
+
+    Args:
+        before: search_state(driver) capturado antes do clique; só contam
+            uma URL nova ou indicadores que não estavam no formulário
+
+    Returns:
+        O elemento indicador (ou a nova URL), ou None se o prazo vencer
+    """
+    previous_url, seen = before
+    return wait_until(
+        driver,
+        any_of(new_element_present(seen, *SEARCH_RESULT_XPATHS), url_changed(previous_url)),
+        timeout=timeout
+    )
+
+
+def wait_for_page(driver, *xpaths, timeout=DEFAULT_TIMEOUT):
+    """Espera o DOM ficar pronto e, se informado, um dos elementos do formulário"""
+    if not xpaths:
+        return wait_until(driver, document_ready, timeout=timeout)
+    return wait_until(driver, element_present(*xpaths), timeout=timeout)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Captura de downloads de XML em memória via Chrome DevTools Protocol
+Abre uma conexão DevTools própria com a aba do driver (o chromedriver expõe
+o endereço em goog:chromeOptions.debuggerAddress), habilita o domínio Fetch
+em estágio de resposta e, quando a resposta do "Baixar XML" passa, lê o corpo
+com Fetch.getResponseBody e o entrega ao chamador. Downloads (Content-
+Disposition: attachment) capturados são abortados, então nada é gravado em
+disco; demais respostas seguem normalmente.
+
+O Selenium não entrega eventos CDP pelo execute_cdp_cmd, por isso a conexão
+usa o websocket-client (dependência do próprio Selenium). Quando a captura
+não estiver disponível (NFE_DOWNLOAD_CAPTURE=disk, driver remoto, Chrome sem
+porta de depuração), DownloadCapture levanta CaptureUnavailable e o chamador
+volta a esperar o arquivo com download_watcher.
+
+Uso:
+    xml_content = click_and_capture(driver, download_button.click, invoice_key, download_dir)
+
+    with DownloadCapture(driver, invoice_key) as capture:
+        download_button.click()
+        xml_bytes = capture.wait(30)
+"""
+
+import os
+import json
+import queue
+import base64
+import threading
+import itertools
+from urllib.request import urlopen
+
+from download_watcher import wait_for_file
+from fetch_metrics import span
+from xml_stream_extractor import xml_text
+
+CAPTURE_MODE = os.environ.get("NFE_DOWNLOAD_CAPTURE", "cdp")
+COMMAND_TIMEOUT = 10
+
+
+class CaptureUnavailable(Exception):
+    """Não é possível abrir uma sessão DevTools para este driver"""
+
+
+def _header(headers, name):
+    name = name.lower()
+    for header in headers or []:
+        if header.get('name', '').lower() == name:
+            return header.get('value', '')
+    return ''
+
+
+def is_xml_response(event):
+    """A resposta pausada pode ser o XML (content-type, anexo ou URL)?"""
+    if event.get('responseStatusCode', 0) != 200:
+        return False
+    headers = event.get('responseHeaders')
+    content_type = _header(headers, 'content-type').lower()
+    disposition = _header(headers, 'content-disposition').lower()
+    url = event.get('request', {}).get('url', '').lower().split('?')[0]
+    return 'xml' in content_type or 'attachment' in disposition or url.endswith('.xml')
+
+
+def is_attachment(event):
+    return 'attachment' in _header(event.get('responseHeaders'), 'content-disposition').lower()
+
+
+class DevToolsConnection:
+    """Conexão websocket com um alvo DevTools (comandos síncronos + fila de eventos)"""
+
+    def __init__(self, ws_url):
+        try:
+            import websocket
+        except ImportError as e:
+            raise CaptureUnavailable(f"websocket-client indisponível: {e}")
+        try:
+            self.ws = websocket.create_connection(ws_url, timeout=COMMAND_TIMEOUT, suppress_origin=True)
+        except Exception as e:
+            raise CaptureUnavailable(f"Falha ao conectar no DevTools: {e}")
+        self.ws.settimeout(None)
+        self.events = queue.Queue()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        while not self._closed:
+            try:
+                message = json.loads(self.ws.recv())
+            except Exception:
+                break
+            if 'id' in message:
+                waiter = self._pending.pop(message['id'], None)
+                if waiter is not None:
+                    waiter.put(message)
+            elif 'method' in message:
+                self.events.put(message)
+        self.events.put(None)
+        for waiter in list(self._pending.values()):
+            waiter.put({'error': {'message': 'Conexão DevTools encerrada'}})
+
+    def send(self, method, params=None):
+        """Envia um comando e espera o resultado"""
+        command_id = next(self._ids)
+        waiter = queue.Queue(maxsize=1)
+        self._pending[command_id] = waiter
+        with self._send_lock:
+            self.ws.send(json.dumps({'id': command_id, 'method': method, 'params': params or {}}))
+        try:
+            response = waiter.get(timeout=COMMAND_TIMEOUT)
+        except queue.Empty:
+            self._pending.pop(command_id, None)
+            raise RuntimeError(f"Timeout no comando DevTools {method}")
+        if 'error' in response:
+            raise RuntimeError(f"{method}: {response['error'].get('message')}")
+        return response.get('result', {})
+
+    def close(self):
+        self._closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+def page_websocket_url(driver):
+    """URL do websocket DevTools da aba atual do driver"""
+    options = (getattr(driver, 'capabilities', None) or {}).get('goog:chromeOptions') or {}
+    address = options.get('debuggerAddress')
+    if not address:
+        raise CaptureUnavailable("Driver sem debuggerAddress")
+
+    try:
+        with urlopen(f"http://{address}/json/list", timeout=5) as response:
+            targets = json.loads(response.read().decode('utf-8'))
+    except Exception as e:
+        raise CaptureUnavailable(f"Falha ao listar alvos DevTools: {e}")
+
+    # No chromedriver, o handle da janela é o id do alvo DevTools
+    handle = driver.current_window_handle
+    for target in targets:
+        if target.get('id') == handle and target.get('webSocketDebuggerUrl'):
+            return target['webSocketDebuggerUrl']
+    for target in targets:
+        if target.get('type') == 'page' and target.get('webSocketDebuggerUrl'):
+            return target['webSocketDebuggerUrl']
+    raise CaptureUnavailable("Aba atual não encontrada no DevTools")
+
+
+class DownloadCapture:
+    """Intercepta a resposta XML da aba do driver enquanto o bloco `with` estiver ativo"""
+
+    def __init__(self, driver, invoice_key=None):
+        if CAPTURE_MODE != "cdp":
+            raise CaptureUnavailable("Captura CDP desativada (NFE_DOWNLOAD_CAPTURE)")
+        self.driver = driver
+        self.invoice_key = invoice_key
+        self.connection = None
+        self._result = queue.Queue(maxsize=1)
+
+    def __enter__(self):
+        self.connection = DevToolsConnection(page_websocket_url(self.driver))
+        try:
+            self.connection.send('Fetch.enable', {'patterns': [
+                {'urlPattern': '*', 'resourceType': resource_type, 'requestStage': 'Response'}
+                for resource_type in ('Document', 'XHR', 'Fetch', 'Other')
+            ]})
+        except Exception as e:
+            self.connection.close()
+            raise CaptureUnavailable(f"Fetch.enable falhou: {e}")
+        threading.Thread(target=self._handle_events, daemon=True).start()
+        return self
+
+    def _handle_events(self):
+        while True:
+            event = self.connection.events.get()
+            if event is None:
+                return
+            if event.get('method') != 'Fetch.requestPaused':
+                continue
+            params = event.get('params', {})
+            try:
+                self._handle_paused(params)
+            except Exception as e:
+                print(f"Erro ao processar resposta interceptada: {e}")
+                try:
+                    self.connection.send('Fetch.continueRequest', {'requestId': params.get('requestId')})
+                except Exception:
+                    pass
+
+    def _handle_paused(self, params):
+        request_id = params['requestId']
+        if self._result.full() or not is_xml_response(params):
+            self.connection.send('Fetch.continueRequest', {'requestId': request_id})
+            return
+
+        body = self.connection.send('Fetch.getResponseBody', {'requestId': request_id})
+        data = body.get('body', '')
+        data = base64.b64decode(data) if body.get('base64Encoded') else data.encode('utf-8')
+
+        if self.invoice_key and self.invoice_key.encode('ascii') not in data:
+            self.connection.send('Fetch.continueRequest', {'requestId': request_id})
+            return
+
+        try:
+            self._result.put_nowait(data)
+        except queue.Full:
+            pass
+
+        if is_attachment(params):
+            # Já temos os bytes: cancela o download para não gravar em disco
+            self.connection.send('Fetch.failRequest', {'requestId': request_id, 'errorReason': 'Aborted'})
+        else:
+            self.connection.send('Fetch.continueRequest', {'requestId': request_id})
+
+    def wait(self, timeout=30):
+        """Bytes do XML capturado, ou None se nada chegou no prazo"""
+        with span("download_wait", source="cdp", chave=self.invoice_key) as current:
+            try:
+                return self._result.get(timeout=timeout)
+            except queue.Empty:
+                current.set(status="timeout")
+                return None
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.connection.send('Fetch.disable')
+        except Exception:
+            pass
+        self.connection.close()
+        return False
+
+
+def click_and_capture(driver, click, invoice_key, download_dir=None, timeout=30):
+    """
+    Executa click() e devolve o texto do XML baixado
+
+    Captura em memória via CDP; sem CDP (ou se a resposta não foi
+    interceptada) espera o arquivo em download_dir.
+
+    Returns:
+        str: conteúdo do XML, ou None se nada chegou no prazo
+    """
+    try:
+        with DownloadCapture(driver, invoice_key) as capture:
+            click()
+            data = capture.wait(timeout)
+        if data:
+            return xml_text(data)
+        fallback_timeout = 2
+    except CaptureUnavailable as e:
+        print(f"Captura CDP indisponível ({e}); aguardando arquivo")
+        click()
+        fallback_timeout = timeout
+
+    if not download_dir:
+        return None
+    path = wait_for_file(download_dir, invoice_key, timeout=fallback_timeout)
+    if not path:
+        return None
+    with open(path, 'rb') as f:
+        return xml_text(f.read())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Pool de instâncias Chrome WebDriver reutilizáveis
+Evita o cold start do Chrome a cada chave: os drivers são pré-lançados,
+emprestados por job e devolvidos com estado limpo (cookies, abas, pasta de
+download). Cada driver é reciclado após N jobs ou quando o consumo de
+memória (RSS do chromedriver + Chrome) passa do limite.
+
+Uso:
+    pool = get_pool("xml_scraper", create_driver, max_size=2)
+    with pool.driver() as driver:
+        driver.get("https://meudanfe.com.br")
+"""
+
+import os
+import time
+import shutil
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from fetch_metrics import span
+
+DEFAULT_MAX_SIZE = int(os.environ.get("CHROME_POOL_MAX_SIZE", "2"))
+DEFAULT_MAX_JOBS = int(os.environ.get("CHROME_POOL_MAX_JOBS", "50"))
+DEFAULT_MAX_RSS_MB = int(os.environ.get("CHROME_POOL_MAX_RSS_MB", "1024"))
+
+
+class PoolTimeout(Exception):
+    """Nenhum driver ficou disponível dentro do tempo limite"""
+
+
+class _PoolEntry:
+    __slots__ = ("driver", "download_dir", "jobs", "created_at")
+
+    def __init__(self, driver, download_dir):
+        self.driver = driver
+        self.download_dir = download_dir
+        self.jobs = 0
+        self.created_at = time.time()
+
+
+def process_tree(root_pid):
+    """[(pid, nome, RSS em KB)] de um processo e de todos os seus descendentes via /proc"""
+    if not root_pid or not os.path.isdir("/proc"):
+        return []
+
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # O nome do processo pode conter espaços; o ppid vem após o ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(name))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    processes = []
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        command, rss_kb = None, 0
+        try:
+            with open(f"/proc/{pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("Name:"):
+                        command = line.split(None, 1)[1].strip()
+                    elif line.startswith("VmRSS:"):
+                        rss_kb = int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+        processes.append((pid, command, rss_kb))
+
+    return processes
+
+
+def _process_tree_rss_mb(root_pid):
+    """Soma o RSS (MB) de um processo e de todos os seus descendentes"""
+    return sum(rss_kb for _, _, rss_kb in process_tree(root_pid)) / 1024.0
+
+
+class ChromeDriverPool:
+    def __init__(self, factory, max_size=DEFAULT_MAX_SIZE, max_jobs=DEFAULT_MAX_JOBS,
+                 max_rss_mb=DEFAULT_MAX_RSS_MB, download_root=None):
+        """
+        Args:
+            factory: função factory(download_dir) que cria um WebDriver configurado
+            max_size: número máximo de drivers vivos
+            max_jobs: jobs atendidos antes de reciclar o driver
+            max_rss_mb: limite de memória por driver antes de reciclar
+            download_root: pasta base onde cada driver recebe sua subpasta de download
+        """
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.download_root = download_root
+
+        self._idle = []
+        self._in_use = {}
+        self._lock = threading.Condition()
+        self._closed = False
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use)
+
+    def _launch(self):
+        """Cria um novo driver com pasta de download própria"""
+        if self.download_root:
+            os.makedirs(self.download_root, exist_ok=True)
+        download_dir = tempfile.mkdtemp(prefix="chrome_dl_", dir=self.download_root)
+
+        try:
+            with span("browser_launch"):
+                driver = self.factory(download_dir)
+        except Exception:
+            shutil.rmtree(download_dir, ignore_errors=True)
+            raise
+
+        driver.download_dir = download_dir
+        self._set_download_dir(driver, download_dir)
+        return _PoolEntry(driver, download_dir)
+
+    def _set_download_dir(self, driver, download_dir):
+        try:
+            driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+                "behavior": "allow",
+                "downloadPath": download_dir
+            })
+        except Exception:
+            pass
+
+    def _destroy(self, entry):
+        try:
+            entry.driver.quit()
+        except Exception:
+            pass
+        shutil.rmtree(entry.download_dir, ignore_errors=True)
+
+    def warm(self, count=None):
+        """Pré-lança drivers até `count` (padrão: max_size)"""
+        count = min(count or self.max_size, self.max_size)
+        while True:
+            with self._lock:
+                if self._closed or self.size >= count:
+                    return
+                # Reserva a vaga antes de lançar fora do lock
+                placeholder = object()
+                self._in_use[id(placeholder)] = placeholder
+            try:
+                entry = self._launch()
+            except Exception:
+                with self._lock:
+                    self._in_use.pop(id(placeholder), None)
+                    # A vaga voltou: quem espera em acquire() pode lançar o seu
+                    self._lock.notify()
+                raise
+            # Troca a reserva pelo driver numa só posse do lock (sem janela acima de max_size)
+            with self._lock:
+                self._in_use.pop(id(placeholder), None)
+                closed = self._closed
+                if not closed:
+                    self._idle.append(entry)
+                    self._lock.notify()
+            if closed:
+                self._destroy(entry)
+                return
+
+    def acquire(self, timeout=None):
+        """Empresta um driver; bloqueia até haver um livre ou uma vaga no pool"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Pool de drivers encerrado")
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use[id(entry.driver)] = entry
+                    return entry.driver
+                if self.size < self.max_size:
+                    placeholder = object()
+                    self._in_use[id(placeholder)] = placeholder
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout("Nenhum driver Chrome disponível no tempo limite")
+                self._lock.wait(remaining)
+
+        try:
+            entry = self._launch()
+        except Exception:
+            with self._lock:
+                self._in_use.pop(id(placeholder), None)
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._in_use.pop(id(placeholder), None)
+            self._in_use[id(entry.driver)] = entry
+        return entry.driver
+
+    def release(self, driver, discard=False):
+        """Devolve o driver ao pool, limpando o estado ou reciclando-o"""
+        with self._lock:
+            entry = self._in_use.pop(id(driver), None)
+        if entry is None:
+            # Driver não pertence ao pool: apenas encerra
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return
+
+        entry.jobs += 1
+        if not discard:
+            discard = not self._reset(entry) or self._should_recycle(entry)
+
+        if discard or self._closed:
+            self._destroy(entry)
+        else:
+            with self._lock:
+                self._idle.append(entry)
+
+        with self._lock:
+            self._lock.notify()
+
+    def _reset(self, entry):
+        """Limpa cookies, abas extras, cache e pasta de download entre jobs"""
+        driver = entry.driver
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            driver.get("about:blank")
+        except Exception:
+            return False
+
+        for name in os.listdir(entry.download_dir):
+            path = os.path.join(entry.download_dir, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        return True
+
+    def _should_recycle(self, entry):
+        if self.max_jobs and entry.jobs >= self.max_jobs:
+            return True
+        if self.max_rss_mb:
+            try:
+                pid = entry.driver.service.process.pid
+            except Exception:
+                pid = None
+            if _process_tree_rss_mb(pid) > self.max_rss_mb:
+                return True
+        return False
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Context manager: empresta um driver e devolve ao final do job"""
+        driver = self.acquire(timeout=timeout)
+        failed = False
+        try:
+            yield driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(driver, discard=failed and not _is_alive(driver))
+
+    def close_all(self):
+        """Encerra todos os drivers ociosos e marca o pool como fechado"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            in_use = [e for e in self._in_use.values() if isinstance(e, _PoolEntry)]
+            self._lock.notify_all()
+        for entry in idle + in_use:
+            self._destroy(entry)
+
+
+def _is_alive(driver):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, factory, **options):
+    """
+    Retorna o pool registrado com este nome, criando-o na primeira chamada
+
+    A fábrica (e as opções) da primeira chamada valem para o nome: fábricas
+    diferentes precisam de nomes diferentes.
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ChromeDriverPool(factory, **options)
+            _pools[name] = pool
+        return pool
+
+
+def release_driver(driver, discard=False):
+    """Devolve o driver ao pool de origem (ou encerra se não for de um pool)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        if id(driver) in pool._in_use:
+            pool.release(driver, discard=discard)
+            return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+@atexit.register
+def close_all_pools():
+    """Garante que nenhum Chrome fique órfão quando o processo termina"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -1,40 +1,17 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
-
-def get_uf_from_key(invoice_key):
-    """Extract UF from NFe key"""
-    uf_map = {
-        '35': 'SP', '33': 'RJ', '31': 'MG', '43': 'RS', '41': 'PR', '42': 'SC',
-        '29': 'BA', '23': 'CE', '52': 'GO', '21': 'MA', '51': 'MT', '50': 'MS',
-        '32': 'ES', '26': 'PE', '22': 'PI', '24': 'RN', '28': 'SE', '27': 'AL',
-        '25': 'PB', '17': 'TO', '15': 'PA', '16': 'AP', '11': 'RO', '12': 'AC',
-        '13': 'AM', '14': 'RR', '53': 'DF'
-    }
-    return uf_map.get(invoice_key[:2], 'SP')
+from http_session import create_session
+from xml_stream_extractor import extract_xml
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
 def simulate_chrome_rpa(invoice_key):
     """Simulate Chrome RPA automation for NFe consultation"""
     
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        'Connection': 'keep-alive'
-    })
+    session = create_session("browser")
     
     uf = get_uf_from_key(invoice_key)
     
@@ -64,17 +41,15 @@ def simulate_chrome_rpa(invoice_key):
                     for endpoint in form_endpoints:
                         try:
                             form_response = session.post(url + endpoint, data=form_data, timeout=8)
-                            if form_response.status_code == 200 and invoice_key in form_response.text:
-                                if check_for_xml_content(form_response.text, invoice_key):
-                                    return extract_xml_from_content(form_response.text, invoice_key)
+                            if form_response.status_code == 200 and check_for_xml_content(form_response.content, invoice_key):
+                                return extract_xml_from_content(form_response.content, invoice_key)
                         except:
                             continue
             else:
                 # Direct URL access
                 response = session.get(url, timeout=10)
-                if response.status_code == 200 and invoice_key in response.text:
-                    if check_for_xml_content(response.text, invoice_key):
-                        return extract_xml_from_content(response.text, invoice_key)
+                if response.status_code == 200 and check_for_xml_content(response.content, invoice_key):
+                    return extract_xml_from_content(response.content, invoice_key)
         
         except Exception as e:
             print(f"Erro ao acessar {url}: {e}")
@@ -95,17 +70,16 @@ def simulate_chrome_rpa(invoice_key):
             response = session.get(portal, timeout=12)
             if response.status_code == 200:
                 # Look for viewstate and form fields
-                viewstate_match = re.search(r'name="__VIEWSTATE" value="([^"]*)"', response.text)
+                viewstate_match = re.search(rb'name="__VIEWSTATE" value="([^"]*)"', response.content)
                 
                 form_data = {'chNFe': invoice_key, 'chave': invoice_key}
                 if viewstate_match:
-                    form_data['__VIEWSTATE'] = viewstate_match.group(1)
+                    form_data['__VIEWSTATE'] = viewstate_match.group(1).decode('ascii')
                 
                 # Submit consultation form
                 submit_response = session.post(portal, data=form_data, timeout=15)
-                if submit_response.status_code == 200 and invoice_key in submit_response.text:
-                    if check_for_xml_content(submit_response.text, invoice_key):
-                        return extract_xml_from_content(submit_response.text, invoice_key)
+                if submit_response.status_code == 200 and check_for_xml_content(submit_response.content, invoice_key):
+                    return extract_xml_from_content(submit_response.content, invoice_key)
         
         except Exception as e:
             print(f"Erro no portal {portal}: {e}")
@@ -155,28 +129,22 @@ esta nota fiscal específica disponível para consulta pública.
         ]
     }
 
-def check_for_xml_content(html_content, invoice_key):
-    """Check if HTML content contains valid NFe XML"""
-    return (invoice_key in html_content and 
-            '<?xml' in html_content and 
-            ('nfeProc' in html_content or 'NFe' in html_content))
+def check_for_xml_content(body, invoice_key):
+    """Check if the raw response body (bytes) contains valid NFe XML"""
+    return (invoice_key.encode('ascii') in body and 
+            b'<?xml' in body and 
+            (b'nfeProc' in body or b'NFe' in body))
 
-def extract_xml_from_content(html_content, invoice_key):
-    """Extract XML from HTML content"""
+def extract_xml_from_content(body, invoice_key):
+    """Extract XML from the raw response body, decoding only the document"""
     try:
-        xml_start = html_content.find('<?xml')
-        xml_end = html_content.find('</nfeProc>', xml_start)
-        if xml_end == -1:
-            xml_end = html_content.find('</NFe>', xml_start)
-        
-        if xml_end != -1:
-            xml_content = html_content[xml_start:xml_end + 10]
-            if len(xml_content) > 1000 and invoice_key in xml_content:
-                return {
-                    "success": True,
-                    "xml_content": xml_content,
-                    "message": "XML extraído com sucesso via RPA Chrome"
-                }
+        xml_content = extract_xml(body, invoice_key, min_length=1000)
+        if xml_content:
+            return {
+                "success": True,
+                "xml_content": xml_content,
+                "message": "XML extraído com sucesso via RPA Chrome"
+            }
     except Exception as e:
         print(f"Erro ao extrair XML: {e}")
     
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
 import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -12,14 +11,10 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+from cdp_download_capture import click_and_capture
+from browser_waits import wait_for_value, wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import validate_nfe_key
 
 def setup_chrome_for_rpa():
     """Setup Chrome specifically optimized for RPA"""
@@ -75,13 +70,8 @@ def perform_meudanfe_automation(driver, invoice_key):
         print(f"Navegando para meudanfe.com.br com chave: {invoice_key}")
         
         driver.get("https://meudanfe.com.br")
-        wait = WebDriverWait(driver, 20)
-        
-        # Wait for page load
-        time.sleep(3)
         
-        # Find search input field
-        search_input = None
+        # Wait for the search input field
         search_selectors = [
             "input[placeholder*='chave' i]",
             "input[placeholder*='nota' i]", 
@@ -91,30 +81,17 @@ def perform_meudanfe_automation(driver, invoice_key):
             "input[type='search']"
         ]
         
-        for selector in search_selectors:
-            try:
-                elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                for element in elements:
-                    if element.is_displayed() and element.is_enabled():
-                        search_input = element
-                        print(f"Campo encontrado: {selector}")
-                        break
-                if search_input:
-                    break
-            except Exception:
-                continue
+        search_input = find_first(driver, "input", search_selectors, timeout=20, enabled=True)
         
         if not search_input:
             return {"success": False, "error": "Campo de busca não encontrado"}
         
         # Enter the invoice key
         search_input.clear()
-        time.sleep(1)
         search_input.send_keys(invoice_key)
-        time.sleep(1)
+        wait_for_value(search_input, invoice_key)
         
-        # Find and click search button
-        search_button = None
+        # Find and click search button (CSS first, then text-based buttons)
         button_selectors = [
             "button[type='submit']",
             "input[type='submit']",
@@ -122,35 +99,13 @@ def perform_meudanfe_automation(driver, invoice_key):
             "button.btn",
             ".search-btn"
         ]
-        
-        # Also try text-based buttons
         button_texts = ["Buscar", "Consultar", "Pesquisar", "Search"]
+        button_selectors += [f"//button[contains(text(), '{text}')]" for text in button_texts]
         
-        for selector in button_selectors:
-            try:
-                buttons = driver.find_elements(By.CSS_SELECTOR, selector)
-                for button in buttons:
-                    if button.is_displayed() and button.is_enabled():
-                        search_button = button
-                        break
-                if search_button:
-                    break
-            except Exception:
-                continue
-        
-        # Try text-based button search
-        if not search_button:
-            for text in button_texts:
-                try:
-                    xpath = f"//button[contains(text(), '{text}')]"
-                    button = driver.find_element(By.XPATH, xpath)
-                    if button.is_displayed() and button.is_enabled():
-                        search_button = button
-                        break
-                except Exception:
-                    continue
+        search_button = find_first(driver, "search", button_selectors, enabled=True)
         
         # Submit search
+        before = search_state(driver)
         if search_button:
             try:
                 driver.execute_script("arguments[0].click();", search_button)
@@ -160,10 +115,9 @@ def perform_meudanfe_automation(driver, invoice_key):
             search_input.send_keys(Keys.RETURN)
         
         # Wait for results
-        time.sleep(5)
+        wait_for_search_result(driver, before)
         
-        # Look for XML download options
-        download_found = False
+        # Look for XML download options (CSS first, then text-based links)
         download_selectors = [
             "a[href*='.xml']",
             "a[href*='xml']",
@@ -171,37 +125,23 @@ def perform_meudanfe_automation(driver, invoice_key):
         ]
         
         download_texts = ["Download", "XML", "Baixar"]
-        
-        # Check CSS selectors
-        for selector in download_selectors:
-            try:
-                links = driver.find_elements(By.CSS_SELECTOR, selector)
-                for link in links:
-                    if link.is_displayed():
-                        driver.execute_script("arguments[0].click();", link)
-                        download_found = True
-                        break
-                if download_found:
-                    break
-            except Exception:
-                continue
-        
-        # Check text-based links
-        if not download_found:
-            for text in download_texts:
-                try:
-                    xpath = f"//a[contains(text(), '{text}')]"
-                    link = driver.find_element(By.XPATH, xpath)
-                    if link.is_displayed():
-                        driver.execute_script("arguments[0].click();", link)
-                        download_found = True
-                        break
-                except Exception:
-                    continue
-        
-        if download_found:
-            time.sleep(3)
-            return check_download_result(invoice_key)
+        download_selectors += [f"//a[contains(text(), '{text}')]" for text in download_texts]
+        
+        download_link = find_first(driver, "download", download_selectors)
+        
+        if download_link:
+            # Capture the XML in memory (CDP); without CDP, wait for the file on disk
+            xml_content = click_and_capture(
+                driver, lambda: driver.execute_script("arguments[0].click();", download_link),
+                invoice_key, "/tmp/nfe_downloads", timeout=13
+            )
+            if xml_content and invoice_key in xml_content:
+                return {
+                    "success": True,
+                    "xml_content": xml_content,
+                    "message": "XML baixado"
+                }
+            return {"success": False, "error": "Download não completado"}
         
         # Check page source for embedded XML
         page_source = driver.page_source
@@ -226,37 +166,6 @@ def perform_meudanfe_automation(driver, invoice_key):
         print(f"Erro na automação: {e}")
         return {"success": False, "error": f"Erro na automação: {str(e)}"}
 
-def check_download_result(invoice_key):
-    """Check if XML was downloaded successfully"""
-    download_dir = "/tmp/nfe_downloads"
-    
-    try:
-        for i in range(10):
-            if os.path.exists(download_dir):
-                files = os.listdir(download_dir)
-                xml_files = [f for f in files if f.endswith('.xml')]
-                
-                if xml_files:
-                    latest_file = max([os.path.join(download_dir, f) for f in xml_files], 
-                                    key=os.path.getctime)
-                    
-                    with open(latest_file, 'r', encoding='utf-8') as f:
-                        xml_content = f.read()
-                    
-                    if invoice_key in xml_content:
-                        return {
-                            "success": True,
-                            "xml_content": xml_content,
-                            "message": f"XML baixado: {os.path.basename(latest_file)}"
-                        }
-            
-            time.sleep(1)
-        
-        return {"success": False, "error": "Download não completado"}
-        
-    except Exception as e:
-        return {"success": False, "error": f"Erro no download: {str(e)}"}
-
 def execute_chrome_rpa(invoice_key):
     """Main RPA execution function"""
     
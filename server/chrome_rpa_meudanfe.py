@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
 import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -12,14 +11,10 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+from download_watcher import wait_for_file
+from browser_waits import wait_for_value, wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import validate_nfe_key
 
 def setup_chrome_for_rpa():
     """Setup Chrome specifically for meudanfe.com.br RPA"""
@@ -88,17 +83,11 @@ def access_meudanfe_and_search(driver, invoice_key):
         # Navigate to meudanfe.com.br
         driver.get("https://meudanfe.com.br")
         
-        # Wait for page to load completely
-        wait = WebDriverWait(driver, 20)
-        
         # Take screenshot for debugging
         driver.save_screenshot("/tmp/meudanfe_initial.png")
         print("Screenshot inicial salva em /tmp/meudanfe_initial.png")
         
-        # Wait a bit for any dynamic content to load
-        time.sleep(3)
-        
-        # Look for search input field - try multiple selectors
+        # Look for search input field - try multiple selectors in one probe
         search_selectors = [
             "input[placeholder*='chave']",
             "input[placeholder*='CHAVE']", 
@@ -116,15 +105,7 @@ def access_meudanfe_and_search(driver, invoice_key):
             ".form-control"
         ]
         
-        search_input = None
-        for selector in search_selectors:
-            try:
-                search_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                if search_input.is_displayed() and search_input.is_enabled():
-                    print(f"Campo de busca encontrado: {selector}")
-                    break
-            except TimeoutException:
-                continue
+        search_input = find_first(driver, "input", search_selectors, timeout=20, enabled=True)
         
         if not search_input:
             # Try finding any visible text input
@@ -141,9 +122,8 @@ def access_meudanfe_and_search(driver, invoice_key):
         
         # Clear and enter the invoice key
         search_input.clear()
-        time.sleep(1)
         search_input.send_keys(invoice_key)
-        time.sleep(1)
+        wait_for_value(search_input, invoice_key)
         
         print(f"Chave inserida: {invoice_key}")
         
@@ -161,24 +141,10 @@ def access_meudanfe_and_search(driver, invoice_key):
             "button.btn"
         ]
         
-        search_button = None
-        for selector in button_selectors:
-            try:
-                if ":contains" in selector:
-                    # Use XPath for text-based selection
-                    text_to_find = selector.split("'")[1]
-                    xpath_selector = f"//button[contains(text(), '{text_to_find}')]"
-                    search_button = driver.find_element(By.XPATH, xpath_selector)
-                else:
-                    search_button = driver.find_element(By.CSS_SELECTOR, selector)
-                
-                if search_button.is_displayed() and search_button.is_enabled():
-                    print(f"Botão de busca encontrado: {selector}")
-                    break
-            except:
-                continue
+        search_button = find_first(driver, "search", button_selectors, enabled=True)
         
         # Submit the search
+        before = search_state(driver)
         if search_button:
             try:
                 driver.execute_script("arguments[0].click();", search_button)
@@ -192,7 +158,7 @@ def access_meudanfe_and_search(driver, invoice_key):
             print("Busca submetida via Enter")
         
         # Wait for results
-        time.sleep(5)
+        wait_for_search_result(driver, before)
         driver.save_screenshot("/tmp/meudanfe_results.png")
         
         # Look for XML download links or content
@@ -209,28 +175,13 @@ def access_meudanfe_and_search(driver, invoice_key):
             ".xml-link"
         ]
         
-        download_element = None
-        for selector in download_selectors:
-            try:
-                if ":contains" in selector:
-                    text_to_find = selector.split("'")[1]
-                    xpath_selector = f"//a[contains(text(), '{text_to_find}')]"
-                    download_element = driver.find_element(By.XPATH, xpath_selector)
-                else:
-                    download_element = driver.find_element(By.CSS_SELECTOR, selector)
-                
-                if download_element.is_displayed():
-                    print(f"Link de download encontrado: {selector}")
-                    break
-            except:
-                continue
+        download_element = find_first(driver, "download", download_selectors)
         
         if download_element:
             # Click download
             try:
                 driver.execute_script("arguments[0].click();", download_element)
                 print("Download iniciado")
-                time.sleep(3)
                 
                 # Check for downloaded file
                 return check_downloaded_xml(invoice_key)
@@ -278,29 +229,17 @@ def check_downloaded_xml(invoice_key):
     download_dir = "/tmp/nfe_downloads"
     
     try:
-        # Wait for download
-        for i in range(10):  # Wait up to 10 seconds
-            if os.path.exists(download_dir):
-                files = os.listdir(download_dir)
-                xml_files = [f for f in files if f.endswith('.xml')]
-                
-                if xml_files:
-                    # Read the most recent XML file
-                    latest_file = max([os.path.join(download_dir, f) for f in xml_files], 
-                                    key=os.path.getctime)
-                    
-                    with open(latest_file, 'r', encoding='utf-8') as f:
-                        xml_content = f.read()
-                    
-                    # Verify it contains our invoice key
-                    if invoice_key in xml_content:
-                        return {
-                            "success": True,
-                            "xml_content": xml_content,
-                            "message": f"XML baixado do meudanfe.com.br: {os.path.basename(latest_file)}"
-                        }
+        # Wait up to 10 seconds for the finished file (event-driven, no polling)
+        xml_file = wait_for_file(download_dir, invoice_key, timeout=10)
+        if xml_file:
+            with open(xml_file, 'r', encoding='utf-8') as f:
+                xml_content = f.read()
             
-            time.sleep(1)
+            return {
+                "success": True,
+                "xml_content": xml_content,
+                "message": f"XML baixado do meudanfe.com.br: {os.path.basename(xml_file)}"
+            }
         
         return {"success": False, "error": "XML não foi baixado ou não contém a chave correta"}
         
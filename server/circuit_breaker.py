@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker por host para SEFAZ, portais e APIs de terceiros
+Um host que falha (erro de rede, timeout ou HTTP 5xx) NFE_BREAKER_FAILURES
+vezes seguidas tem o circuito aberto: novas requisições são recusadas na hora
+em vez de esperar o timeout inteiro. Após NFE_BREAKER_RESET segundos o
+circuito fica meio-aberto e deixa passar uma única sonda; se ela responder,
+o circuito fecha, senão abre de novo.
+
+Os disjuntores ficam num registro do processo, compartilhados entre as
+buscas concorrentes do worker residente e do lote. NFE_BREAKER_FAILURES=0
+desliga o disjuntor (ex.: benchmarks com falhas injetadas).
+
+Uso:
+    response = guarded_request(session, "GET", url, timeout=15)
+    reset()     # esquece o estado de todos os hosts
+"""
+
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+FAILURE_THRESHOLD = int(os.environ.get("NFE_BREAKER_FAILURES", "3"))
+RESET_TIMEOUT = float(os.environ.get("NFE_BREAKER_RESET", "60"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Requisição recusada porque o circuito do host está aberto"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True se a requisição pode seguir (no meio-aberto, só uma sonda por vez)"""
+        with self._lock:
+            if self.state == CLOSED or self.failure_threshold <= 0:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Circuito fechado para {self.name}")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failure_threshold <= 0:
+                return
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state == HALF_OPEN:
+                    print(f"Sonda falhou; circuito reaberto para {self.name}")
+                elif self.state != OPEN:
+                    print(f"Circuito aberto para {self.name} após {self.failures} falhas seguidas")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Libera a sonda do meio-aberto sem contar sucesso nem falha (erro fora da rede)"""
+        with self._lock:
+            self._probing = False
+
+    def remaining_open(self):
+        """Segundos até a próxima sonda (0 se não estiver aberto)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def breaker_for(url):
+    """Disjuntor compartilhado do host da URL"""
+    host = urlsplit(url).netloc.lower()
+    with _registry_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def reset():
+    """Descarta todos os disjuntores (circuitos voltam fechados)"""
+    with _registry_lock:
+        _breakers.clear()
+
+
+def guarded_request(session, method, url, **kwargs):
+    """
+    Executa session.request passando pelo disjuntor do host
+
+    Raises:
+        CircuitOpenError: se o circuito do host estiver aberto
+        requests.exceptions.RequestException: erros de rede (contam como falha)
+    """
+    breaker = breaker_for(url)
+    if not breaker.allow():
+        raise CircuitOpenError(
+            f"Circuito aberto para {breaker.name} (nova tentativa em {breaker.remaining_open():.0f}s)"
+        )
+
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Não diz nada sobre o host, mas a sonda não pode ficar presa
+        breaker.release_probe()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Teste de carga que simula a rajada de leituras de chaves numa doca
+Um caminhão inteiro de notas é bipado em poucos minutos; no pico, as
+requisições chegam enquanto as anteriores ainda estão no navegador. Este
+gerador sobe o mesmo worker residente que a rota /api/xml/fetch-from-
+meudanfe usa (xml_fetch_worker.py --workers N --warm, protocolo JSON-lines
+do xml-fetch-worker.ts) e envia N chaves com chegadas uniformes, Poisson ou
+todas de uma vez, com o mesmo timeout por requisição da rota (60 s).
+
+Relata vazão, latência, espera na fila do worker (campo "timing" da
+resposta), timeouts e, ao longo do tempo, requisições em andamento,
+processos Chrome/chromedriver e memória (RSS) do worker e dos navegadores.
+O worker herda o ambiente (NFE_*, CHROME_POOL_*).
+
+Uso:
+    python3 dock_load_test.py --keys 35 --duration 180 --workers 2
+    python3 dock_load_test.py --keys-file chaves.txt --arrival burst --workers 4 --output doca.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+
+from benchmark_suite import percentiles, fresh_keys
+from chrome_driver_pool import process_tree
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKER_SCRIPT = os.path.join(HERE, "xml_fetch_worker.py")
+ROUTE_TIMEOUT = 60.0          # xmlFetchWorker.fetch(chave, 60000) em logistics-routes.ts
+ARRIVALS = ('uniform', 'poisson', 'burst')
+
+
+def arrival_offsets(count, duration, arrival, seed=0):
+    """Segundos, a partir do início, em que cada chave é bipada"""
+    if arrival == 'burst' or count <= 1 or duration <= 0:
+        return [0.0] * count
+    if arrival == 'uniform':
+        step = duration / count
+        return [i * step for i in range(count)]
+    rng = random.Random(seed)
+    offsets, now = [], 0.0
+    for _ in range(count):
+        offsets.append(now)
+        now += rng.expovariate(count / duration)
+    return offsets
+
+
+def is_chrome(command):
+    return bool(command) and 'chrom' in command.lower()
+
+
+class DockLoadTest:
+    """Dispara as chaves no worker residente e registra respostas e amostras"""
+
+    def __init__(self, keys, offsets, workers=2, timeout=ROUTE_TIMEOUT, warm=True,
+                 script=WORKER_SCRIPT, python=sys.executable, sample_interval=1.0, worker_log=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.workers = workers
+        self.timeout = timeout
+        self.warm = warm
+        self.script = script
+        self.python = python
+        self.sample_interval = sample_interval
+        self.worker_log = worker_log
+        self.requests = {}
+        self.samples = []
+        self.process = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.started = None
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def start_worker(self):
+        command = [self.python, self.script, '--workers', str(self.workers)]
+        if self.warm:
+            command.append('--warm')
+        log = open(self.worker_log, 'ab') if self.worker_log else subprocess.DEVNULL
+        self.process = subprocess.Popen(command, cwd=HERE, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=log, text=True, bufsize=1)
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+        # Espera o worker responder antes de começar a contar
+        self.send({"id": "ping", "op": "ping"})
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("Worker encerrou antes de responder ao ping")
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def read_responses(self):
+        for line in self.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            received = self.elapsed()
+            with self._lock:
+                request = self.requests.get(message.get("id"))
+                if request is None or "received_at" in request:
+                    continue
+                request["received_at"] = received
+                request["result"] = message.get("result") or {}
+                request["timing"] = message.get("timing") or {}
+                if all("received_at" in r for r in self.requests.values()) and len(self.requests) == len(self.keys):
+                    self._done.set()
+        self._done.set()
+
+    def sample(self):
+        # Só a contagem fica sob o lock: a varredura do /proc fica fora para
+        # não atrasar o carimbo de received_at em read_responses
+        with self._lock:
+            t = round(self.elapsed(), 2)
+            sent = len(self.requests)
+            in_flight = sum(1 for r in self.requests.values() if "received_at" not in r)
+        tree = process_tree(self.process.pid)
+        chrome = [rss for _, command, rss in tree if is_chrome(command)]
+        worker_rss = sum(rss for pid, _, rss in tree if pid == self.process.pid)
+        sample = {
+            "t": t,
+            "sent": sent,
+            "in_flight": in_flight,
+            "chrome_processes": len(chrome),
+            "chrome_rss_mb": round(sum(chrome) / 1024.0, 1),
+            "worker_rss_mb": round(worker_rss / 1024.0, 1),
+            "total_rss_mb": round(sum(rss for _, _, rss in tree) / 1024.0, 1),
+        }
+        with self._lock:
+            self.samples.append(sample)
+
+    def sample_loop(self):
+        while not self._done.wait(self.sample_interval):
+            self.sample()
+
+    def run(self):
+        self.start_worker()
+        self.started = time.monotonic()
+        threading.Thread(target=self.read_responses, daemon=True).start()
+        self.sample()
+        threading.Thread(target=self.sample_loop, daemon=True).start()
+
+        for index, (key, offset) in enumerate(zip(self.keys, self.offsets)):
+            delay = offset - self.elapsed()
+            if delay > 0:
+                time.sleep(delay)
+            request_id = f"doca-{index}"
+            with self._lock:
+                self.requests[request_id] = {"key": key, "sent_at": self.elapsed()}
+            self.send({"id": request_id, "chave": key})
+
+        # Depois da última leitura, espera no máximo o timeout da rota
+        self._done.wait(self.timeout)
+        self._done.set()
+        self.sample()
+        self.stop_worker()
+        return self.report()
+
+    def stop_worker(self):
+        try:
+            self.send({"op": "shutdown"})
+            self.process.stdin.close()
+            # O worker termina as buscas em andamento antes de sair
+            self.process.wait(timeout=self.timeout)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+    def report(self):
+        latencies, queued, runs = [], [], []
+        succeeded = failed = timeouts = 0
+        last_answer = 0.0
+        errors = {}
+        with self._lock:
+            requests = list(self.requests.values())
+        for request in requests:
+            if "received_at" not in request:
+                timeouts += 1
+                continue
+            latency = request["received_at"] - request["sent_at"]
+            if latency > self.timeout:
+                # A rota já respondeu 408; a resposta tardia é descartada
+                timeouts += 1
+                continue
+            latencies.append(latency)
+            last_answer = max(last_answer, request["received_at"])
+            if "queued_ms" in request["timing"]:
+                queued.append(request["timing"]["queued_ms"] / 1000.0)
+                runs.append(request["timing"]["run_ms"] / 1000.0)
+            if request["result"].get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+                error = str(request["result"].get("error", "sem mensagem"))[:120]
+                errors[error] = errors.get(error, 0) + 1
+
+        window = max(last_answer, 1e-9)
+        return {
+            "keys": len(self.keys),
+            "workers": self.workers,
+            "timeout_seconds": self.timeout,
+            "scan_window_seconds": round(self.offsets[-1], 2) if self.offsets else 0,
+            "succeeded": succeeded,
+            "failed": failed,
+            "timeouts": timeouts,
+            "throughput_per_minute": round((succeeded + failed) / window * 60, 2),
+            "latency": percentiles(latencies),
+            "queue_delay": percentiles(queued),
+            "fetch_time": percentiles(runs),
+            "peak_in_flight": max((s["in_flight"] for s in self.samples), default=0),
+            "peak_chrome_processes": max((s["chrome_processes"] for s in self.samples), default=0),
+            "peak_total_rss_mb": max((s["total_rss_mb"] for s in self.samples), default=0),
+            "errors": errors,
+            "timeline": self.samples,
+        }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rajada de leituras de chaves contra o worker residente")
+    parser.add_argument("--keys", type=int, default=35, help="Chaves geradas (padrão: 35)")
+    parser.add_argument("--keys-file", help="Arquivo com uma chave por linha (substitui --keys)")
+    parser.add_argument("--duration", type=float, default=180, help="Janela de leitura em segundos (padrão: 180)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="poisson", help="Distribuição das chegadas")
+    parser.add_argument("--workers", type=int, default=2, help="--workers do xml_fetch_worker (padrão: 2)")
+    parser.add_argument("--timeout", type=float, default=ROUTE_TIMEOUT, help="Timeout por chave (padrão: 60)")
+    parser.add_argument("--no-warm", action="store_true", help="Não pré-lança os drivers Chrome")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Segundos entre amostras")
+    parser.add_argument("--script", default=WORKER_SCRIPT, help="Worker a testar (protocolo JSON-lines)")
+    parser.add_argument("--worker-log", help="Grava o stderr do worker neste arquivo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Grava o JSON também neste arquivo")
+    args = parser.parse_args()
+
+    if args.keys_file:
+        with open(args.keys_file, 'r', encoding='utf-8') as f:
+            keys = [line.strip() for line in f if line.strip()]
+    else:
+        keys = fresh_keys(args.keys, args.seed)
+
+    test = DockLoadTest(
+        keys, arrival_offsets(len(keys), args.duration, args.arrival, args.seed),
+        workers=max(1, args.workers), timeout=args.timeout, warm=not args.no_warm,
+        script=args.script, sample_interval=args.sample_interval, worker_log=args.worker_log
+    )
+    try:
+        report = test.run()
+    except (OSError, RuntimeError) as e:
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        return
+
+    report["arrival"] = args.arrival
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Detecção de downloads concluídos por evento (inotify), sem polling por segundo
+O Chrome grava o download em "<nome>.crdownload" e renomeia para o nome final
+ao terminar; o inotify avisa esse rename (IN_MOVED_TO) ou o fechamento de uma
+escrita direta (IN_CLOSE_WRITE) no instante em que acontece. O arquivo é
+reconhecido pela chave no nome ou no início do conteúdo (o Id do infNFe fica
+nos primeiros KB), sem reler XMLs inteiros a cada volta.
+
+Fora do Linux (ou sem inotify) cai para varredura do diretório em intervalo
+curto (NFE_DOWNLOAD_POLL_INTERVAL): um nome só é entregue quando o arquivo
+tem tamanho não zero e não é escrito há NFE_DOWNLOAD_SETTLE segundos, então um
+download gravado no próprio nome (sem .crdownload) é entregue ao terminar,
+não ao aparecer.
+
+Uso:
+    path = wait_for_file(download_dir, invoice_key, timeout=30)
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from fetch_metrics import span
+
+POLL_INTERVAL = float(os.environ.get("NFE_DOWNLOAD_POLL_INTERVAL", "0.1"))
+SETTLE_SECONDS = float(os.environ.get("NFE_DOWNLOAD_SETTLE", "1.0"))
+HEAD_BYTES = 64 * 1024
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify_libc():
+    """libc com inotify, ou None se indisponível"""
+    global _libc
+    if _libc is None:
+        _libc = False
+        if hasattr(os, "O_NONBLOCK"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                libc.inotify_init1  # noqa: B018  (AttributeError se não houver)
+                libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+    return _libc or None
+
+
+class InotifyWatcher:
+    """Recebe nomes de arquivos finalizados no diretório via inotify"""
+
+    def __init__(self, directory):
+        libc = _inotify_libc()
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch falhou para {directory}")
+
+    def next_names(self, timeout):
+        """Espera até `timeout` segundos e devolve os nomes dos eventos recebidos"""
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        names = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Alternativa portátil: varre o diretório em intervalo curto"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.done = set()
+        self.existing = {}    # arquivos já presentes ao começar a espera
+
+    def _stat(self, name):
+        try:
+            info = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        return info.st_size, info.st_mtime
+
+    def ignore_existing(self, names):
+        """Arquivos já presentes só são entregues se mudarem depois daqui"""
+        for name in names:
+            self.existing[name] = self._stat(name)
+
+    def next_names(self, timeout):
+        time.sleep(max(0.0, min(timeout, POLL_INTERVAL)))
+        try:
+            listing = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        names = []
+        for name in listing:
+            if name in self.done or name.endswith(PARTIAL_SUFFIXES):
+                continue
+            state = self._stat(name)
+            if state is None:
+                continue
+            if name in self.existing:
+                if state == self.existing[name]:
+                    continue
+                del self.existing[name]
+            if _settled(state):
+                self.done.add(name)
+                names.append(name)
+        return names
+
+    def close(self):
+        pass
+
+
+def _settled(state):
+    """Tamanho não zero e nenhuma escrita há SETTLE_SECONDS (mtime)"""
+    size, mtime = state
+    return size > 0 and time.time() - mtime >= SETTLE_SECONDS
+
+
+def create_watcher(directory):
+    """InotifyWatcher quando disponível, senão PollingWatcher"""
+    if _inotify_libc() is not None:
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            print(f"inotify indisponível ({e}); usando varredura")
+    return PollingWatcher(directory)
+
+
+def file_matches(path, invoice_key=None):
+    """True se o arquivo pertence à chave (nome ou primeiros KB do conteúdo)"""
+    if not invoice_key or invoice_key in os.path.basename(path):
+        return True
+    try:
+        with open(path, 'rb') as f:
+            return invoice_key.encode('ascii') in f.read(HEAD_BYTES)
+    except OSError:
+        return False
+
+
+def _candidate(directory, name, suffix, invoice_key):
+    if not name.endswith(suffix) or name.endswith(PARTIAL_SUFFIXES):
+        return None
+    path = os.path.join(directory, name)
+    if os.path.isfile(path) and file_matches(path, invoice_key):
+        return path
+    return None
+
+
+def wait_for_file(directory, invoice_key=None, timeout=30, suffix='.xml'):
+    """
+    Espera um download finalizado aparecer no diretório
+
+    Args:
+        directory: pasta de download do navegador
+        invoice_key: chave NFe esperada (None aceita qualquer arquivo)
+        timeout: tempo máximo em segundos
+        suffix: extensão do arquivo final
+
+    Returns:
+        str: caminho do arquivo, ou None se nada chegou no prazo
+    """
+    with span("download_wait", source="disk", chave=invoice_key) as current:
+        path = _wait_for_file(directory, invoice_key, timeout, suffix)
+        current.set(found=path is not None, status="ok" if path else "timeout")
+    return path
+
+
+def _wait_for_file(directory, invoice_key, timeout, suffix):
+    os.makedirs(directory, exist_ok=True)
+    deadline = time.monotonic() + timeout
+
+    # Observa antes de olhar o que já existe, para não perder um rename no meio
+    watcher = create_watcher(directory)
+    try:
+        existing = os.listdir(directory)
+        if isinstance(watcher, PollingWatcher):
+            # Sem evento de fim de escrita: os que já casam só valem se assentados;
+            # os que ainda não assentaram seguem acompanhados pela varredura
+            matching = [name for name in existing if _candidate(directory, name, suffix, invoice_key)]
+            for name in matching:
+                state = watcher._stat(name)
+                if state and _settled(state):
+                    return os.path.join(directory, name)
+            watcher.ignore_existing(set(existing) - set(matching))
+        else:
+            for name in existing:
+                path = _candidate(directory, name, suffix, invoice_key)
+                if path:
+                    return path
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            for name in watcher.next_names(remaining):
+                path = _candidate(directory, name, suffix, invoice_key)
+                if path:
+                    return path
+    finally:
+        watcher.close()
+
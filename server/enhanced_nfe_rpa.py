@@ -1,44 +1,16 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote, urlencode
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
-
-def get_uf_from_key(invoice_key):
-    """Extract UF from NFe key"""
-    uf_map = {
-        '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
-        '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
-        '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
-        '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
-    }
-    return uf_map.get(invoice_key[:2], 'SP')
+import http_session
+from xml_stream_extractor import extract_xml, xml_text, body_contains
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
 def create_session():
-    """Create session with proper headers"""
-    session = requests.Session()
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1'
-    }
-    
-    session.headers.update(headers)
-    return session
+    """Create session with proper headers (pooled connections)"""
+    return http_session.create_session("browser")
 
 def try_multiple_nfe_sites(session, invoice_key):
     """Try multiple NFe consultation sites"""
@@ -61,47 +33,38 @@ def try_multiple_nfe_sites(session, invoice_key):
             response = session.get(site_url, timeout=15)
             
             if response.status_code == 200:
-                content = response.text
-                
                 # Check for XML content
-                if invoice_key in content and '<?xml' in content:
-                    xml_start = content.find('<?xml')
-                    xml_end = content.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = content.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = content[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML obtido de: {site_url}"
-                            }
+                if body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": f"XML obtido de: {site_url}"
+                        }
                 
-                # Look for download links
+                # Look for download links (bytes regex; only the href is decoded)
                 download_patterns = [
-                    r'href="([^"]*\.xml[^"]*)"',
-                    r'href="([^"]*download[^"]*xml[^"]*)"'
+                    rb'href="([^"]*\.xml[^"]*)"',
+                    rb'href="([^"]*download[^"]*xml[^"]*)"'
                 ]
                 
                 for pattern in download_patterns:
-                    matches = re.findall(pattern, content, re.IGNORECASE)
+                    matches = re.findall(pattern, response.content, re.IGNORECASE)
                     for match in matches:
-                        download_url = match
+                        download_url = match.decode('utf-8', errors='replace')
                         if not download_url.startswith('http'):
                             base_url = '/'.join(site_url.split('/')[:3])
                             download_url = base_url + ('/' if not download_url.startswith('/') else '') + download_url
                         
                         try:
                             download_response = session.get(download_url, timeout=10)
-                            if download_response.status_code == 200 and invoice_key in download_response.text:
-                                if '<?xml' in download_response.text:
-                                    return {
-                                        "success": True,
-                                        "xml_content": download_response.text,
-                                        "message": f"XML baixado de: {download_url}"
-                                    }
+                            if download_response.status_code == 200 and body_contains(download_response, invoice_key, '<?xml'):
+                                return {
+                                    "success": True,
+                                    "xml_content": xml_text(download_response.content),
+                                    "message": f"XML baixado de: {download_url}"
+                                }
                         except Exception:
                             continue
         
@@ -126,23 +89,15 @@ def try_api_endpoints(session, invoice_key):
             response = session.get(endpoint, timeout=12)
             
             if response.status_code == 200:
-                content = response.text
-                
                 # Check for XML in response
-                if invoice_key in content and '<?xml' in content:
-                    xml_start = content.find('<?xml')
-                    xml_end = content.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = content.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = content[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML obtido via API: {endpoint}"
-                            }
+                if body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": f"XML obtido via API: {endpoint}"
+                        }
                 
                 # Try JSON response
                 try:
@@ -203,39 +158,25 @@ def try_form_submissions(session, invoice_key):
                 try:
                     # Try POST
                     response = session.post(endpoint, data=form_data, timeout=10)
-                    if response.status_code == 200 and invoice_key in response.text:
-                        if '<?xml' in response.text:
-                            xml_start = response.text.find('<?xml')
-                            xml_end = response.text.find('</nfeProc>', xml_start)
-                            if xml_end == -1:
-                                xml_end = response.text.find('</NFe>', xml_start)
-                            
-                            if xml_end != -1:
-                                xml_content = response.text[xml_start:xml_end + 10]
-                                if len(xml_content) > 1000:
-                                    return {
-                                        "success": True,
-                                        "xml_content": xml_content,
-                                        "message": f"XML obtido via formulário: {endpoint}"
-                                    }
+                    if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
+                        xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                        if xml_content:
+                            return {
+                                "success": True,
+                                "xml_content": xml_content,
+                                "message": f"XML obtido via formulário: {endpoint}"
+                            }
                     
                     # Try GET with params
                     response = session.get(endpoint, params=form_data, timeout=10)
-                    if response.status_code == 200 and invoice_key in response.text:
-                        if '<?xml' in response.text:
-                            xml_start = response.text.find('<?xml')
-                            xml_end = response.text.find('</nfeProc>', xml_start)
-                            if xml_end == -1:
-                                xml_end = response.text.find('</NFe>', xml_start)
-                            
-                            if xml_end != -1:
-                                xml_content = response.text[xml_start:xml_end + 10]
-                                if len(xml_content) > 1000:
-                                    return {
-                                        "success": True,
-                                        "xml_content": xml_content,
-                                        "message": f"XML obtido via GET: {endpoint}"
-                                    }
+                    if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
+                        xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                        if xml_content:
+                            return {
+                                "success": True,
+                                "xml_content": xml_content,
+                                "message": f"XML obtido via GET: {endpoint}"
+                            }
                 
                 except Exception:
                     continue
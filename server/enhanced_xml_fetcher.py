@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
-import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from chrome_driver_pool import get_pool, release_driver
+from http_session import shared_session
+from browser_waits import wait_for_value, wait_for_search_result, search_state
+from selector_probe import find_first
+from xml_stream_extractor import xml_text
+from nfe_access_key import validate_nfe_key
 
-def setup_chrome():
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("browser")
+
+def create_chrome(download_dir=None):
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
@@ -20,9 +27,14 @@ def setup_chrome():
     options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
     return webdriver.Chrome(options=options)
 
+def setup_chrome():
+    """Borrow a warm Chrome instance from the shared pool"""
+    return get_pool("enhanced_xml_chrome", create_chrome).acquire(timeout=60)
+
 def extract_xml_meudanfe(invoice_key):
-    if not invoice_key or len(invoice_key) != 44:
-        return {"success": False, "error": "Chave deve ter 44 dígitos"}
+    is_valid, message = validate_nfe_key(invoice_key)
+    if not is_valid:
+        return {"success": False, "error": message}
     
     driver = None
     try:
@@ -31,7 +43,6 @@ def extract_xml_meudanfe(invoice_key):
         
         # Access meudanfe.com.br
         driver.get("https://meudanfe.com.br/")
-        wait = WebDriverWait(driver, 12)
         
         # Multiple attempts to find input field
         input_selectors = [
@@ -41,31 +52,23 @@ def extract_xml_meudanfe(invoice_key):
             "//input[contains(@class, 'form-control')]"
         ]
         
-        input_element = None
-        for selector in input_selectors:
-            try:
-                input_element = wait.until(EC.presence_of_element_located((By.XPATH, selector)))
-                break
-            except TimeoutException:
-                continue
+        input_element = find_first(driver, "input", input_selectors, timeout=12, visible=False)
         
         if not input_element:
             return {"success": False, "error": "Campo de entrada não localizado"}
         
         # Enter invoice key and verify it was entered correctly
         input_element.clear()
-        time.sleep(0.5)
         input_element.send_keys(invoice_key)
-        time.sleep(1)
+        wait_for_value(input_element, invoice_key)
         
         # Verify the key was entered correctly
         entered_value = input_element.get_attribute('value')
         if entered_value != invoice_key:
             print(f"Warning: Entered value '{entered_value}' doesn't match invoice key '{invoice_key}'")
             input_element.clear()
-            time.sleep(0.5)
             input_element.send_keys(invoice_key)
-            time.sleep(1)
+            wait_for_value(input_element, invoice_key)
         
         # Find search button with multiple strategies
         search_selectors = [
@@ -76,30 +79,18 @@ def extract_xml_meudanfe(invoice_key):
             "//button[contains(@class, 'btn')]"
         ]
         
-        search_button = None
-        for selector in search_selectors:
-            try:
-                search_button = driver.find_element(By.XPATH, selector)
-                if search_button.is_enabled():
-                    break
-            except NoSuchElementException:
-                continue
+        search_button = find_first(driver, "search", search_selectors, visible=False, enabled=True)
         
         if not search_button:
             return {"success": False, "error": "Botão de busca não encontrado"}
         
         # Click search and wait for results
+        before = search_state(driver)
         search_button.click()
         print(f"Search initiated for invoice key: {invoice_key}")
-        time.sleep(6)  # Give more time for the search to complete
-        
-        # Wait for results to load - look for indicators that search completed
-        try:
-            # Wait for either results or error messages
-            WebDriverWait(driver, 10).until(
-                lambda d: len(d.find_elements(By.XPATH, "//*[contains(text(), 'XML') or contains(text(), 'xml') or contains(text(), 'Erro') or contains(text(), 'erro')]")) > 0
-            )
-        except TimeoutException:
+        
+        # Wait for either results or error messages
+        if not wait_for_search_result(driver, before, timeout=16):
             print("Timeout waiting for search results")
         
         # Multiple strategies to find XML content
@@ -151,11 +142,11 @@ def extract_xml_meudanfe(invoice_key):
         # Download XML if URL found
         if download_url:
             try:
-                response = requests.get(download_url, timeout=20, headers={
+                response = session.get(download_url, timeout=20, headers={
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
                 })
-                if response.status_code == 200 and response.text:
-                    xml_content = response.text
+                if response.status_code == 200 and response.content:
+                    xml_content = xml_text(response.content)
             except Exception:
                 pass
         
@@ -233,10 +224,7 @@ def extract_xml_meudanfe(invoice_key):
         return {"success": False, "error": f"Erro na automação: {str(e)}"}
     finally:
         if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+            release_driver(driver)
 
 def main():
     if len(sys.argv) != 2:
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Spans de tempo por etapa da busca de NFe e métricas agregadas
+Cada etapa (validação, consulta ao cache, estratégia, requisição HTTP com
+DNS/connect/TLS/TTFB/corpo, lançamento do navegador, carregamento de página,
+espera do download, extração) vira um span com duração, status e atributos.
+Spans de uma mesma busca compartilham o trace aberto por trace(chave),
+inclusive nas threads das estratégias em corrida.
+
+Os spans saem como JSON, um por linha, num canal separado do stdout (que é
+do protocolo do worker e da saída dos scripts), escolhido por NFE_SPANS:
+    stderr           no stderr
+    fd:3             num descritor herdado do processo pai
+    /caminho/arq     anexados a um arquivo
+    (vazio)          não emite; só agrega
+
+A agregação (histograma por span/status/estratégia ou host) fica no
+processo e sai em texto Prometheus via prometheus_text(), pelo op "metrics"
+do xml_fetch_worker ou por GET /metrics (serve_metrics, NFE_METRICS_PORT).
+
+Uso:
+    with trace(chave):
+        with span("cache_lookup") as s:
+            xml = load_xml(chave)
+            s.set(hit=xml is not None)
+
+    record("strategy", elapsed, status="ok", strategy="try_public_apis")
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+SPANS_CHANNEL = os.environ.get("NFE_SPANS", "")
+METRICS_PORT = int(os.environ.get("NFE_METRICS_PORT", "0"))
+
+# Limites (segundos) do histograma: de uma busca no cache a um timeout de rota
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Atributo que entra como rótulo na agregação (o primeiro presente)
+AGGREGATE_LABELS = ('strategy', 'host')
+HTTP_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body')
+
+_trace = contextvars.ContextVar("nfe_trace", default=None)
+_parent = contextvars.ContextVar("nfe_span", default=None)
+
+_histograms = {}
+_phases = {}
+_lock = threading.Lock()
+
+_channel = None
+_channel_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'status', 'span_id', 'parent', 'started', 'wall')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.status = "ok"
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = _parent.get()
+        self.started = time.perf_counter()
+        self.wall = time.time()
+
+    def set(self, **attrs):
+        """Acrescenta atributos (status=... troca o status do span)"""
+        status = attrs.pop('status', None)
+        if status:
+            self.status = status
+        self.attrs.update(attrs)
+
+
+def _open_channel():
+    global _channel
+    with _channel_lock:
+        if _channel is None and SPANS_CHANNEL:
+            try:
+                if SPANS_CHANNEL == "stderr":
+                    _channel = sys.stderr
+                elif SPANS_CHANNEL.startswith("fd:"):
+                    _channel = os.fdopen(int(SPANS_CHANNEL[3:]), "a", buffering=1, encoding="utf-8")
+                else:
+                    _channel = open(SPANS_CHANNEL, "a", buffering=1, encoding="utf-8")
+            except (OSError, ValueError) as e:
+                print(f"Canal de spans indisponível ({SPANS_CHANNEL}): {e}", file=sys.stderr)
+                _channel = False
+        return _channel
+
+
+def _emit(event):
+    channel = _channel if _channel is not None else _open_channel()
+    if not channel:
+        return
+    line = json.dumps(event, ensure_ascii=False, default=str)
+    with _channel_lock:
+        try:
+            channel.write(line + "\n")
+            channel.flush()
+        except (OSError, ValueError):
+            pass
+
+
+def _aggregate(name, seconds, status, attrs):
+    label = next(((key, str(attrs[key])) for key in AGGREGATE_LABELS if attrs.get(key)), None)
+    key = (name, status, label)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][index] += 1
+                break
+        histogram[1] += seconds
+        histogram[2] += 1
+
+        if name == "http":
+            host = str(attrs.get('host', ''))
+            for phase in HTTP_PHASES:
+                value = attrs.get(f"{phase}_ms")
+                if value is not None:
+                    total = _phases.setdefault((phase, host), [0.0, 0])
+                    total[0] += value / 1000.0
+                    total[1] += 1
+
+
+def _finish(name, seconds, status, attrs, span_id=None, parent=None, wall=None):
+    _aggregate(name, seconds, status, attrs)
+    if not SPANS_CHANNEL:
+        return
+    trace_id, invoice_key = _trace.get() or (None, None)
+    event = {
+        "span": name,
+        "trace": trace_id,
+        "span_id": span_id or uuid.uuid4().hex[:16],
+        "parent": parent if span_id else _parent.get(),
+        "chave": attrs.pop('chave', None) or invoice_key,
+        "start": round(wall if wall is not None else time.time() - seconds, 6),
+        "duration_ms": round(seconds * 1000, 3),
+        "status": status,
+    }
+    event.update(attrs)
+    _emit(event)
+
+
+@contextmanager
+def trace(invoice_key):
+    """Abre o trace de uma busca; spans dentro dele (e das threads copiadas) o compartilham"""
+    token = _trace.set((uuid.uuid4().hex[:16], invoice_key))
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Mede o bloco; exceção marca status=error e é relançada"""
+    current = Span(name, attrs)
+    token = _parent.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attrs.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        _parent.reset(token)
+        _finish(name, time.perf_counter() - current.started, current.status, current.attrs,
+                current.span_id, current.parent, current.wall)
+
+
+def record(name, seconds, status="ok", **attrs):
+    """Registra uma etapa já medida (ex.: estratégias, via strategy_stats.record_outcome)"""
+    _finish(name, seconds, status, attrs)
+
+
+def current_context():
+    """Contexto (trace e span pai) para rodar em outra thread: ctx.run(func, ...)"""
+    return contextvars.copy_context()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def prometheus_text():
+    """Agregados no formato de exposição de texto do Prometheus"""
+    with _lock:
+        histograms = {key: (list(counts), total, count) for key, (counts, total, count) in _histograms.items()}
+        phases = {key: tuple(value) for key, value in _phases.items()}
+
+    lines = [
+        "# HELP nfe_span_duration_seconds Duração das etapas da busca de NFe",
+        "# TYPE nfe_span_duration_seconds histogram",
+    ]
+    for (name, status, label), (counts, total, count) in sorted(histograms.items(), key=lambda item: str(item[0])):
+        base = [('span', name), ('status', status)] + ([label] if label else [])
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, counts):
+            cumulative += bucket
+            lines.append(f"nfe_span_duration_seconds_bucket{_labels(base + [('le', repr(bound))])} {cumulative}")
+        lines.append(f"nfe_span_duration_seconds_bucket{_labels(base + [('le', '+Inf')])} {count}")
+        lines.append(f"nfe_span_duration_seconds_sum{_labels(base)} {total:.6f}")
+        lines.append(f"nfe_span_duration_seconds_count{_labels(base)} {count}")
+
+    lines += [
+        "# HELP nfe_http_phase_seconds Tempo das requisições HTTP por fase (dns, connect, tls, ttfb, body)",
+        "# TYPE nfe_http_phase_seconds summary",
+    ]
+    for (phase, host), (total, count) in sorted(phases.items()):
+        labels = _labels([('phase', phase), ('host', host)])
+        lines.append(f"nfe_http_phase_seconds_sum{labels} {total:.6f}")
+        lines.append(f"nfe_http_phase_seconds_count{labels} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    """GET /metrics numa thread daemon; devolve o servidor (None se port=0)"""
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            payload = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
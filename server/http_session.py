@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Fábrica de sessões HTTP compartilhadas para os buscadores de NFe
+Todas as sessões montam o mesmo HTTPAdapter, então conexões keep-alive com
+SEFAZ, portal nacional e meudanfe.com.br são reaproveitadas entre chamadas e
+entre buscas concorrentes (sem novo TCP + TLS a cada requisição). Cada
+create_session() continua com seus próprios cookies; shared_session() devolve
+uma sessão única por perfil para serviços sem estado.
+
+O adapter repete GET/HEAD em falha de conexão e em 502/503/504 (com
+backoff curto); POSTs não são repetidos. É um RoutedAdapter (nfe_endpoints):
+com NFE_ENDPOINT_BASE/NFE_ENDPOINTS as conexões vão para o servidor local de
+teste em vez dos hosts reais.
+
+Cada requisição vira um span "http" (fetch_metrics) com as fases dns,
+connect e tls (só quando abre conexão nova), ttfb e body (quando o corpo
+não é lido em stream).
+
+Uso:
+    session = create_session("browser")               # cookies próprios
+    session = shared_session("api")                   # sessão do processo
+    session = create_session("ajax", headers={"Referer": "https://meudanfe.com.br/"})
+"""
+
+import os
+import time
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.retry import Retry
+
+import fetch_metrics
+from nfe_endpoints import RoutedAdapter
+
+try:
+    import brotli  # noqa: F401  (requests só decodifica "br" com brotli instalado)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+POOL_HOSTS = int(os.environ.get("NFE_HTTP_POOL_HOSTS", "32"))
+POOL_PER_HOST = int(os.environ.get("NFE_HTTP_POOL_PER_HOST", "16"))
+RETRIES = int(os.environ.get("NFE_HTTP_RETRIES", "2"))
+
+CHROME_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+HEADER_PROFILES = {
+    # Navegação de página, como o Chrome desktop
+    "browser": {
+        'User-Agent': CHROME_USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Sec-Fetch-User': '?1'
+    },
+    # Requisições XHR/fetch feitas pelo JavaScript da página
+    "ajax": {
+        'User-Agent': CHROME_USER_AGENT,
+        'Accept': 'application/json, text/plain, */*',
+        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'Connection': 'keep-alive',
+        'X-Requested-With': 'XMLHttpRequest'
+    },
+    # Webservices SOAP e APIs públicas
+    "api": {
+        'User-Agent': 'NFe-Consultation/1.0',
+        'Accept': 'application/xml, text/xml, application/json, */*',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    }
+}
+
+_adapter = None
+_shared = {}
+_lock = threading.Lock()
+
+
+# Fases da requisição em andamento nesta thread (o urllib3 conecta na thread do send)
+_phases = threading.local()
+
+
+def _add_phase(name, seconds):
+    timings = getattr(_phases, "current", None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class _MeteredConnection:
+    """Separa a resolução DNS do connect TCP: resolve aqui e conecta direto no IP"""
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror:
+            # O urllib3 resolve de novo e levanta o erro de resolução que os chamadores esperam
+            return super()._new_conn()
+        _add_phase("dns", time.perf_counter() - started)
+
+        dns_host = self._dns_host
+        started = time.perf_counter()
+        error = None
+        try:
+            for *_, sockaddr in addresses:
+                self._dns_host = sockaddr[0]
+                try:
+                    return super()._new_conn()
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = dns_host
+            _add_phase("connect", time.perf_counter() - started)
+
+
+class MeteredHTTPConnection(_MeteredConnection, HTTPConnection):
+    pass
+
+
+class MeteredHTTPSConnection(_MeteredConnection, HTTPSConnection):
+    def connect(self):
+        timings = getattr(_phases, "current", None) or {}
+        before = timings.get("dns", 0.0) + timings.get("connect", 0.0)
+        started = time.perf_counter()
+        super().connect()
+        socket_time = timings.get("dns", 0.0) + timings.get("connect", 0.0) - before
+        _add_phase("tls", time.perf_counter() - started - socket_time)
+
+
+class MeteredHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = MeteredHTTPConnection
+
+
+class MeteredHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = MeteredHTTPSConnection
+
+
+class MeteredAdapter(RoutedAdapter):
+    """RoutedAdapter que registra um span "http" por requisição, com as fases"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": MeteredHTTPConnectionPool,
+            "https": MeteredHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs):
+        timings = _phases.current = {}
+        attrs = {"method": request.method, "host": urlsplit(request.url).netloc}
+        started = time.perf_counter()
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            headers_at = time.perf_counter()
+            if not stream:
+                # O Session lê o corpo logo em seguida; lendo aqui, ele entra no span
+                response.content
+                attrs["body_ms"] = round((time.perf_counter() - headers_at) * 1000, 3)
+        except Exception as e:
+            attrs["error"] = type(e).__name__
+            fetch_metrics.record("http", time.perf_counter() - started, status="error", **attrs)
+            raise
+        finally:
+            _phases.current = None
+
+        socket_time = sum(timings.get(phase, 0.0) for phase in ("dns", "connect", "tls"))
+        for phase in ("dns", "connect", "tls"):
+            if phase in timings:
+                attrs[f"{phase}_ms"] = round(timings[phase] * 1000, 3)
+        attrs["ttfb_ms"] = round((headers_at - started - socket_time) * 1000, 3)
+        attrs["new_connection"] = "connect" in timings
+        attrs["status_code"] = response.status_code
+        status = "error" if response.status_code >= 500 else "ok"
+        fetch_metrics.record("http", time.perf_counter() - started, status=status, **attrs)
+        return response
+
+
+def create_adapter(pool_maxsize=POOL_PER_HOST, pool_connections=POOL_HOSTS):
+    """Adapter com pool keep-alive, retentativas para GET/HEAD, rotas do nfe_endpoints e spans"""
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=0,
+        status=1,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        backoff_factor=0.3,
+        raise_on_status=False
+    )
+    return MeteredAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+
+def shared_adapter():
+    """Adapter (pool de conexões) único do processo"""
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = create_adapter()
+        return _adapter
+
+
+def mount(session, adapter=None):
+    """Monta o adapter (padrão: o compartilhado) em http:// e https://"""
+    adapter = adapter or shared_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def create_session(profile="browser", headers=None):
+    """
+    Nova sessão (cookies próprios) sobre o pool de conexões compartilhado
+
+    Args:
+        profile: perfil de headers ("browser", "ajax" ou "api")
+        headers: headers extras/sobrescritos para esta sessão
+    """
+    session = requests.Session()
+    mount(session)
+    session.headers.update(HEADER_PROFILES[profile])
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def shared_session(profile="api"):
+    """Sessão única do processo para o perfil (serviços sem estado de login)"""
+    with _lock:
+        session = _shared.get(profile)
+    if session is None:
+        session = create_session(profile)
+        with _lock:
+            session = _shared.setdefault(profile, session)
+    return session
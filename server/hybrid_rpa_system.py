@@ -2,57 +2,63 @@
 import sys
 import json
 import os
-import requests
 import time
 import re
 from urllib.parse import quote
+from nfe_xml_cache import load_xml, store_xml, cache_path
+from strategy_stats import order_strategies, record_outcome
+from http_session import create_session
+from download_watcher import wait_for_file
+from browser_waits import wait_until, element_present
+from xml_stream_extractor import extract_xml, fetch_xml, xml_text, body_contains, body_contains_any
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
 class HybridRPASystem:
     def __init__(self):
-        self.session = requests.Session()
+        # Sessão própria (cookies) sobre o pool de conexões compartilhado
+        self.session = create_session("browser")
         self.download_folder = "C:\\CROSSWMS" if os.name == 'nt' else "/tmp/crosswms"
-        self.setup_session()
-    
-    def setup_session(self):
-        """Configura sessão HTTP simulando navegador real"""
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1'
-        })
     
     def execute_rpa(self, invoice_key):
         """Executa RPA híbrido com múltiplas estratégias"""
         
         print(f"Iniciando RPA híbrido para chave: {invoice_key}")
         
-        # Estratégia 1: Selenium local se disponível
-        if self.is_selenium_available():
-            result = self.try_selenium_download(invoice_key)
-            if result.get('success'):
-                return result
+        # NF-e autorizada é imutável: reaproveita o XML já obtido
+        cached_xml = load_xml(invoice_key)
+        if cached_xml:
+            return {
+                "success": True,
+                "xml_content": cached_xml,
+                "file_path": cache_path(invoice_key),
+                "method": "local_cache",
+                "message": "XML obtido do cache local"
+            }
         
-        # Estratégia 2: Simulação HTTP avançada
-        result = self.try_http_simulation(invoice_key)
-        if result.get('success'):
-            return result
+        strategies = [
+            ("selenium", self.try_local_selenium),          # Selenium local se disponível
+            ("http_simulation", self.try_http_simulation),  # Simulação HTTP avançada
+            ("direct_xml", self.try_direct_xml_access)      # Download direto se XML estiver disponível
+        ]
         
-        # Estratégia 3: Download direto se XML estiver disponível
-        result = self.try_direct_xml_access(invoice_key)
-        if result.get('success'):
-            return result
+        # Mais rápidas e confiáveis para a UF da chave primeiro (histórico local)
+        uf = get_uf_from_key(invoice_key)
+        for name, strategy in order_strategies("hybrid_rpa_system", strategies, uf):
+            started = time.monotonic()
+            result = strategy(invoice_key)
+            record_outcome("hybrid_rpa_system", name, uf, bool(result.get('success')), time.monotonic() - started)
+            if result.get('success'):
+                return result
         
         # Se todas falharam, retorna orientação para ambiente local
         return self.generate_local_setup_guidance(invoice_key)
     
+    def try_local_selenium(self, invoice_key):
+        """Usa Selenium apenas se Selenium e Chrome estiverem disponíveis"""
+        if not self.is_selenium_available():
+            return {"success": False}
+        return self.try_selenium_download(invoice_key)
+    
     def is_selenium_available(self):
         """Verifica se Selenium e Chrome estão disponíveis"""
         try:
@@ -116,11 +122,10 @@ class HybridRPASystem:
                 search_button = driver.find_element(By.XPATH, "//*[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]")
                 search_button.click()
                 
-                # Aguarda resultados
-                time.sleep(3)
-                
-                # Procura botão de download
-                download_button = driver.find_element(By.XPATH, "//*[contains(text(), 'Baixar XML') or contains(text(), 'Download')]")
+                # Aguarda o botão de download aparecer nos resultados
+                download_xpath = "//*[contains(text(), 'Baixar XML') or contains(text(), 'Download')]"
+                wait_until(driver, element_present(download_xpath))
+                download_button = driver.find_element(By.XPATH, download_xpath)
                 download_button.click()
                 
                 # Aguarda download
@@ -129,6 +134,7 @@ class HybridRPASystem:
                 if xml_file:
                     xml_content = self.read_file(xml_file)
                     if xml_content and invoice_key in xml_content:
+                        store_xml(invoice_key, xml_content)
                         return {
                             "success": True,
                             "xml_content": xml_content,
@@ -170,10 +176,10 @@ class HybridRPASystem:
                 
                 if response.status_code == 200:
                     # Verifica se encontrou a NFe
-                    if invoice_key in response.text and ('sucesso' in response.text.lower() or 'xml' in response.text.lower()):
+                    if body_contains(response, invoice_key) and body_contains_any(response, 'sucesso', 'xml', ignore_case=True):
                         
                         # Procura por XML na resposta
-                        xml_content = self.extract_xml_from_response(response.text, invoice_key)
+                        xml_content = self.extract_xml_from_response(response.content, invoice_key)
                         if xml_content:
                             # Salva XML localmente
                             local_file = self.save_xml_locally(xml_content, invoice_key)
@@ -186,14 +192,14 @@ class HybridRPASystem:
                             }
                         
                         # Procura link de download
-                        download_url = self.extract_download_link(response.text, invoice_key)
+                        download_url = self.extract_download_link(response.content, invoice_key)
                         if download_url:
-                            xml_response = self.session.get(download_url, timeout=15)
-                            if xml_response.status_code == 200 and xml_response.text.startswith('<?xml'):
-                                local_file = self.save_xml_locally(xml_response.text, invoice_key)
+                            xml_content = fetch_xml(self.session, download_url)
+                            if xml_content:
+                                local_file = self.save_xml_locally(xml_content, invoice_key)
                                 return {
                                     "success": True,
-                                    "xml_content": xml_response.text,
+                                    "xml_content": xml_content,
                                     "file_path": local_file,
                                     "method": "http_download",
                                     "message": "XML baixado via HTTP"
@@ -222,12 +228,13 @@ class HybridRPASystem:
                 print(f"Tentando acesso direto: {url}")
                 response = self.session.get(url, timeout=15)
                 
-                if response.status_code == 200 and response.text.startswith('<?xml'):
-                    if invoice_key in response.text:
-                        local_file = self.save_xml_locally(response.text, invoice_key)
+                if response.status_code == 200 and response.content.startswith(b'<?xml'):
+                    if body_contains(response, invoice_key):
+                        xml_content = xml_text(response.content)
+                        local_file = self.save_xml_locally(xml_content, invoice_key)
                         return {
                             "success": True,
-                            "xml_content": response.text,
+                            "xml_content": xml_content,
                             "file_path": local_file,
                             "method": "direct_access",
                             "message": "XML acessado diretamente"
@@ -268,30 +275,15 @@ class HybridRPASystem:
             ]
         }
     
-    def extract_xml_from_response(self, html_content, invoice_key):
-        """Extrai XML da resposta HTML"""
+    def extract_xml_from_response(self, content, invoice_key):
+        """Extrai XML do corpo bruto da resposta (só o trecho do XML é decodificado)"""
         try:
-            xml_patterns = [
-                r'<\?xml[^>]*>.*?</nfeProc>',
-                r'<\?xml[^>]*>.*?</NFe>',
-                r'<nfeProc[^>]*>.*?</nfeProc>',
-                r'<NFe[^>]*>.*?</NFe>'
-            ]
-            
-            for pattern in xml_patterns:
-                match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-                if match and invoice_key in match.group(0):
-                    xml_content = match.group(0)
-                    if len(xml_content) > 2000:
-                        return xml_content
-            
-            return None
-            
+            return extract_xml(content, invoice_key, min_length=2000)
         except Exception:
             return None
     
-    def extract_download_link(self, html_content, invoice_key):
-        """Extrai link de download da resposta"""
+    def extract_download_link(self, content, invoice_key):
+        """Extrai link de download do corpo bruto da resposta"""
         try:
             patterns = [
                 rf'href\s*=\s*["\']([^"\']*download[^"\']*xml[^"\']*{invoice_key}[^"\']*)["\']',
@@ -300,9 +292,9 @@ class HybridRPASystem:
             ]
             
             for pattern in patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
+                match = re.search(pattern.encode('ascii'), content, re.IGNORECASE)
                 if match:
-                    link = match.group(1)
+                    link = match.group(1).decode('utf-8', errors='replace')
                     if link.startswith('/'):
                         return f'https://meudanfe.com.br{link}'
                     elif link.startswith('http'):
@@ -316,43 +308,15 @@ class HybridRPASystem:
             return None
     
     def save_xml_locally(self, xml_content, invoice_key):
-        """Salva XML na pasta local"""
-        try:
-            os.makedirs(self.download_folder, exist_ok=True)
-            filename = f"NFe_{invoice_key}.xml"
-            filepath = os.path.join(self.download_folder, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(xml_content)
-            
+        """Salva XML no cache local compartilhado (comprimido, escrita atômica)"""
+        filepath = store_xml(invoice_key, xml_content)
+        if filepath:
             print(f"XML salvo em: {filepath}")
-            return filepath
-            
-        except Exception as e:
-            print(f"Erro ao salvar XML: {e}")
-            return None
+        return filepath
     
     def wait_for_download(self, invoice_key, timeout=30):
-        """Aguarda download completar"""
-        import glob
-        
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            xml_files = glob.glob(os.path.join(self.download_folder, "*.xml"))
-            
-            for file in xml_files:
-                if not file.endswith('.crdownload') and not file.endswith('.tmp'):
-                    try:
-                        content = self.read_file(file)
-                        if content and invoice_key in content:
-                            return file
-                    except:
-                        continue
-            
-            time.sleep(1)
-        
-        return None
+        """Aguarda download completar (evento do sistema de arquivos, sem polling)"""
+        return wait_for_file(self.download_folder, invoice_key, timeout)
     
     def read_file(self, filepath):
         """Lê conteúdo de arquivo"""
@@ -362,16 +326,6 @@ class HybridRPASystem:
         except Exception:
             return None
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def main():
     """Ponto de entrada"""
     if len(sys.argv) != 2:
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Perfil de carregamento enxuto para os fluxos Selenium
+O fluxo só precisa do formulário de busca e do resultado, então:
+  - page_load_strategy "eager": driver.get() volta no DOMContentLoaded, sem
+    esperar imagens, iframes de anúncio e scripts atrasados;
+  - imagens bloqueadas pela preferência de conteúdo do perfil (o
+    "--disable-images" é ignorado pelo Chrome atual);
+  - imagens, fontes, mídia, anúncios e analytics bloqueados por padrão de
+    URL via CDP (Network.setBlockedURLs).
+
+Configuração por ambiente:
+    NFE_LEAN_PAGE_LOAD=0            desliga o perfil
+    NFE_LEAN_BLOCK_PATTERNS=a,b     padrões extras a bloquear
+    NFE_LEAN_ALLOW_PATTERNS=a,b     remove padrões da lista padrão
+
+Medição contra a configuração anterior:
+    python3 lean_page_profile.py [url] [--runs 3] [--no-headless]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+ENABLED = os.environ.get("NFE_LEAN_PAGE_LOAD", "1") != "0"
+
+DEFAULT_BLOCKED_PATTERNS = [
+    # Imagens, fontes e mídia
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.avif",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+    # Anúncios, analytics e rastreadores
+    "*googletagmanager.com*", "*google-analytics.com*", "*analytics.google.com*",
+    "*doubleclick.net*", "*googlesyndication.com*", "*googleadservices.com*",
+    "*adservice.google.*", "*fundingchoicesmessages.google.com*",
+    "*connect.facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*clarity.ms*",
+    "*taboola.com*", "*outbrain.com*", "*criteo.*", "*amazon-adsystem.com*",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+]
+
+# Preferências do perfil: 2 = bloquear
+LEAN_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+
+def _env_list(name):
+    return [item.strip() for item in os.environ.get(name, "").split(",") if item.strip()]
+
+
+def blocked_patterns():
+    """Lista efetiva de padrões bloqueados (padrão + extras - liberados)"""
+    allowed = set(_env_list("NFE_LEAN_ALLOW_PATTERNS"))
+    patterns = [p for p in DEFAULT_BLOCKED_PATTERNS if p not in allowed]
+    return patterns + [p for p in _env_list("NFE_LEAN_BLOCK_PATTERNS") if p not in patterns]
+
+
+def apply_lean_options(options, prefs):
+    """
+    Ajusta Options e o dicionário de prefs antes de criar o driver
+
+    Args:
+        options: selenium Options do Chrome
+        prefs: dict de preferências que será passado em add_experimental_option
+    """
+    if not ENABLED:
+        return options
+    options.page_load_strategy = "eager"
+    prefs.update(LEAN_PREFS)
+    return options
+
+
+def apply_lean_blocking(driver):
+    """Bloqueia imagens, fontes, anúncios e analytics via CDP no driver já criado"""
+    if not ENABLED:
+        return driver
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_patterns()})
+    except Exception as e:
+        print(f"Bloqueio de URLs via CDP indisponível: {e}")
+    return driver
+
+
+PAGE_METRICS_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0] || {};
+const resources = performance.getEntriesByType('resource');
+return {
+    dom_content_loaded_ms: Math.round(nav.domContentLoadedEventEnd || 0),
+    load_event_ms: Math.round(nav.loadEventEnd || 0),
+    resources: resources.length,
+    transfer_kb: Math.round(resources.reduce((total, r) => total + (r.transferSize || 0), 0) / 1024)
+};
+"""
+
+
+def measure(url, lean, runs, headless):
+    """Carrega a URL `runs` vezes num Chrome novo e devolve as médias"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    prefs = {}
+    if lean:
+        apply_lean_options(options, prefs)
+    else:
+        # Configuração anterior
+        options.add_argument("--disable-images")
+    options.add_experimental_option("prefs", prefs)
+
+    driver = webdriver.Chrome(options=options)
+    try:
+        if lean:
+            apply_lean_blocking(driver)
+        samples = []
+        for _ in range(runs):
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            started = time.perf_counter()
+            driver.get(url)
+            elapsed = time.perf_counter() - started
+            sample = driver.execute_script(PAGE_METRICS_SCRIPT)
+            sample["get_ms"] = round(elapsed * 1000)
+            samples.append(sample)
+            driver.get("about:blank")
+    finally:
+        driver.quit()
+
+    return {key: round(sum(s[key] for s in samples) / len(samples)) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o perfil enxuto contra a configuração anterior")
+    parser.add_argument("url", nargs="?", default="https://meudanfe.com.br")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-headless", action="store_true")
+    args = parser.parse_args()
+
+    if not ENABLED:
+        print("NFE_LEAN_PAGE_LOAD=0: o perfil enxuto está desligado", file=sys.stderr)
+        sys.exit(1)
+
+    headless = not args.no_headless
+    report = {
+        "url": args.url,
+        "runs": args.runs,
+        "baseline": measure(args.url, False, args.runs, headless),
+        "lean": measure(args.url, True, args.runs, headless),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import { insertUserSchema, insertEmpresaSchema, insertColetaSchema, insertOrdemC
 import { z } from "zod";
 import { DOMParser } from "@xmldom/xmldom";
 import { or, ilike, desc } from "drizzle-orm";
+import { xmlFetchWorker } from "./xml-fetch-worker";
 
 interface AuthenticatedRequest extends Request {
   user?: {
@@ -53,55 +54,17 @@ export function registerLogisticsRoutes(app: Express) {
 
       console.log(`Iniciando automação para buscar XML da chave: ${chaveNotaFiscal}`);
       
-      // Execute Python scraper
-      const { spawn } = require('child_process');
-      const pythonProcess = spawn('python3', [
-        '/home/runner/workspace/server/xml_scraper.py',
-        chaveNotaFiscal
-      ]);
-
-      let outputData = '';
-      let errorData = '';
-
-      pythonProcess.stdout.on('data', (data: Buffer) => {
-        outputData += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data: Buffer) => {
-        errorData += data.toString();
-        console.error('Python stderr:', data.toString());
-      });
-
-      pythonProcess.on('close', (code: number) => {
-        if (code === 0) {
-          try {
-            const result = JSON.parse(outputData);
-            res.json(result);
-          } catch (parseError) {
-            console.error('Erro ao fazer parse do resultado do Python:', parseError);
-            res.status(500).json({
-              success: false,
-              error: 'Erro ao processar resposta do automação'
-            });
-          }
-        } else {
-          console.error('Python process failed with code:', code);
-          console.error('Error output:', errorData);
-          res.status(500).json({
-            success: false,
-            error: 'Erro durante a automação. Tente novamente.'
-          });
-        }
-      });
+      // Busca via worker Python residente (sem spawn por requisição)
+      const result = await xmlFetchWorker.fetch(chaveNotaFiscal, 60000); // 60 seconds timeout
 
-      // Set timeout for the automation
-      setTimeout(() => {
-        pythonProcess.kill();
-        res.status(408).json({
+      if (result.timeout) {
+        return res.status(408).json({
           success: false,
-          error: 'Timeout na automação. O processo demorou mais que o esperado.'
+          error: result.error
         });
-      }, 60000); // 60 seconds timeout
+      }
+
+      res.json(result);
 
     } catch (error) {
       console.error('Erro no endpoint de busca XML:', error);
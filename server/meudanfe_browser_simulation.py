@@ -6,6 +6,9 @@ import time
 import re
 from urllib.parse import quote, unquote
 import base64
+from http_session import create_session
+from xml_stream_extractor import extract_xml, xml_text, body_contains, body_contains_any
+from nfe_access_key import validate_nfe_key
 
 def simulate_browser_behavior(invoice_key):
     """
@@ -13,21 +16,10 @@ def simulate_browser_behavior(invoice_key):
     baseado nas imagens fornecidas pelo usuário
     """
     
-    session = requests.Session()
-    
     # Headers que simulam um navegador real
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    session = create_session("browser", headers={
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
         'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Sec-Fetch-User': '?1',
         'Cache-Control': 'max-age=0'
     })
     
@@ -70,23 +62,23 @@ def simulate_browser_behavior(invoice_key):
         if consultation_response.status_code == 200:
             print("Consulta executada com sucesso")
             
-            # Verifica se a resposta contém dados da NFe
-            response_text = consultation_response.text.lower()
+            # Verifica se a resposta contém dados da NFe (busca nos bytes, sem decodificar a página)
+            page = consultation_response.content
             
-            if invoice_key in consultation_response.text:
+            if body_contains(page, invoice_key):
                 print("NFe encontrada na resposta!")
                 
                 # Procura por indicadores de sucesso
                 success_indicators = ['sucesso', 'encontrada', 'autorizada', 'válida', 'dados gerais']
-                if any(indicator in response_text for indicator in success_indicators):
+                if body_contains_any(page, *success_indicators, ignore_case=True):
                     print("Dados da NFe disponíveis")
                     
                     # Passo 5: Procura pelo botão "Baixar XML"
-                    if 'baixar xml' in response_text or 'download' in response_text:
+                    if body_contains_any(page, 'baixar xml', 'download', ignore_case=True):
                         print("Botão de download encontrado")
                         
                         # Extrai o link de download do XML
-                        xml_download_url = extract_xml_download_url(consultation_response.text, invoice_key)
+                        xml_download_url = extract_xml_download_url(page, invoice_key)
                         
                         if xml_download_url:
                             print(f"Baixando XML de: {xml_download_url}")
@@ -99,20 +91,18 @@ def simulate_browser_behavior(invoice_key):
                             
                             xml_response = session.get(xml_download_url, timeout=20)
                             
-                            if xml_response.status_code == 200:
-                                xml_content = xml_response.text.strip()
-                                
-                                # Valida se é um XML válido
-                                if xml_content.startswith('<?xml') and invoice_key in xml_content:
-                                    print("XML baixado com sucesso!")
-                                    return {
-                                        "success": True,
-                                        "xml_content": xml_content,
-                                        "message": "XML baixado automaticamente do meudanfe.com.br"
-                                    }
+                            # Valida se é um XML válido antes de decodificar
+                            xml_bytes = xml_response.content.strip()
+                            if xml_response.status_code == 200 and xml_bytes.startswith(b'<?xml') and body_contains(xml_bytes, invoice_key):
+                                print("XML baixado com sucesso!")
+                                return {
+                                    "success": True,
+                                    "xml_content": xml_text(xml_bytes),
+                                    "message": "XML baixado automaticamente do meudanfe.com.br"
+                                }
                     
                     # Se não conseguiu baixar, tenta extrair dados da página
-                    extracted_data = extract_nfe_data_from_page(consultation_response.text, invoice_key)
+                    extracted_data = extract_nfe_data_from_page(page, invoice_key)
                     if extracted_data:
                         return {
                             "success": True,
@@ -134,7 +124,7 @@ def simulate_browser_behavior(invoice_key):
                     }
             
             # NFe não encontrada
-            error_message = extract_error_from_page(consultation_response.text)
+            error_message = extract_error_from_page(consultation_response.content)
             return {
                 "success": False,
                 "error": error_message or "NFe não encontrada no sistema",
@@ -154,8 +144,8 @@ def simulate_browser_behavior(invoice_key):
     except Exception as e:
         return create_general_error_response(str(e))
 
-def extract_xml_download_url(html_content, invoice_key):
-    """Extrai URL de download do XML da página"""
+def extract_xml_download_url(content, invoice_key):
+    """Extrai URL de download do XML do corpo bruto da página"""
     try:
         # Padrões para encontrar links de download
         download_patterns = [
@@ -167,10 +157,10 @@ def extract_xml_download_url(html_content, invoice_key):
         ]
         
         for pattern in download_patterns:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
+            matches = re.findall(pattern.encode('ascii'), content, re.IGNORECASE)
             for match in matches:
                 if match:
-                    url = match.strip()
+                    url = match.strip().decode('utf-8', errors='replace')
                     if url.startswith('/'):
                         return f'https://meudanfe.com.br{url}'
                     elif url.startswith('http'):
@@ -186,9 +176,9 @@ def extract_xml_download_url(html_content, invoice_key):
         ]
         
         for pattern in js_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
+            match = re.search(pattern.encode('ascii'), content, re.IGNORECASE)
             if match:
-                url_part = match.group(1)
+                url_part = match.group(1).decode('utf-8', errors='replace')
                 if invoice_key in url_part or 'xml' in url_part.lower():
                     if url_part.startswith('/'):
                         return f'https://meudanfe.com.br{url_part}'
@@ -199,23 +189,13 @@ def extract_xml_download_url(html_content, invoice_key):
     
     return None
 
-def extract_nfe_data_from_page(html_content, invoice_key):
-    """Extrai dados XML embutidos na página"""
+def extract_nfe_data_from_page(content, invoice_key):
+    """Extrai dados XML embutidos na página (bytes); só o trecho do XML é decodificado"""
     try:
-        # Procura por XML completo na página
-        xml_patterns = [
-            r'<\?xml[^>]*>.*?</nfeProc>',
-            r'<\?xml[^>]*>.*?</NFe>',
-            r'<nfeProc[^>]*>.*?</nfeProc>',
-            r'<NFe[^>]*>.*?</NFe>'
-        ]
-        
-        for pattern in xml_patterns:
-            match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-            if match and invoice_key in match.group(0):
-                xml_content = match.group(0)
-                if len(xml_content) > 2000:  # XML válido deve ter tamanho significativo
-                    return xml_content
+        # Procura por XML completo na página (uma passada, sem regex sobre o HTML inteiro)
+        xml_content = extract_xml(content, invoice_key, min_length=2000)
+        if xml_content:
+            return xml_content
         
         # Procura por dados em JavaScript
         js_data_patterns = [
@@ -225,10 +205,10 @@ def extract_nfe_data_from_page(html_content, invoice_key):
         ]
         
         for pattern in js_data_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
-            if match:
-                data = match.group(1)
-                if invoice_key in data and len(data) > 1000:
+            match = re.search(pattern.encode('ascii'), content, re.IGNORECASE)
+            if match and len(match.group(1)) > 1000 and body_contains(match.group(1), invoice_key):
+                data = xml_text(match.group(1))
+                if data:
                     # Decodifica possíveis escapes
                     data = data.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
                     if data.startswith('<?xml') or '<NFe' in data:
@@ -239,8 +219,8 @@ def extract_nfe_data_from_page(html_content, invoice_key):
     
     return None
 
-def extract_error_from_page(html_content):
-    """Extrai mensagem de erro da página"""
+def extract_error_from_page(content):
+    """Extrai mensagem de erro do corpo bruto da página"""
     try:
         error_patterns = [
             r'<div[^>]*class="[^"]*erro[^"]*"[^>]*>([^<]+)</div>',
@@ -254,12 +234,12 @@ def extract_error_from_page(html_content):
         ]
         
         for pattern in error_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
+            match = re.search(pattern.encode('utf-8'), content, re.IGNORECASE)
             if match:
                 if len(match.groups()) > 0:
-                    return match.group(1).strip()
+                    return match.group(1).strip().decode('utf-8', errors='replace')
                 else:
-                    return match.group(0).strip()
+                    return match.group(0).strip().decode('utf-8', errors='replace')
     
     except Exception:
         pass
@@ -298,16 +278,6 @@ def create_general_error_response(error_msg):
         ]
     }
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def main():
     """Ponto de entrada"""
     if len(sys.argv) != 2:
@@ -6,6 +6,13 @@ import time
 import re
 from urllib.parse import urlencode, quote
 from bs4 import BeautifulSoup
+from http_session import create_session
+from xml_stream_extractor import extract_xml, xml_text, body_contains, body_contains_any
+from nfe_access_key import validate_nfe_key
+
+# O meudanfe.com.br serve UTF-8: o BeautifulSoup recebe os bytes com esse
+# encoding em vez de detectá-lo sobre a página inteira
+PAGE_ENCODING = 'utf-8'
 
 def simulate_exact_meudanfe_flow(invoice_key):
     """
@@ -18,19 +25,7 @@ def simulate_exact_meudanfe_flow(invoice_key):
     6. Captura conteúdo XML
     """
     
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0'
-    })
+    session = create_session("browser", headers={'Cache-Control': 'max-age=0'})
     
     try:
         print(f"Passo 1: Acessando meudanfe.com.br...")
@@ -69,29 +64,29 @@ def simulate_exact_meudanfe_flow(invoice_key):
             print("Busca executada com sucesso, processando resultados...")
             
             # Verifica se a resposta contém dados da NFe
-            if invoice_key in search_response.text and ('Sucesso' in search_response.text or 'sucesso' in search_response.text):
+            if body_contains(search_response, invoice_key) and body_contains_any(search_response, 'Sucesso', 'sucesso'):
                 print("NFe encontrada! Dados disponíveis na página")
                 
                 # Passo 4: Procura pelo botão "Baixar XML" na resposta
-                if 'Baixar XML' in search_response.text or 'baixar-xml' in search_response.text:
+                if body_contains_any(search_response, 'Baixar XML', 'baixar-xml'):
                     print("Botão 'Baixar XML' encontrado, simulando clique...")
                     
                     # Passo 5: Simula clique no botão "Baixar XML"
-                    xml_download_url = extract_xml_download_link(search_response.text, invoice_key)
+                    xml_download_url = extract_xml_download_link(search_response.content, invoice_key)
                     
                     if xml_download_url:
                         xml_response = session.get(xml_download_url, timeout=15)
                         
-                        if xml_response.status_code == 200 and xml_response.text.strip().startswith('<?xml'):
+                        if xml_response.status_code == 200 and xml_response.content.lstrip().startswith(b'<?xml'):
                             print("XML baixado com sucesso!")
                             return {
                                 "success": True,
-                                "xml_content": xml_response.text,
+                                "xml_content": xml_text(xml_response.content),
                                 "message": "XML obtido via automação do fluxo exato do meudanfe.com.br"
                             }
                     
                     # Alternativa: tenta extrair XML diretamente da página de resultados
-                    xml_from_page = extract_xml_from_results_page(search_response.text, invoice_key)
+                    xml_from_page = extract_xml_from_results_page(search_response.content, invoice_key)
                     if xml_from_page:
                         print("XML extraído da página de resultados!")
                         return {
@@ -115,7 +110,7 @@ def simulate_exact_meudanfe_flow(invoice_key):
             
             else:
                 # Verifica se há alguma mensagem de erro específica
-                error_msg = extract_error_message(search_response.text)
+                error_msg = extract_error_message(search_response.content)
                 return {
                     "success": False,
                     "error": error_msg or "NFe não encontrada no sistema",
@@ -156,10 +151,10 @@ def simulate_exact_meudanfe_flow(invoice_key):
             ]
         }
 
-def extract_xml_download_link(html_content, invoice_key):
-    """Extrai o link de download do XML da página de resultados"""
+def extract_xml_download_link(content, invoice_key):
+    """Extrai o link de download do XML do corpo bruto da página de resultados"""
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(content, 'html.parser', from_encoding=PAGE_ENCODING)
         
         # Procura por links que contenham "xml" e a chave da NFe
         xml_links = soup.find_all('a', href=True)
@@ -185,9 +180,9 @@ def extract_xml_download_link(html_content, invoice_key):
         ]
         
         for pattern in patterns:
-            match = re.search(pattern, html_content)
+            match = re.search(pattern.encode('ascii'), content)
             if match:
-                found_url = match.group(0)
+                found_url = match.group(0).decode('utf-8', errors='replace')
                 if found_url.startswith('/'):
                     return f'https://meudanfe.com.br{found_url}'
                 return found_url
@@ -197,23 +192,13 @@ def extract_xml_download_link(html_content, invoice_key):
     
     return None
 
-def extract_xml_from_results_page(html_content, invoice_key):
-    """Extrai XML diretamente da página de resultados se estiver embutido"""
+def extract_xml_from_results_page(content, invoice_key):
+    """Extrai XML diretamente da página de resultados (bytes) se estiver embutido"""
     try:
-        # Procura por XML embutido na página
-        xml_patterns = [
-            r'<\?xml[^>]*>.*?</nfeProc>',
-            r'<\?xml[^>]*>.*?</NFe>',
-            r'<nfeProc[^>]*>.*?</nfeProc>',
-            r'<NFe[^>]*>.*?</NFe>'
-        ]
-        
-        for pattern in xml_patterns:
-            match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-            if match and invoice_key in match.group(0):
-                xml_content = match.group(0)
-                if len(xml_content) > 1000:  # XML válido deve ter tamanho mínimo
-                    return xml_content
+        # Procura por XML embutido na página (uma passada, sem regex sobre o HTML inteiro)
+        xml_content = extract_xml(content, invoice_key, min_length=1000)
+        if xml_content:
+            return xml_content
         
         # Procura por XML em elementos JavaScript ou hidden
         script_patterns = [
@@ -223,19 +208,19 @@ def extract_xml_from_results_page(html_content, invoice_key):
         ]
         
         for pattern in script_patterns:
-            match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-            if match and invoice_key in match.group(1):
-                return match.group(1)
+            match = re.search(pattern.encode('ascii'), content, re.DOTALL | re.IGNORECASE)
+            if match and invoice_key.encode('ascii') in match.group(1):
+                return xml_text(match.group(1))
     
     except Exception as e:
         print(f"Erro ao extrair XML da página: {e}")
     
     return None
 
-def extract_error_message(html_content):
-    """Extrai mensagem de erro específica da página"""
+def extract_error_message(content):
+    """Extrai mensagem de erro específica do corpo bruto da página"""
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(content, 'html.parser', from_encoding=PAGE_ENCODING)
         
         # Procura por elementos comuns de erro
         error_selectors = [
@@ -254,11 +239,11 @@ def extract_error_message(html_content):
                     return error_text
         
         # Procura por texto de erro comum
-        if 'não encontrada' in html_content.lower():
+        if body_contains_any(content, 'não encontrada', ignore_case=True):
             return "NFe não encontrada no sistema"
-        elif 'inválida' in html_content.lower():
+        elif body_contains_any(content, 'inválida', ignore_case=True):
             return "Chave NFe inválida"
-        elif 'indisponível' in html_content.lower():
+        elif body_contains_any(content, 'indisponível', ignore_case=True):
             return "Serviço temporariamente indisponível"
     
     except Exception:
@@ -266,16 +251,6 @@ def extract_error_message(html_content):
     
     return None
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def execute_meudanfe_exact_flow(invoice_key):
     """Função principal que executa o fluxo exato"""
     
@@ -1,18 +1,13 @@
 #!/usr/bin/env python3
-import requests
 from bs4 import BeautifulSoup
 import json
 import sys
+from http_session import create_session
 
 def analyze_meudanfe_form():
     """Analisa o formulário real do meudanfe.com.br"""
     
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-    })
+    session = create_session("browser")
     
     try:
         print("Analisando estrutura do meudanfe.com.br...")
@@ -1,38 +1,17 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote, urlencode
 from bs4 import BeautifulSoup
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+import http_session
+from xml_stream_extractor import extract_xml, xml_text, body_contains
+from nfe_access_key import validate_nfe_key
 
 def create_session():
-    """Create a requests session with proper headers"""
-    session = requests.Session()
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none'
-    }
-    
-    session.headers.update(headers)
-    return session
+    """Create a requests session with proper headers (pooled connections)"""
+    return http_session.create_session("browser")
 
 def try_meudanfe_direct_access(session, invoice_key):
     """Try direct access to meudanfe.com.br"""
@@ -69,23 +48,17 @@ def try_meudanfe_direct_access(session, invoice_key):
                 response = session.get(url, timeout=12)
                 
                 if response.status_code == 200:
-                    content = response.text
-                    
                     # Check for XML content in response
-                    if invoice_key in content and '<?xml' in content:
-                        xml_start = content.find('<?xml')
-                        xml_end = content.find('</nfeProc>', xml_start)
-                        if xml_end == -1:
-                            xml_end = content.find('</NFe>', xml_start)
-                        
-                        if xml_end != -1:
-                            xml_content = content[xml_start:xml_end + 10]
-                            if len(xml_content) > 1000:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": f"XML obtido via {url}"
-                                }
+                    if body_contains(response, invoice_key, '<?xml'):
+                        xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                        if xml_content:
+                            return {
+                                "success": True,
+                                "xml_content": xml_content,
+                                "message": f"XML obtido via {url}"
+                            }
+                    
+                    content = response.text
                     
                     # Check for download links
                     soup = BeautifulSoup(content, 'html.parser')
@@ -102,13 +75,12 @@ def try_meudanfe_direct_access(session, invoice_key):
                             
                             try:
                                 download_response = session.get(href, timeout=10)
-                                if download_response.status_code == 200 and invoice_key in download_response.text:
-                                    if '<?xml' in download_response.text:
-                                        return {
-                                            "success": True,
-                                            "xml_content": download_response.text,
-                                            "message": f"XML baixado via {href}"
-                                        }
+                                if download_response.status_code == 200 and body_contains(download_response, invoice_key, '<?xml'):
+                                    return {
+                                        "success": True,
+                                        "xml_content": xml_text(download_response.content),
+                                        "message": f"XML baixado via {href}"
+                                    }
                             except:
                                 continue
                 
@@ -186,22 +158,14 @@ def try_meudanfe_form_submission(session, invoice_key):
                         response = session.get(submit_url, params=form_data, timeout=15)
                     
                     if response.status_code == 200:
-                        content = response.text
-                        
-                        if invoice_key in content and '<?xml' in content:
-                            xml_start = content.find('<?xml')
-                            xml_end = content.find('</nfeProc>', xml_start)
-                            if xml_end == -1:
-                                xml_end = content.find('</NFe>', xml_start)
-                            
-                            if xml_end != -1:
-                                xml_content = content[xml_start:xml_end + 10]
-                                if len(xml_content) > 1000:
-                                    return {
-                                        "success": True,
-                                        "xml_content": xml_content,
-                                        "message": "XML obtido via formulário meudanfe.com.br"
-                                    }
+                        if body_contains(response, invoice_key, '<?xml'):
+                            xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                            if xml_content:
+                                return {
+                                    "success": True,
+                                    "xml_content": xml_content,
+                                    "message": "XML obtido via formulário meudanfe.com.br"
+                                }
                 
                 except Exception as e:
                     print(f"Erro ao submeter formulário: {e}")
@@ -230,23 +194,15 @@ def try_meudanfe_api_endpoints(session, invoice_key):
             response = session.get(endpoint, timeout=12)
             
             if response.status_code == 200:
-                content = response.text
-                
                 # Check for XML content
-                if invoice_key in content and '<?xml' in content:
-                    xml_start = content.find('<?xml')
-                    xml_end = content.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = content.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = content[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML obtido via API: {endpoint}"
-                            }
+                if body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": f"XML obtido via API: {endpoint}"
+                        }
                 
                 # Check for JSON response with XML
                 try:
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote
+from http_session import create_session
+from xml_stream_extractor import extract_xml, fetch_xml, xml_text, body_contains, body_contains_any
+from nfe_access_key import validate_nfe_key
 
 def execute_meudanfe_javascript_flow(invoice_key):
     """
@@ -12,11 +14,7 @@ def execute_meudanfe_javascript_flow(invoice_key):
     baseado no fluxo real observado nas imagens do usuário
     """
     
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+    session = create_session("ajax", headers={
         'Content-Type': 'application/json',
         'Origin': 'https://meudanfe.com.br',
         'Referer': 'https://meudanfe.com.br/'
@@ -75,21 +73,21 @@ def execute_meudanfe_javascript_flow(invoice_key):
                         
                         # Se retornou URL de download
                         if result.get('download_url'):
-                            xml_response = session.get(result['download_url'], timeout=15)
-                            if xml_response.status_code == 200 and xml_response.text.startswith('<?xml'):
+                            xml_content = fetch_xml(session, result['download_url'])
+                            if xml_content:
                                 return {
                                     "success": True,
-                                    "xml_content": xml_response.text,
+                                    "xml_content": xml_content,
                                     "message": "XML baixado via URL do meudanfe.com.br"
                                 }
                     
                     # Verifica se a resposta HTML contém dados da NFe
-                    if response.text and invoice_key in response.text:
-                        if 'Sucesso' in response.text or 'sucesso' in response.text:
+                    if body_contains(response, invoice_key):
+                        if body_contains_any(response, 'Sucesso', 'sucesso'):
                             print("NFe encontrada na resposta HTML")
                             
                             # Procura por XML na resposta
-                            xml_content = extract_xml_from_response(response.text, invoice_key)
+                            xml_content = extract_xml_from_response(response.content, invoice_key)
                             if xml_content:
                                 return {
                                     "success": True,
@@ -98,13 +96,13 @@ def execute_meudanfe_javascript_flow(invoice_key):
                                 }
                             
                             # Se não encontrou XML mas encontrou a NFe, tenta buscar link de download
-                            download_link = extract_download_link(response.text, invoice_key)
+                            download_link = extract_download_link(response.content, invoice_key)
                             if download_link:
-                                xml_response = session.get(download_link, timeout=15)
-                                if xml_response.status_code == 200 and xml_response.text.startswith('<?xml'):
+                                xml_content = fetch_xml(session, download_link)
+                                if xml_content:
                                     return {
                                         "success": True,
-                                        "xml_content": xml_response.text,
+                                        "xml_content": xml_content,
                                         "message": "XML baixado via link extraído"
                                     }
                 
@@ -127,9 +125,9 @@ def execute_meudanfe_javascript_flow(invoice_key):
                 print(f"Tentando URL direta: {url}")
                 response = session.get(url, timeout=15)
                 
-                if response.status_code == 200 and invoice_key in response.text:
-                    if 'Sucesso' in response.text or 'xml' in response.text.lower():
-                        xml_content = extract_xml_from_response(response.text, invoice_key)
+                if response.status_code == 200 and body_contains(response, invoice_key):
+                    if body_contains_any(response, 'Sucesso') or body_contains_any(response, 'xml', ignore_case=True):
+                        xml_content = extract_xml_from_response(response.content, invoice_key)
                         if xml_content:
                             return {
                                 "success": True,
@@ -138,10 +136,10 @@ def execute_meudanfe_javascript_flow(invoice_key):
                             }
                         
                         # Se é uma página de download direto
-                        if response.text.startswith('<?xml'):
+                        if response.content.startswith(b'<?xml'):
                             return {
                                 "success": True,
-                                "xml_content": response.text,
+                                "xml_content": xml_text(response.content),
                                 "message": "XML baixado diretamente"
                             }
                 
@@ -173,48 +171,23 @@ def execute_meudanfe_javascript_flow(invoice_key):
             ]
         }
 
-def extract_xml_from_response(html_content, invoice_key):
-    """Extrai XML da resposta HTML"""
+def extract_xml_from_response(content, invoice_key):
+    """Extrai XML do corpo bruto da resposta (só o trecho do XML é decodificado)"""
     try:
-        # Padrões para encontrar XML
-        xml_patterns = [
-            r'<\?xml[^>]*>.*?</nfeProc>',
-            r'<\?xml[^>]*>.*?</NFe>',
-            r'<nfeProc[^>]*>.*?</nfeProc>',
-            r'<NFe[^>]*>.*?</NFe>'
-        ]
-        
-        for pattern in xml_patterns:
-            match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-            if match and invoice_key in match.group(0):
-                xml_content = match.group(0)
-                if len(xml_content) > 1000:  # XML válido deve ter tamanho mínimo
-                    return xml_content
-        
-        # Procura por XML em elementos JavaScript ou dados JSON
-        js_patterns = [
-            rf'xmlContent["\']?\s*[:=]\s*["\']([^"\']+)["\']',
-            rf'xml_data["\']?\s*[:=]\s*["\']([^"\']+)["\']',
-            rf'"xml"\s*:\s*"([^"]+)"'
-        ]
-        
-        for pattern in js_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
-            if match:
-                xml_candidate = match.group(1)
-                if invoice_key in xml_candidate and len(xml_candidate) > 500:
-                    # Decodifica possíveis escapes
-                    xml_candidate = xml_candidate.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
-                    if xml_candidate.startswith('<?xml') or xml_candidate.startswith('<nfeProc') or xml_candidate.startswith('<NFe'):
-                        return xml_candidate
+        # XML válido deve ter tamanho mínimo
+        xml_content = extract_xml(content, invoice_key, min_length=1000)
+        if xml_content and '\\"' in xml_content:
+            # XML embutido em elementos JavaScript ou dados JSON: decodifica escapes
+            xml_content = xml_content.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
+        return xml_content
     
     except Exception as e:
         print(f"Erro ao extrair XML: {e}")
     
     return None
 
-def extract_download_link(html_content, invoice_key):
-    """Extrai link de download da resposta"""
+def extract_download_link(content, invoice_key):
+    """Extrai link de download do corpo bruto da resposta"""
     try:
         # Padrões para links de download
         link_patterns = [
@@ -224,9 +197,9 @@ def extract_download_link(html_content, invoice_key):
         ]
         
         for pattern in link_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
+            match = re.search(pattern.encode('ascii'), content, re.IGNORECASE)
             if match:
-                link = match.group(1)
+                link = match.group(1).decode('utf-8', errors='replace')
                 if link.startswith('/'):
                     return f'https://meudanfe.com.br{link}'
                 elif link.startswith('http'):
@@ -239,16 +212,6 @@ def extract_download_link(html_content, invoice_key):
     
     return None
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def main():
     """Ponto de entrada"""
     if len(sys.argv) != 2:
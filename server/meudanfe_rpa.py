@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
-import time
 import os
 import re
 from selenium import webdriver
@@ -14,6 +12,15 @@ from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
+from http_session import shared_session
+from download_watcher import wait_for_file
+from browser_waits import wait_for_search_result, search_state
+from selector_probe import find_first
+from xml_stream_extractor import extract_xml, body_contains
+from nfe_access_key import validate_nfe_key
+
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("browser")
 
 def setup_chrome_driver():
     """Setup Chrome driver with optimized options for Replit"""
@@ -79,9 +86,6 @@ def access_meudanfe_site(driver, invoice_key):
         # Navigate to meudanfe.com.br
         driver.get("https://meudanfe.com.br")
         
-        # Wait for page to load
-        wait = WebDriverWait(driver, 20)
-        
         # Look for NFe consultation section or search field
         search_selectors = [
             "input[placeholder*='chave']",
@@ -93,14 +97,7 @@ def access_meudanfe_site(driver, invoice_key):
             "input[class*='search']"
         ]
         
-        search_input = None
-        for selector in search_selectors:
-            try:
-                search_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                print(f"Encontrado campo de busca: {selector}")
-                break
-            except TimeoutException:
-                continue
+        search_input = find_first(driver, "input", search_selectors, timeout=20, visible=False)
         
         if not search_input:
             # Try alternative approach - look for any input field
@@ -128,15 +125,9 @@ def access_meudanfe_site(driver, invoice_key):
             ".search-btn"
         ]
         
-        search_button = None
-        for selector in button_selectors:
-            try:
-                search_button = driver.find_element(By.CSS_SELECTOR, selector)
-                if search_button.is_displayed():
-                    break
-            except:
-                continue
+        search_button = find_first(driver, "search", button_selectors)
         
+        before = search_state(driver)
         if search_button:
             search_button.click()
         else:
@@ -144,7 +135,7 @@ def access_meudanfe_site(driver, invoice_key):
             search_input.send_keys(Keys.RETURN)
         
         # Wait for results
-        time.sleep(5)
+        wait_for_search_result(driver, before)
         
         # Look for download links or XML content
         download_selectors = [
@@ -156,19 +147,11 @@ def access_meudanfe_site(driver, invoice_key):
             ".xml-download"
         ]
         
-        download_link = None
-        for selector in download_selectors:
-            try:
-                download_link = driver.find_element(By.CSS_SELECTOR, selector)
-                if download_link.is_displayed():
-                    break
-            except:
-                continue
+        download_link = find_first(driver, "download", download_selectors)
         
         if download_link:
             # Click download link
             download_link.click()
-            time.sleep(3)
             
             # Check if file was downloaded
             return check_downloaded_xml(invoice_key)
@@ -201,31 +184,18 @@ def check_downloaded_xml(invoice_key):
     download_dir = "/tmp/xml_downloads"
     
     try:
-        # Wait for download to complete
-        time.sleep(5)
+        # Wait for the download to complete (returns as soon as the file lands)
+        xml_file = wait_for_file(download_dir, invoice_key, timeout=10)
         
-        # Look for XML files in download directory
-        if os.path.exists(download_dir):
-            files = os.listdir(download_dir)
+        if xml_file:
+            with open(xml_file, 'r', encoding='utf-8') as f:
+                xml_content = f.read()
             
-            for filename in files:
-                if filename.endswith('.xml'):
-                    file_path = os.path.join(download_dir, filename)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            xml_content = f.read()
-                        
-                        # Verify the XML contains the correct invoice key
-                        if invoice_key in xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML baixado via meudanfe.com.br: {filename}"
-                            }
-                    except Exception as e:
-                        print(f"Erro ao ler arquivo {filename}: {e}")
-                        continue
+            return {
+                "success": True,
+                "xml_content": xml_content,
+                "message": f"XML baixado via meudanfe.com.br: {os.path.basename(xml_file)}"
+            }
         
         return {"success": False, "error": "Arquivo XML não foi baixado ou não contém a chave correta"}
         
@@ -251,26 +221,17 @@ def try_alternative_meudanfe_access(invoice_key):
         
         for url in api_urls:
             try:
-                response = requests.get(url, headers=headers, timeout=15)
+                response = session.get(url, headers=headers, timeout=15)
                 
-                if response.status_code == 200:
-                    content = response.text
-                    
-                    # Check for XML content
-                    if invoice_key in content and '<?xml' in content:
-                        xml_start = content.find('<?xml')
-                        xml_end = content.find('</nfeProc>', xml_start)
-                        if xml_end == -1:
-                            xml_end = content.find('</NFe>', xml_start)
-                        
-                        if xml_end != -1:
-                            xml_content = content[xml_start:xml_end + 10]
-                            if len(xml_content) > 1000:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": "XML obtido via API meudanfe.com.br"
-                                }
+                # Check for XML content
+                if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML obtido via API meudanfe.com.br"
+                        }
             
             except Exception as e:
                 print(f"Erro API {url}: {e}")
@@ -286,8 +247,9 @@ def get_xml_from_meudanfe(invoice_key):
     """Main function to get XML from meudanfe.com.br"""
     
     # Validate invoice key
-    if not invoice_key or len(invoice_key) != 44 or not invoice_key.isdigit():
-        return {"success": False, "error": "Chave NFe deve ter 44 dígitos numéricos"}
+    is_valid, message = validate_nfe_key(invoice_key)
+    if not is_valid:
+        return {"success": False, "error": message}
     
     print(f"Iniciando automação meudanfe.com.br para chave: {invoice_key}")
     
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Decodificação e validação da chave de acesso da NF-e / NFC-e (44 dígitos)
+Confere o dígito verificador (cDV, módulo 11) e separa os campos da chave,
+de modo que um dígito digitado errado é recusado antes de qualquer acesso à
+rede, e a UF e o modelo decodificados escolhem a fonte de consulta.
+validate_nfe_key registra o span "validation" (fetch_metrics).
+
+Layout da chave:
+    cUF(2) AAMM(4) CNPJ(14) mod(2) serie(3) nNF(9) tpEmis(1) cNF(8) cDV(1)
+
+Uso:
+    is_valid, message = validate_nfe_key(chave)    # (bool, mensagem)
+    uf = get_uf_from_key(chave)                    # 'SP' ou None
+
+    key = decode_key(chave)                        # AccessKey ou InvalidAccessKey
+    if key.is_nfce:
+        ...
+
+    columns = decode_batch(chaves)                 # importação em massa (NumPy)
+    columns["uf"][columns["valida"]]
+
+Benchmark (lote NumPy x validate_nfe_key + get_uf_from_key chave a chave):
+    python3 nfe_access_key.py --keys 50000
+"""
+
+from fetch_metrics import span
+
+UF_CODES = {
+    '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
+    '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
+    '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
+    '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
+}
+
+MODEL_NFE = '55'
+MODEL_NFCE = '65'
+MODELS = {MODEL_NFE: 'NF-e', MODEL_NFCE: 'NFC-e'}
+
+KEY_LENGTH = 44
+
+# Pesos do módulo 11, aplicados da direita para a esquerda sobre os 43 dígitos
+_WEIGHTS = [2, 3, 4, 5, 6, 7, 8, 9] * 6
+_WEIGHTS = _WEIGHTS[:KEY_LENGTH - 1][::-1]
+
+
+class InvalidAccessKey(ValueError):
+    """Chave de acesso malformada, com UF/modelo inexistente ou cDV errado"""
+
+
+class AccessKey:
+    __slots__ = ('key', 'cuf', 'uf', 'ano', 'mes', 'cnpj', 'modelo', 'serie', 'numero',
+                 'tp_emis', 'cnf', 'cdv')
+
+    def __init__(self, key):
+        self.key = key
+        self.cuf = key[0:2]
+        self.uf = UF_CODES.get(self.cuf)
+        self.ano = 2000 + int(key[2:4])
+        self.mes = int(key[4:6])
+        self.cnpj = key[6:20]
+        self.modelo = key[20:22]
+        self.serie = key[22:25]
+        self.numero = key[25:34]
+        self.tp_emis = key[34]
+        self.cnf = key[35:43]
+        self.cdv = key[43]
+
+    @property
+    def aamm(self):
+        return self.key[2:6]
+
+    @property
+    def is_nfce(self):
+        return self.modelo == MODEL_NFCE
+
+    def to_dict(self):
+        return {
+            "chave": self.key, "cuf": self.cuf, "uf": self.uf,
+            "ano": self.ano, "mes": self.mes, "cnpj": self.cnpj,
+            "modelo": self.modelo, "serie": self.serie, "numero": self.numero,
+            "tp_emis": self.tp_emis, "cnf": self.cnf, "cdv": self.cdv,
+        }
+
+
+def check_digit(digits):
+    """cDV (módulo 11) dos 43 primeiros dígitos da chave"""
+    total = sum(int(d) * w for d, w in zip(digits, _WEIGHTS))
+    remainder = total % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+
+def decode_key(invoice_key):
+    """
+    Decodifica e valida a chave
+
+    Returns:
+        AccessKey
+
+    Raises:
+        InvalidAccessKey: com a mensagem do primeiro problema encontrado
+    """
+    if not invoice_key or len(invoice_key) != KEY_LENGTH:
+        raise InvalidAccessKey("Chave deve ter 44 dígitos")
+    if not (invoice_key.isascii() and invoice_key.isdigit()):
+        raise InvalidAccessKey("Chave deve conter apenas números")
+
+    expected = check_digit(invoice_key[:-1])
+    if int(invoice_key[-1]) != expected:
+        raise InvalidAccessKey(f"Dígito verificador inválido (esperado {expected}); confira a chave digitada")
+    if invoice_key[0:2] not in UF_CODES:
+        raise InvalidAccessKey(f"Código de UF inválido na chave: {invoice_key[0:2]}")
+    if not 1 <= int(invoice_key[4:6]) <= 12:
+        raise InvalidAccessKey(f"Mês de emissão inválido na chave: {invoice_key[4:6]}")
+    if invoice_key[20:22] not in MODELS:
+        raise InvalidAccessKey(f"Modelo {invoice_key[20:22]} não é NF-e (55) nem NFC-e (65)")
+
+    return AccessKey(invoice_key)
+
+
+def try_decode(invoice_key):
+    """AccessKey, ou None se a chave for inválida"""
+    try:
+        return decode_key(invoice_key)
+    except InvalidAccessKey:
+        return None
+
+
+def validate_nfe_key(invoice_key):
+    """Valida a chave (formato, UF, mês, modelo e cDV); devolve (válida, mensagem)"""
+    with span("validation", chave=invoice_key) as current:
+        try:
+            decode_key(invoice_key)
+        except InvalidAccessKey as e:
+            current.set(status="invalid")
+            return False, str(e)
+    return True, "Chave válida"
+
+
+def get_uf_from_key(invoice_key):
+    """Sigla da UF emitente, ou None se a chave for inválida"""
+    key = try_decode(invoice_key)
+    return key.uf if key else None
+
+
+def get_model_from_key(invoice_key):
+    """'55' (NF-e), '65' (NFC-e), ou None se a chave for inválida"""
+    key = try_decode(invoice_key)
+    return key.modelo if key else None
+
+
+# Decodificação em lote: matriz uint8 (n x 44) de dígitos e colunas NumPy
+
+BATCH_COLUMNS = ('uf', 'ano', 'mes', 'cnpj', 'modelo', 'serie', 'numero', 'tp_emis',
+                 'cdv_valido', 'valida')
+
+
+def _numpy():
+    """NumPy só é importado no lote: os fetchers importam este módulo a cada chave"""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("decode_batch requer NumPy (pip install numpy)")
+    return numpy
+
+
+def _place_values(np, width):
+    return 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+
+
+def decode_batch(keys):
+    """
+    Decodifica uma lista de chaves de uma vez, em colunas
+
+    Todas as chaves viram uma matriz uint8 de dígitos (n x 44); UF, AAMM,
+    modelo, série, número e o cDV saem de operações vetorizadas sobre ela,
+    sem laço Python por chave. Chaves de tamanho errado ou com caracteres
+    não numéricos ocupam a linha com zeros e saem com valida=False.
+
+    Args:
+        keys: sequência de chaves (str)
+
+    Returns:
+        dict coluna -> numpy.ndarray de tamanho len(keys):
+            uf (str, '' se desconhecida), ano, mes, cnpj (str), modelo, serie,
+            numero, tp_emis (int), cdv_valido e valida (bool)
+    """
+    np = _numpy()
+    count = len(keys)
+    placeholder = '0' * KEY_LENGTH
+    well_formed = np.fromiter((len(k) == KEY_LENGTH for k in keys), dtype=bool, count=count)
+    text = ''.join(k if ok else placeholder for k, ok in zip(keys, well_formed))
+    # Fora do ASCII vira '?' (um byte por caractere, a matriz não desalinha)
+    raw = np.frombuffer(text.encode('ascii', errors='replace'), dtype=np.uint8)
+    raw = raw.reshape(count, KEY_LENGTH)
+
+    # Dígitos fora de '0'..'9' dão a volta no uint8 e ficam > 9
+    digits = raw - np.uint8(48)
+    numeric = well_formed & (digits <= 9).all(axis=1)
+    digits = np.where(numeric[:, None], digits, 0).astype(np.int64)
+
+    remainder = (digits[:, :KEY_LENGTH - 1] @ np.array(_WEIGHTS, dtype=np.int64)) % 11
+    expected = np.where(remainder < 2, 0, 11 - remainder)
+    cdv_valido = numeric & (expected == digits[:, KEY_LENGTH - 1])
+
+    uf_table = np.array([UF_CODES.get(f"{code:02d}", '') for code in range(100)])
+    cuf = digits[:, 0:2] @ _place_values(np, 2)
+    uf = np.where(numeric, uf_table[cuf], '')
+    ano = np.where(numeric, 2000 + digits[:, 2:4] @ _place_values(np, 2), 0)
+    mes = digits[:, 4:6] @ _place_values(np, 2)
+    modelo = digits[:, 20:22] @ _place_values(np, 2)
+    cnpj = np.ascontiguousarray(raw[:, 6:20]).view('S14').ravel().astype('U14')
+
+    valida = (cdv_valido & (uf != '') & (mes >= 1) & (mes <= 12)
+              & np.isin(modelo, [int(m) for m in MODELS]))
+
+    return {
+        'uf': uf,
+        'ano': ano,
+        'mes': mes,
+        'cnpj': np.where(numeric, cnpj, ''),
+        'modelo': modelo,
+        'serie': digits[:, 22:25] @ _place_values(np, 3),
+        'numero': digits[:, 25:34] @ _place_values(np, 9),
+        'tp_emis': digits[:, 34],
+        'cdv_valido': cdv_valido,
+        'valida': valida,
+    }
+
+
+def decode_each(keys):
+    """Mesmas colunas de decode_batch, chave a chave com AccessKey (referência de conferência)"""
+    columns = {name: [] for name in BATCH_COLUMNS}
+    for invoice_key in keys:
+        if len(invoice_key) == KEY_LENGTH and invoice_key.isascii() and invoice_key.isdigit():
+            key = AccessKey(invoice_key)
+            cdv_ok = check_digit(invoice_key[:-1]) == int(key.cdv)
+            valid = cdv_ok and key.uf is not None and 1 <= key.mes <= 12 and key.modelo in MODELS
+            values = (key.uf or '', key.ano, key.mes, key.cnpj, int(key.modelo), int(key.serie),
+                      int(key.numero), int(key.tp_emis), cdv_ok, valid)
+        else:
+            values = ('', 0, 0, '', 0, 0, 0, 0, False, False)
+        for name, value in zip(BATCH_COLUMNS, values):
+            columns[name].append(value)
+    return columns
+
+
+def sample_keys(count, invalid_ratio=0.01, seed=0):
+    """Chaves sintéticas com cDV correto; uma fração com um dígito trocado"""
+    import random
+    rng = random.Random(seed)
+    codes = sorted(UF_CODES)
+    keys = []
+    for _ in range(count):
+        body = (rng.choice(codes) + f"{rng.randint(18, 25):02d}{rng.randint(1, 12):02d}"
+                + ''.join(rng.choice('0123456789') for _ in range(14)) + rng.choice(list(MODELS))
+                + ''.join(rng.choice('0123456789') for _ in range(21)))
+        key = body + str(check_digit(body))
+        if rng.random() < invalid_ratio:
+            position = rng.randrange(35, 43)
+            key = key[:position] + str((int(key[position]) + 1) % 10) + key[position + 1:]
+        keys.append(key)
+    return keys
+
+
+def validate_each(keys):
+    """Caminho atual da importação: validate_nfe_key e get_uf_from_key por chave"""
+    return [(validate_nfe_key(invoice_key)[0], get_uf_from_key(invoice_key)) for invoice_key in keys]
+
+
+def main():
+    import json
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark da decodificação de chaves em lote")
+    parser.add_argument("--keys", type=int, default=50000, help="Quantidade de chaves (padrão: 50000)")
+    parser.add_argument("--runs", type=int, default=3, help="Repetições; vale o melhor tempo (padrão: 3)")
+    args = parser.parse_args()
+
+    try:
+        _numpy()
+    except RuntimeError as e:
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        return
+
+    keys = sample_keys(args.keys)
+
+    def best_of(function):
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            result = function(keys)
+            timings.append(time.perf_counter() - started)
+        return min(timings), result
+
+    per_key_seconds, per_key = best_of(validate_each)
+    batch_seconds, batch = best_of(decode_batch)
+    # Mesma decisão e UF que o caminho atual, e as demais colunas iguais às do AccessKey
+    batch_per_key = [(bool(valid), str(uf) if valid else None) for valid, uf in zip(batch['valida'], batch['uf'])]
+    each = decode_each(keys)
+
+    print(json.dumps({
+        "keys": args.keys,
+        "valid": int(batch['valida'].sum()),
+        "per_key_seconds": round(per_key_seconds, 4),
+        "per_key_us_per_key": round(per_key_seconds / args.keys * 1e6, 2),
+        "batch_seconds": round(batch_seconds, 4),
+        "batch_us_per_key": round(batch_seconds / args.keys * 1e6, 2),
+        "speedup": round(per_key_seconds / batch_seconds, 1),
+        "matches_per_key_path": batch_per_key == per_key,
+        "columns_match": all(list(batch[name]) == each[name] for name in BATCH_COLUMNS),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
-import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException
+from chrome_driver_pool import get_pool, release_driver
+from nfe_xml_cache import load_xml, store_xml
+from http_session import shared_session
+from browser_waits import wait_for_value, wait_for_search_result, search_state
+from selector_probe import find_first
+from xml_stream_extractor import xml_text, body_contains
+from nfe_access_key import validate_nfe_key
 
-def setup_chrome():
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("api")
+
+def create_chrome(download_dir=None):
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
@@ -20,10 +28,15 @@ def setup_chrome():
     options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
     return webdriver.Chrome(options=options)
 
+def setup_chrome():
+    """Borrow a warm Chrome instance from the shared pool"""
+    return get_pool("nfe_api_chrome", create_chrome).acquire(timeout=60)
+
 def fetch_xml_via_api(invoice_key):
     """Try to fetch XML via alternative APIs"""
-    if not invoice_key or len(invoice_key) != 44:
-        return {"success": False, "error": "Chave deve ter 44 dígitos"}
+    is_valid, message = validate_nfe_key(invoice_key)
+    if not is_valid:
+        return {"success": False, "error": message}
     
     # Try multiple API endpoints for NFe consultation
     api_endpoints = [
@@ -38,16 +51,14 @@ def fetch_xml_via_api(invoice_key):
     
     for endpoint in api_endpoints:
         try:
-            response = requests.get(endpoint, headers=headers, timeout=15)
-            if response.status_code == 200 and response.text:
-                content = response.text
-                # Validate that this is XML content and contains the invoice key
-                if '<?xml' in content and invoice_key in content:
-                    return {
-                        "success": True,
-                        "xml_content": content,
-                        "message": "XML obtido via API de consulta"
-                    }
+            response = session.get(endpoint, headers=headers, timeout=15)
+            # Validate that this is XML content and contains the invoice key
+            if response.status_code == 200 and body_contains(response, '<?xml', invoice_key):
+                return {
+                    "success": True,
+                    "xml_content": xml_text(response.content),
+                    "message": "XML obtido via API de consulta"
+                }
         except Exception as e:
             print(f"API endpoint {endpoint} failed: {e}")
             continue
@@ -65,10 +76,7 @@ def fetch_xml_improved_rpa(invoice_key):
         print(f"Accessing meudanfe.com.br for key: {invoice_key}")
         driver.get("https://meudanfe.com.br/")
         
-        wait = WebDriverWait(driver, 8)  # Reduced wait time
-        
-        # Find input field quickly
-        input_element = None
+        # Find input field quickly (one probe for all selectors, 8s total)
         input_selectors = [
             "input[placeholder*='CHAVE']",
             "input[placeholder*='chave']", 
@@ -77,12 +85,7 @@ def fetch_xml_improved_rpa(invoice_key):
             ".form-control"
         ]
         
-        for selector in input_selectors:
-            try:
-                input_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                break
-            except TimeoutException:
-                continue
+        input_element = find_first(driver, "input", input_selectors, timeout=8, visible=False)
         
         if not input_element:
             return {"success": False, "error": "Campo de entrada não encontrado rapidamente"}
@@ -90,10 +93,9 @@ def fetch_xml_improved_rpa(invoice_key):
         # Enter key and search
         input_element.clear()
         input_element.send_keys(invoice_key)
-        time.sleep(0.5)
+        wait_for_value(input_element, invoice_key, timeout=1)
         
         # Find and click search button
-        search_button = None
         search_selectors = [
             "button:contains('Buscar')",
             "input[type='submit']",
@@ -101,20 +103,12 @@ def fetch_xml_improved_rpa(invoice_key):
             ".btn-primary"
         ]
         
-        for selector in search_selectors:
-            try:
-                if 'contains' in selector:
-                    search_button = driver.find_element(By.XPATH, f"//button[contains(text(), 'Buscar')]")
-                else:
-                    search_button = driver.find_element(By.CSS_SELECTOR, selector)
-                if search_button and search_button.is_enabled():
-                    break
-            except:
-                continue
+        search_button = find_first(driver, "search", search_selectors, visible=False, enabled=True)
         
         if search_button:
+            before = search_state(driver)
             search_button.click()
-            time.sleep(3)
+            wait_for_search_result(driver, before, timeout=8)
             
             # Quick search for XML content
             xml_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '<?xml')]")
@@ -133,15 +127,22 @@ def fetch_xml_improved_rpa(invoice_key):
         return {"success": False, "error": f"Erro no RPA: {str(e)}"}
     finally:
         if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+            release_driver(driver)
 
 def get_nfe_xml(invoice_key):
     """Main function that tries multiple methods to get NFe XML"""
-    if not invoice_key or len(invoice_key) != 44:
-        return {"success": False, "error": "Chave da NFe deve ter 44 dígitos"}
+    is_valid, message = validate_nfe_key(invoice_key)
+    if not is_valid:
+        return {"success": False, "error": message}
+    
+    # NF-e autorizada é imutável: reaproveita o XML já obtido
+    cached_xml = load_xml(invoice_key)
+    if cached_xml:
+        return {
+            "success": True,
+            "xml_content": cached_xml,
+            "message": "XML obtido do cache local"
+        }
     
     print(f"Buscando XML para chave: {invoice_key}")
     
@@ -149,12 +150,14 @@ def get_nfe_xml(invoice_key):
     print("Tentando via APIs de consulta...")
     api_result = fetch_xml_via_api(invoice_key)
     if api_result and api_result.get("success"):
+        store_xml(invoice_key, api_result["xml_content"])
         return api_result
     
     # Method 2: Try improved RPA
     print("Tentando via RPA melhorado...")
     rpa_result = fetch_xml_improved_rpa(invoice_key)
     if rpa_result and rpa_result.get("success"):
+        store_xml(invoice_key, rpa_result["xml_content"])
         return rpa_result
     
     # If all methods fail
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Busca em lote de XMLs de NFe
+Recebe todas as chaves de uma ordem de carga numa única invocação, busca com
+concorrência limitada compartilhando as sessões HTTP dos serviços, e emite
+um resultado por chave (uma linha JSON) assim que ele fica pronto.
+
+Uso:
+    python3 nfe_batch_fetch.py <chave1> <chave2> ...
+    python3 nfe_batch_fetch.py --file chaves.txt --concurrency 8
+    cat chaves.txt | python3 nfe_batch_fetch.py --file -
+
+Saída (stdout, uma linha por chave, na ordem de conclusão):
+    {"invoice_key": "...", "result": {...}}
+
+O result de uma busca bem-sucedida inclui "parsed" (nfe_record_parser).
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_session
+from fetch_metrics import trace, span
+from nfe_record_parser import attach_parsed
+
+SERVICES = {
+    "consultation": ("nfe_consultation_service", "get_nfe_xml"),
+    "api": ("nfe_api_service", "get_nfe_xml"),
+    "simple": ("simple_nfe_api", "get_nfe_xml_simple"),
+}
+
+DEFAULT_CONCURRENCY = 8
+
+
+def load_service(name):
+    """Importa o módulo do serviço e devolve (módulo, função de busca)"""
+    module_name, function_name = SERVICES[name]
+    module = __import__(module_name)
+    return module, getattr(module, function_name)
+
+
+def size_session_pool(session, concurrency):
+    """Dimensiona o pool de conexões da sessão compartilhada para a concorrência do lote"""
+    if concurrency > http_session.POOL_PER_HOST:
+        http_session.mount(session, http_session.create_adapter(pool_maxsize=concurrency))
+
+
+def read_keys(args):
+    """Coleta chaves dos argumentos e/ou arquivo, sem duplicatas e na ordem original"""
+    raw = list(args.keys)
+    if args.file:
+        stream = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")
+        try:
+            raw.extend(re.split(r"[\s,;]+", stream.read()))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    keys = []
+    seen = set()
+    for key in raw:
+        key = key.strip()
+        if key and key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
+
+
+def fetch_batch(keys, fetch_function, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Busca as chaves com concorrência limitada
+
+    Yields:
+        tuple: (chave, resultado) na ordem em que cada busca termina
+    """
+    def fetch_one(key):
+        with trace(key), span("fetch") as current:
+            try:
+                return attach_parsed(fetch_function(key))
+            except Exception as e:
+                current.set(status="error")
+                return {"success": False, "error": f"Erro ao buscar XML: {str(e)}"}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(fetch_one, key): key for key in keys}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca em lote de XMLs de NFe")
+    parser.add_argument("keys", nargs="*", help="Chaves NFe (44 dígitos)")
+    parser.add_argument("--file", help="Arquivo com chaves (uma por linha); '-' para stdin")
+    parser.add_argument("--service", choices=sorted(SERVICES), default="consultation",
+                        help="Serviço usado para cada chave (padrão: consultation)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Buscas simultâneas (padrão: {DEFAULT_CONCURRENCY})")
+    args = parser.parse_args()
+
+    # Reserva stdout para os resultados; prints dos serviços vão para stderr
+    output = sys.stdout
+    sys.stdout = sys.stderr
+
+    keys = read_keys(args)
+    if not keys:
+        output.write(json.dumps({"success": False, "error": "Nenhuma chave NFe informada"}, ensure_ascii=False) + "\n")
+        sys.exit(1)
+
+    concurrency = max(1, min(args.concurrency, len(keys)))
+    module, fetch_function = load_service(args.service)
+    if hasattr(module, "session"):
+        size_session_pool(module.session, concurrency)
+
+    started = time.time()
+    succeeded = 0
+    for key, result in fetch_batch(keys, fetch_function, concurrency):
+        if result and result.get("success"):
+            succeeded += 1
+        output.write(json.dumps({"invoice_key": key, "result": result}, ensure_ascii=False) + "\n")
+        output.flush()
+
+    print(f"Lote concluído: {succeeded}/{len(keys)} XMLs em {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
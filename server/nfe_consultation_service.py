@@ -1,35 +1,22 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 from urllib.parse import quote
 import xml.etree.ElementTree as ET
+from strategy_racer import race_strategies
+from strategy_stats import order_strategies, record_outcome
+from nfe_xml_cache import load_xml, store_xml
+from http_session import shared_session
+from xml_stream_extractor import xml_text, extract_xml, body_contains
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format and structure"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    
-    return True, "Chave válida"
-
-def extract_uf_from_key(invoice_key):
-    """Extract UF code from NFe key"""
-    uf_codes = {
-        '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
-        '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
-        '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
-        '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
-    }
-    uf_code = invoice_key[:2]
-    return uf_codes.get(uf_code, 'SP')  # Default to SP if not found
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("api")
 
 def try_sefaz_consultation(invoice_key):
     """Try to consult NFe via SEFAZ webservices"""
-    uf = extract_uf_from_key(invoice_key)
+    uf = get_uf_from_key(invoice_key)
     
     # SEFAZ consultation URLs by state
     sefaz_urls = {
@@ -66,9 +53,9 @@ def try_sefaz_consultation(invoice_key):
             'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NfeConsulta2/nfeConsultaNF'
         }
         
-        response = requests.post(consultation_url, data=soap_body, headers=headers, timeout=15)
-        if response.status_code == 200 and invoice_key in response.text:
-            return response.text
+        response = session.post(consultation_url, data=soap_body, headers=headers, timeout=15)
+        if response.status_code == 200 and body_contains(response, invoice_key):
+            return xml_text(response.content)
     except Exception as e:
         print(f"SEFAZ consultation failed for {uf}: {e}")
     
@@ -88,26 +75,27 @@ def try_public_apis(invoice_key):
         'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8'
     }
     
-    for api_url in public_apis:
-        try:
-            response = requests.get(api_url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                content = response.text
-                # Look for XML content
-                if '<?xml' in content and invoice_key in content:
-                    # Try to extract just the XML part
-                    xml_start = content.find('<?xml')
-                    if xml_start != -1:
-                        xml_end = content.find('</nfeProc>', xml_start)
-                        if xml_end == -1:
-                            xml_end = content.find('</NFe>', xml_start)
-                        if xml_end != -1:
-                            xml_content = content[xml_start:xml_end + 10]
-                            if len(xml_content) > 500:
-                                return xml_content
-        except Exception as e:
-            print(f"Public API {api_url} failed: {e}")
-            continue
+    uf = get_uf_from_key(invoice_key)
+    endpoint = lambda url: url.replace(invoice_key, "{chave}")
+    
+    for api_url in order_strategies("nfe_consultation_service.public_apis", public_apis, uf, name=endpoint):
+        started = time.monotonic()
+        xml_content = fetch_public_api(api_url, invoice_key, headers)
+        record_outcome("nfe_consultation_service.public_apis", endpoint(api_url), uf, xml_content is not None, time.monotonic() - started)
+        if xml_content is not None:
+            return xml_content
+    
+    return None
+
+def fetch_public_api(api_url, invoice_key, headers):
+    """Query one public consultation URL; returns the XML or None"""
+    try:
+        response = session.get(api_url, headers=headers, timeout=10)
+        # Look for XML content and extract just the XML part
+        if response.status_code == 200 and body_contains(response, '<?xml', invoice_key):
+            return extract_xml(response.content, invoice_key, min_length=500)
+    except Exception as e:
+        print(f"Public API {api_url} failed: {e}")
     
     return None
 
@@ -115,7 +103,7 @@ def try_qr_code_consultation(invoice_key):
     """Try to get NFe via QR code consultation"""
     try:
         # Generate QR code URL for NFe consultation
-        uf = extract_uf_from_key(invoice_key)
+        uf = get_uf_from_key(invoice_key)
         qr_base_urls = {
             'SP': 'https://www.fazenda.sp.gov.br/nfe/qrcode',
             'RJ': 'https://www.fazenda.rj.gov.br/nfe/qrcode',
@@ -130,9 +118,9 @@ def try_qr_code_consultation(invoice_key):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(qr_url, headers=headers, timeout=10)
-            if response.status_code == 200 and '<?xml' in response.text:
-                return response.text
+            response = session.get(qr_url, headers=headers, timeout=10)
+            if response.status_code == 200 and body_contains(response, '<?xml'):
+                return xml_text(response.content)
     except Exception as e:
         print(f"QR code consultation failed: {e}")
     
@@ -145,30 +133,43 @@ def get_nfe_xml(invoice_key):
     if not is_valid:
         return {"success": False, "error": message}
     
+    # NF-e autorizada é imutável: reaproveita o XML já obtido
+    cached_xml = load_xml(invoice_key)
+    if cached_xml:
+        return {
+            "success": True,
+            "xml_content": cached_xml,
+            "message": "XML obtido do cache local"
+        }
+    
     print(f"Buscando XML para chave: {invoice_key}")
     
-    # Try different methods in order of reliability
+    # Default order by reliability (later ones are hedged, not awaited)
     methods = [
         ("Consulta via APIs públicas", try_public_apis),
         ("Consulta via SEFAZ", try_sefaz_consultation),
         ("Consulta via QR Code", try_qr_code_consultation)
     ]
     
-    for method_name, method_func in methods:
-        try:
-            print(f"Tentando: {method_name}")
-            xml_content = method_func(invoice_key)
-            
-            if xml_content and invoice_key in xml_content:
-                print(f"✅ XML obtido via {method_name}")
-                return {
-                    "success": True,
-                    "xml_content": xml_content,
-                    "message": f"XML obtido via {method_name}"
-                }
-        except Exception as e:
-            print(f"Erro em {method_name}: {e}")
-            continue
+    # Fastest/most reliable sources for this UF first, from recorded outcomes
+    uf = get_uf_from_key(invoice_key)
+    methods = order_strategies("nfe_consultation_service", methods, uf)
+    
+    # Race the methods (hedged) and keep the first valid XML
+    method_name, xml_content = race_strategies(
+        methods, invoice_key,
+        validate=lambda xml: bool(xml) and invoice_key in xml,
+        on_outcome=lambda name, accepted, elapsed: record_outcome("nfe_consultation_service", name, uf, accepted, elapsed)
+    )
+    
+    if method_name:
+        print(f"✅ XML obtido via {method_name}")
+        store_xml(invoice_key, xml_content)
+        return {
+            "success": True,
+            "xml_content": xml_content,
+            "message": f"XML obtido via {method_name}"
+        }
     
     # If all methods fail, return appropriate error
     return {
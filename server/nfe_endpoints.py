@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Endereços base configuráveis para meudanfe.com.br, SEFAZ e APIs de terceiros
+Os fetchers continuam montando as URLs reais (https://meudanfe.com.br/...,
+mapa sefaz_ws, api.focusnfe.com.br...); o RoutedAdapter montado pelo
+http_session troca apenas o destino da conexão, conforme as rotas abaixo, e
+envia o host original no header Host (e X-Forwarded-Proto: https). Cookies,
+urljoin de links relativos e o circuit breaker continuam enxergando a URL
+original, então nenhum fetcher precisa saber que está falando com outro
+servidor.
+
+Rotas (variáveis de ambiente):
+    NFE_ENDPOINT_BASE=http://127.0.0.1:8765
+        todo host externo vai para essa base (ex.: nfe_fake_server.py)
+    NFE_ENDPOINTS=meudanfe.com.br=http://127.0.0.1:8765,*.gov.br=http://127.0.0.1:8766
+        rota por host; "*.dominio" casa o domínio e os subdomínios
+
+Navegação Selenium (driver.get) não passa pelo requests e não é roteada.
+
+Uso:
+    configure(base="http://127.0.0.1:8765")     # no próprio processo
+    url, host = route("https://meudanfe.com.br/ver-danfe")
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+_routes = {}
+_base = None
+_lock = threading.Lock()
+
+
+def _parse_routes(spec):
+    """'host=base,*.dominio=base' -> {host: base}"""
+    routes = {}
+    for entry in (spec or '').split(','):
+        host, sep, base = entry.strip().partition('=')
+        if sep and host.strip() and base.strip():
+            routes[host.strip().lower()] = base.strip().rstrip('/')
+    return routes
+
+
+def configure(base=None, routes=None):
+    """
+    Define as rotas do processo (substitui as anteriores)
+
+    Args:
+        base: base que recebe todo host externo (None desliga)
+        routes: dict host -> base, ou a string no formato de NFE_ENDPOINTS
+    """
+    global _base, _routes
+    if isinstance(routes, str):
+        routes = _parse_routes(routes)
+    with _lock:
+        _base = base.rstrip('/') if base else None
+        _routes = {host.lower(): target.rstrip('/') for host, target in (routes or {}).items()}
+
+
+def reset():
+    """Volta às rotas definidas pelas variáveis de ambiente"""
+    configure(os.environ.get("NFE_ENDPOINT_BASE"), os.environ.get("NFE_ENDPOINTS"))
+
+
+def active():
+    return bool(_base or _routes)
+
+
+def _target(host):
+    routes = _routes
+    if host in routes:
+        return routes[host]
+    for pattern, target in routes.items():
+        if pattern.startswith('*.') and (host == pattern[2:] or host.endswith(pattern[1:])):
+            return target
+    return _base
+
+
+def route(url):
+    """
+    (url de destino, host original) para uma URL de fetcher
+
+    Sem rota para o host devolve (url, None). Hosts locais nunca são
+    roteados, para não desviar o próprio servidor de teste.
+    """
+    if not active():
+        return url, None
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if not host or host in ('localhost', '127.0.0.1', '::1'):
+        return url, None
+    target = _target(host)
+    if not target:
+        return url, None
+
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return target + path, parts.netloc
+
+
+class RoutedAdapter(HTTPAdapter):
+    """HTTPAdapter que envia a requisição para a base roteada, mantendo a URL original"""
+
+    def send(self, request, **kwargs):
+        target, host = route(request.url)
+        if host is None:
+            return super().send(request, **kwargs)
+
+        routed = request.copy()
+        routed.url = target
+        routed.headers['Host'] = host
+        routed.headers['X-Forwarded-Proto'] = urlsplit(request.url).scheme
+        response = super().send(routed, **kwargs)
+        # Cookies, redirects relativos e response.url seguem o host original
+        response.request = request
+        response.url = request.url
+        return response
+
+
+reset()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita meudanfe.com.br, os webservices SEFAZ e APIs de terceiros
+Reproduz os fluxos que os fetchers esperam, para medir estratégias e motores
+numa só máquina, sem rede e com resultado repetível:
+
+    meudanfe   GET / e /ver-danfe          página com o formulário de consulta
+               POST /ver-danfe (/consulta, /buscar...) ou GET com a chave
+                                           página "NF-e autorizada" com o link "Baixar XML"
+               /api/..., /ajax/...         JSON {"success", "xml", "download_url"}
+               /download/xml/<chave>, *.xml
+                                           o XML como anexo
+    sefaz      POST consSitNFe (*.gov.br)  envelope SOAP com retConsSitNFe/protNFe
+               GET/POST nos portais        página com __VIEWSTATE / resultado
+    api        /v2/nfe/<chave>.xml         XML; demais caminhos com a chave: JSON {"xml"}
+
+O serviço é escolhido pelo header Host que o RoutedAdapter (nfe_endpoints)
+envia. Qualquer chave de 44 dígitos é tratada como autorizada; o XML é o
+nfeProc sintético do nfe_record_parser com a chave pedida.
+
+Latência, taxa de erro (HTTP 503) e tamanho do XML (itens) são injetáveis,
+no total ou por serviço ("300" ou "meudanfe=300,sefaz=800,api=100").
+server.hits conta as respostas por "serviço:status"; os 503 injetados ficam
+em "serviço:injected_503", separados dos status devolvidos pelos handlers.
+
+Uso:
+    python3 nfe_fake_server.py --port 8765 --latency 200 --error-rate 0.05 --items 50
+    NFE_ENDPOINT_BASE=http://127.0.0.1:8765 python3 simple_nfe_api.py <chave>
+
+    server = start_server(latency="meudanfe=300,sefaz=800", items=20)   # thread própria
+    nfe_endpoints.configure(base=server.base_url)
+    ...
+    server.shutdown()
+"""
+
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit, unquote_plus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nfe_record_parser import build_sample
+
+SERVICES = ('meudanfe', 'sefaz', 'api')
+
+_KEY_RE = re.compile(r'(?<!\d)\d{44}(?!\d)')
+_SOAP12_NS = 'http://www.w3.org/2003/05/soap-envelope'
+
+_DOWNLOAD_PREFIXES = ('/download', '/xml', '/files', '/storage', '/public')
+_API_PREFIXES = ('/api', '/ajax', '/rest', '/services')
+
+
+def service_for(host):
+    """'meudanfe', 'sefaz' ou 'api' a partir do host original"""
+    host = (host or '').split(':')[0].lower()
+    if 'meudanfe' in host:
+        return 'meudanfe'
+    if host.endswith('.gov.br'):
+        return 'sefaz'
+    return 'api'
+
+
+def per_service(spec, cast=float):
+    """'300' ou 'meudanfe=300,sefaz=800' -> {serviço: valor} (chave '*' = padrão)"""
+    if isinstance(spec, dict):
+        values = dict(spec)
+    elif isinstance(spec, (int, float)):
+        values = {'*': spec}
+    else:
+        values = {}
+        for entry in str(spec or '').split(','):
+            name, sep, value = entry.strip().rpartition('=')
+            if value.strip():
+                values[name.strip() if sep else '*'] = cast(value)
+    values.setdefault('*', cast(0))
+    return values
+
+
+class FakeSettings:
+    """Parâmetros injetáveis do servidor (podem ser trocados com ele rodando)"""
+
+    def __init__(self, latency=0, jitter=0.2, error_rate=0, items=10, page_kb=40,
+                 soap_document=False, seed=None):
+        self.latency = per_service(latency)           # ms
+        self.jitter = jitter                          # fração da latência, para mais ou menos
+        self.error_rate = per_service(error_rate)     # fração de respostas 503
+        self.items = int(items)                       # itens (<det>) do XML, ~3 KB cada
+        self.page_kb = int(page_kb)                   # enchimento das páginas HTML
+        self.soap_document = soap_document            # nfeProc dentro da resposta SOAP
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def value(self, table, service):
+        return table.get(service, table['*'])
+
+    def delay(self, service):
+        base = self.value(self.latency, service) / 1000.0
+        if base <= 0:
+            return 0.0
+        with self._lock:
+            factor = self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return base * factor
+
+    def should_fail(self, service):
+        rate = self.value(self.error_rate, service)
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self.rng.random() < rate
+
+    def to_dict(self):
+        return {
+            "latency_ms": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+            "items": self.items, "page_kb": self.page_kb, "soap_document": self.soap_document,
+        }
+
+
+@lru_cache(maxsize=64)
+def nfe_document(invoice_key, items):
+    """XML nfeProc (bytes) da chave, gerado uma vez por (chave, itens)"""
+    return build_sample(items, invoice_key)
+
+
+def _filler(page_kb):
+    """Marcação inerte para aproximar o peso das páginas reais"""
+    block = '<div class="ad-slot"><script>window.dataLayer=window.dataLayer||[];</script></div>\n'
+    return block * max(0, page_kb * 1024 // len(block))
+
+
+def home_page(settings):
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>Meu Danfe - Consulta de NF-e</title></head>
+<body>
+<h1>Consultar DANFE e XML da NF-e</h1>
+<form id="form-consulta" action="/ver-danfe" method="post">
+<input type="hidden" name="__VIEWSTATE" value="dDwtMTU0MDY4NjE0Njs7Pg==">
+<input type="hidden" name="_token" value="f4k3t0k3n">
+<input type="text" name="chave" id="chave" class="form-control" placeholder="Digite a chave de acesso" maxlength="44">
+<button type="submit" class="btn btn-primary">Buscar DANFE</button>
+</form>
+{_filler(settings.page_kb)}</body></html>"""
+
+
+def result_page(invoice_key, settings):
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>DANFE {invoice_key}</title></head>
+<body>
+<div class="alert alert-success">NF-e encontrada: Autorizada o uso da NF-e</div>
+<p class="chave">Chave de acesso: <span id="chave-acesso">{invoice_key}</span></p>
+<a href="/download/xml/{invoice_key}" class="btn btn-download" id="btn-xml">Baixar XML</a>
+{_filler(settings.page_kb)}</body></html>"""
+
+
+def soap_response(invoice_key, settings, soap12):
+    namespace = _SOAP12_NS if soap12 else 'http://schemas.xmlsoap.org/soap/envelope/'
+    document = ''
+    if settings.soap_document:
+        document = nfe_document(invoice_key, settings.items).decode('utf-8').split('?>', 1)[1]
+    received = time.strftime('%Y-%m-%dT%H:%M:%S-03:00')
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="{namespace}"><soap:Body>
+<nfeResultMsg xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeConsultaProtocolo4">
+<retConsSitNFe versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe"><tpAmb>1</tpAmb><verAplic>SP_NFE_PL009_V4</verAplic><cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo><cUF>{invoice_key[:2]}</cUF><dhRecbto>{received}</dhRecbto><chNFe>{invoice_key}</chNFe>
+<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><verAplic>SP_NFE_PL009_V4</verAplic><chNFe>{invoice_key}</chNFe><dhRecbto>{received}</dhRecbto><nProt>135251409488069</nProt><digVal>bm9uZQ==</digVal><cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>{document}
+</retConsSitNFe></nfeResultMsg></soap:Body></soap:Envelope>"""
+
+
+class FakeNFeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "nfe-fake/1.0"
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_HEAD(self):
+        self.handle_request('HEAD')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8', errors='replace') if length else ''
+        host = self.headers.get('Host', '')
+        service = service_for(host)
+        settings = self.server.settings
+
+        delay = settings.delay(service)
+        if delay:
+            time.sleep(delay)
+        if settings.should_fail(service):
+            # Contado à parte: falha injetada, não do handler do serviço
+            self.server.count(service, "injected_503")
+            return self.respond(503, b'Service Unavailable', 'text/plain', method=method)
+
+        parts = urlsplit(self.path)
+        match = _KEY_RE.search(unquote_plus(f"{parts.path}?{parts.query}&{body}"))
+        invoice_key = match.group(0) if match else None
+        proto = self.headers.get('X-Forwarded-Proto', 'http')
+        context = (method, parts.path.lower(), invoice_key, body, f"{proto}://{host}")
+
+        handler = getattr(self, f"serve_{service}")
+        status = handler(settings, *context)
+        self.server.count(service, status)
+
+    def respond(self, status, payload, content_type, headers=None, method='GET'):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if method != 'HEAD':
+            self.wfile.write(payload)
+        return status
+
+    def send_xml(self, invoice_key, settings, method, attachment=True):
+        headers = {'Content-Disposition': f'attachment; filename="{invoice_key}.xml"'} if attachment else None
+        return self.respond(200, nfe_document(invoice_key, settings.items),
+                            'application/xml; charset=utf-8', headers, method)
+
+    def send_json(self, status, data, method):
+        return self.respond(status, json.dumps(data, ensure_ascii=False), 'application/json; charset=utf-8',
+                            method=method)
+
+    def not_found(self, method):
+        return self.respond(404, '<html><body><h1>404 - Página não encontrada</h1></body></html>',
+                            'text/html; charset=utf-8', method=method)
+
+    def serve_meudanfe(self, settings, method, path, invoice_key, body, origin):
+        if not invoice_key:
+            if path in ('/', '', '/ver-danfe', '/index.html'):
+                return self.respond(200, home_page(settings), 'text/html; charset=utf-8', method=method)
+            return self.not_found(method)
+
+        if path.startswith(_DOWNLOAD_PREFIXES) or path.endswith('.xml'):
+            return self.send_xml(invoice_key, settings, method)
+        if path.startswith(_API_PREFIXES):
+            return self.send_json(200, {
+                "success": True,
+                "chave": invoice_key,
+                "status": "Autorizada",
+                "xml": nfe_document(invoice_key, settings.items).decode('utf-8'),
+                "download_url": f"{origin}/download/xml/{invoice_key}",
+            }, method)
+        return self.respond(200, result_page(invoice_key, settings), 'text/html; charset=utf-8', method=method)
+
+    def serve_sefaz(self, settings, method, path, invoice_key, body, origin):
+        if method == 'POST' and 'consSitNFe' in body:
+            if not invoice_key:
+                return self.respond(500, 'consSitNFe sem chNFe', 'text/plain', method=method)
+            soap12 = _SOAP12_NS in body or 'soap+xml' in self.headers.get('Content-Type', '')
+            content_type = 'application/soap+xml; charset=utf-8' if soap12 else 'text/xml; charset=utf-8'
+            return self.respond(200, soap_response(invoice_key, settings, soap12), content_type, method=method)
+        if invoice_key:
+            return self.respond(200, result_page(invoice_key, settings), 'text/html; charset=utf-8', method=method)
+        return self.respond(200, home_page(settings), 'text/html; charset=utf-8', method=method)
+
+    def serve_api(self, settings, method, path, invoice_key, body, origin):
+        if not invoice_key:
+            return self.send_json(404, {"error": "chave não informada"}, method)
+        if path.endswith('.xml'):
+            return self.send_xml(invoice_key, settings, method, attachment=False)
+        return self.send_json(200, {
+            "chave": invoice_key,
+            "status": "autorizada",
+            "xml": nfe_document(invoice_key, settings.items).decode('utf-8'),
+        }, method)
+
+
+class FakeNFeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), settings=None, verbose=False):
+        super().__init__(address, FakeNFeHandler)
+        self.settings = settings or FakeSettings()
+        self.verbose = verbose
+        self.hits = Counter()
+        self._hits_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, service, status):
+        with self._hits_lock:
+            self.hits[f"{service}:{status}"] += 1
+
+
+def start_server(host='127.0.0.1', port=0, verbose=False, **settings):
+    """Sobe o servidor numa thread daemon; porta 0 escolhe uma livre"""
+    server = FakeNFeServer((host, port), FakeSettings(**settings), verbose)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor local que imita meudanfe, SEFAZ e APIs de NFe")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="0", help="ms; '300' ou 'meudanfe=300,sefaz=800,api=100'")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variação da latência, fração (padrão: 0.2)")
+    parser.add_argument("--error-rate", default="0", help="Fração de 503; '0.05' ou 'sefaz=0.3'")
+    parser.add_argument("--items", type=int, default=10, help="Itens do XML, ~3 KB cada (padrão: 10)")
+    parser.add_argument("--page-kb", type=int, default=40, help="Tamanho aproximado das páginas HTML")
+    parser.add_argument("--soap-document", action="store_true", help="Inclui o nfeProc na resposta SOAP")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="Loga cada requisição")
+    args = parser.parse_args()
+
+    settings = FakeSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            items=args.items, page_kb=args.page_kb, soap_document=args.soap_document,
+                            seed=args.seed)
+    server = FakeNFeServer((args.host, args.port), settings, args.verbose)
+    print(json.dumps({"base_url": server.base_url, "settings": settings.to_dict()}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
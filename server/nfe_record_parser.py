@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Leitura estruturada do XML da NFe em um registro compacto
+Percorre o documento uma única vez com iterparse (lxml quando instalado,
+xml.etree.ElementTree caso contrário) e preenche registros com __slots__:
+identificação (ide), emitente, destinatário, transporte/volumes, totais e
+itens (det). O registro segue no resultado dos fetchers como campo "parsed",
+então o Node não precisa reparsear o xml_content para obter número, chave,
+emitente, destinatário, peso bruto, volumes e valor (MAPEAMENTO_CAMPOS_NFE.md).
+
+Cada <det> é descartado da árvore assim que seu item é lido, então o pico de
+memória não cresce com o número de itens; iter_items entrega os itens um a
+um para quem não precisa deles todos em lista.
+
+Configuração por ambiente:
+    NFE_RESULT_FORMAT=both     xml_content + parsed (padrão)
+    NFE_RESULT_FORMAT=parsed   só parsed (o XML não passa pelo stdout)
+    NFE_RESULT_FORMAT=xml      só xml_content, como antes
+
+Uso:
+    record = parse_nfe(xml_content)      # NFeRecord ou None
+    record.to_dict()
+
+    with open(path, 'rb') as f:          # documentos grandes, item a item
+        for item in iter_items(f, record):
+            ...
+
+    attach_parsed(result)                # resultado de um fetcher
+
+Benchmark (pico de RSS, árvore completa x item a item):
+    python3 nfe_record_parser.py --items 1,10,100,250,500,990
+"""
+
+import io
+import os
+import re
+
+try:
+    from lxml import etree
+    HAS_LXML = True
+    # Sem entidades externas nem rede: o XML vem de sites de terceiros
+    _PARSER_OPTIONS = {"resolve_entities": False, "no_network": True}
+except ImportError:
+    import xml.etree.ElementTree as etree
+    HAS_LXML = False
+    _PARSER_OPTIONS = {}
+
+RESULT_FORMAT = os.environ.get("NFE_RESULT_FORMAT", "both")
+
+_PROLOG_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+class Party:
+    """Emitente, destinatário ou transportador"""
+    __slots__ = ('razao_social', 'cnpj', 'inscricao_estadual', 'logradouro', 'numero',
+                 'bairro', 'cidade', 'uf', 'cep', 'telefone')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, '')
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Volume:
+    __slots__ = ('quantidade', 'especie', 'marca', 'numeracao', 'peso_liquido', 'peso_bruto')
+
+    def __init__(self):
+        self.quantidade = 0
+        self.especie = ''
+        self.marca = ''
+        self.numeracao = ''
+        self.peso_liquido = 0.0
+        self.peso_bruto = 0.0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Item:
+    """Produto de um <det>"""
+    __slots__ = ('numero', 'codigo', 'descricao', 'ncm', 'cfop', 'unidade',
+                 'quantidade', 'valor_unitario', 'valor_total')
+
+    def __init__(self, numero=0):
+        self.numero = numero
+        self.codigo = ''
+        self.descricao = ''
+        self.ncm = ''
+        self.cfop = ''
+        self.unidade = ''
+        self.quantidade = 0.0
+        self.valor_unitario = 0.0
+        self.valor_total = 0.0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class NFeRecord:
+    __slots__ = ('chave_acesso', 'numero_nf', 'serie', 'data_emissao', 'data_saida',
+                 'natureza_operacao', 'tipo_operacao', 'protocolo',
+                 'emitente', 'destinatario', 'transportador', 'modalidade_frete', 'volumes',
+                 'valor_produtos', 'valor_frete', 'valor_seguro', 'valor_desconto',
+                 'valor_icms', 'valor_ipi', 'valor_total', 'itens')
+
+    def __init__(self):
+        self.chave_acesso = ''
+        self.numero_nf = ''
+        self.serie = ''
+        self.data_emissao = ''
+        self.data_saida = ''
+        self.natureza_operacao = ''
+        self.tipo_operacao = ''
+        self.protocolo = ''
+        self.emitente = Party()
+        self.destinatario = Party()
+        self.transportador = None
+        self.modalidade_frete = ''
+        self.volumes = []
+        self.valor_produtos = 0.0
+        self.valor_frete = 0.0
+        self.valor_seguro = 0.0
+        self.valor_desconto = 0.0
+        self.valor_icms = 0.0
+        self.valor_ipi = 0.0
+        self.valor_total = 0.0
+        self.itens = []
+
+    @property
+    def peso_bruto(self):
+        return round(sum(v.peso_bruto for v in self.volumes), 3)
+
+    @property
+    def peso_liquido(self):
+        return round(sum(v.peso_liquido for v in self.volumes), 3)
+
+    @property
+    def quantidade_volumes(self):
+        return sum(v.quantidade for v in self.volumes)
+
+    def to_dict(self):
+        return {
+            "chave_acesso": self.chave_acesso,
+            "numero_nf": self.numero_nf,
+            "serie": self.serie,
+            "data_emissao": self.data_emissao,
+            "data_saida": self.data_saida,
+            "natureza_operacao": self.natureza_operacao,
+            "tipo_operacao": self.tipo_operacao,
+            "protocolo": self.protocolo,
+            "emitente": self.emitente.to_dict(),
+            "destinatario": self.destinatario.to_dict(),
+            "transporte": {
+                "modalidade_frete": self.modalidade_frete,
+                "transportador": self.transportador.to_dict() if self.transportador else None,
+                "volumes": [v.to_dict() for v in self.volumes],
+            },
+            "peso_bruto": self.peso_bruto,
+            "peso_liquido": self.peso_liquido,
+            "volumes": self.quantidade_volumes,
+            "totais": {
+                "valor_produtos": self.valor_produtos,
+                "valor_frete": self.valor_frete,
+                "valor_seguro": self.valor_seguro,
+                "valor_desconto": self.valor_desconto,
+                "valor_icms": self.valor_icms,
+                "valor_ipi": self.valor_ipi,
+                "valor_total": self.valor_total,
+            },
+            "valor_total": self.valor_total,
+            "itens": [item.to_dict() for item in self.itens],
+        }
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def _integer(text):
+    try:
+        return int(float(text))
+    except ValueError:
+        return 0
+
+
+# Tag folha -> (atributo, conversão) por seção do documento
+IDE_FIELDS = {
+    'nNF': ('numero_nf', str), 'serie': ('serie', str),
+    'dhEmi': ('data_emissao', str), 'dEmi': ('data_emissao', str),
+    'dhSaiEnt': ('data_saida', str), 'dSaiEnt': ('data_saida', str),
+    'natOp': ('natureza_operacao', str), 'tpNF': ('tipo_operacao', str),
+}
+PARTY_FIELDS = {
+    'xNome': ('razao_social', str), 'CNPJ': ('cnpj', str), 'CPF': ('cnpj', str),
+    'IE': ('inscricao_estadual', str), 'xLgr': ('logradouro', str), 'xEnder': ('logradouro', str),
+    'nro': ('numero', str), 'xBairro': ('bairro', str), 'xMun': ('cidade', str),
+    'UF': ('uf', str), 'CEP': ('cep', str), 'fone': ('telefone', str),
+}
+VOLUME_FIELDS = {
+    'qVol': ('quantidade', _integer), 'esp': ('especie', str), 'marca': ('marca', str),
+    'nVol': ('numeracao', str), 'pesoL': ('peso_liquido', _number), 'pesoB': ('peso_bruto', _number),
+}
+TOTAL_FIELDS = {
+    'vProd': ('valor_produtos', _number), 'vFrete': ('valor_frete', _number),
+    'vSeg': ('valor_seguro', _number), 'vDesc': ('valor_desconto', _number),
+    'vICMS': ('valor_icms', _number), 'vIPI': ('valor_ipi', _number), 'vNF': ('valor_total', _number),
+}
+ITEM_FIELDS = {
+    'cProd': ('codigo', str), 'xProd': ('descricao', str), 'NCM': ('ncm', str),
+    'CFOP': ('cfop', str), 'uCom': ('unidade', str), 'qCom': ('quantidade', _number),
+    'vUnCom': ('valor_unitario', _number), 'vProd': ('valor_total', _number),
+}
+
+# Seções cujas folhas interessam; a mais próxima na pilha decide o destino
+_SECTIONS = {'ide', 'emit', 'dest', 'transporta', 'transp', 'vol', 'ICMSTot', 'prod', 'infProt'}
+
+
+def _local(tag):
+    return tag.rpartition('}')[2] if isinstance(tag, str) else ''
+
+
+def _source(content):
+    """Entrada do iterparse: arquivo aberto, ou bytes (str perde o prólogo, cujo encoding não vale mais)"""
+    if hasattr(content, 'read'):
+        return content
+    if isinstance(content, str):
+        content = _PROLOG_RE.sub('', content, count=1).encode('utf-8')
+    return io.BytesIO(content)
+
+
+def _walk(content, record):
+    """
+    Percorre o documento preenchendo `record` e devolvendo cada item ao fechar o <det>
+
+    Cada <det> processado é limpo e retirado do pai, então a árvore em memória
+    não cresce com o número de itens.
+    """
+    elements = []
+    names = []
+    targets = {
+        'ide': (record, IDE_FIELDS), 'emit': (record.emitente, PARTY_FIELDS),
+        'dest': (record.destinatario, PARTY_FIELDS), 'ICMSTot': (record, TOTAL_FIELDS),
+    }
+    item = None
+
+    for event, element in etree.iterparse(_source(content), events=('start', 'end'), **_PARSER_OPTIONS):
+        name = _local(element.tag)
+        if event == 'start':
+            elements.append(element)
+            names.append(name)
+            if name == 'infNFe':
+                record.chave_acesso = (element.get('Id') or '').replace('NFe', '')
+            elif name == 'det':
+                item = Item(_integer(element.get('nItem') or '0'))
+                targets['prod'] = (item, ITEM_FIELDS)
+            elif name == 'vol':
+                record.volumes.append(Volume())
+                targets['vol'] = (record.volumes[-1], VOLUME_FIELDS)
+            elif name == 'transporta':
+                record.transportador = Party()
+                targets['transporta'] = (record.transportador, PARTY_FIELDS)
+            continue
+
+        elements.pop()
+        names.pop()
+        text = element.text.strip() if element.text else ''
+        if text:
+            _assign(record, targets, names, name, text)
+        if name == 'det':
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+            yield item
+
+
+def iter_items(content, record=None):
+    """
+    Itens (det) do documento, um a um, com memória limitada
+
+    Para NF-e de centenas de itens: nenhuma árvore completa é montada, e o
+    chamador pode gravar/agregar cada item e descartá-lo. Os campos de
+    cabeçalho vão sendo preenchidos em `record` (ide, emit e dest vêm antes
+    dos itens; totais e transporte só depois do último).
+
+    Args:
+        content: XML em str ou bytes, ou arquivo aberto em modo binário
+        record: NFeRecord a preencher com o cabeçalho (opcional)
+
+    Yields:
+        Item
+
+    Raises:
+        etree.ParseError: documento malformado
+    """
+    yield from _walk(content, record if record is not None else NFeRecord())
+
+
+def parse_nfe(content):
+    """
+    Registro compacto de um XML de NFe (nfeProc ou NFe avulsa)
+
+    Args:
+        content: XML em str ou bytes, ou arquivo aberto em modo binário
+
+    Returns:
+        NFeRecord, ou None se o documento não for XML válido ou não tiver infNFe
+    """
+    record = NFeRecord()
+    try:
+        record.itens.extend(_walk(content, record))
+    except etree.ParseError:
+        return None
+    return record if record.chave_acesso or record.numero_nf else None
+
+
+def _assign(record, targets, stack, name, text):
+    """Grava a folha `name` no registro da seção mais próxima"""
+    for section in reversed(stack):
+        if section in _SECTIONS:
+            break
+    else:
+        return
+
+    if section == 'transp':
+        if name == 'modFrete':
+            record.modalidade_frete = text
+        return
+    if section == 'infProt':
+        if name == 'nProt':
+            record.protocolo = text
+        elif name == 'chNFe' and not record.chave_acesso:
+            record.chave_acesso = text
+        return
+
+    target, fields = targets.get(section, (None, None))
+    field = fields.get(name) if fields else None
+    if field:
+        attribute, convert = field
+        setattr(target, attribute, convert(text))
+
+
+def attach_parsed(result, result_format=None):
+    """
+    Acrescenta "parsed" ao resultado de um fetcher bem-sucedido
+
+    Com NFE_RESULT_FORMAT=parsed remove o xml_content depois de parsear;
+    se o parse falhar, o XML bruto é mantido.
+    """
+    result_format = result_format or RESULT_FORMAT
+    if result_format == "xml" or not isinstance(result, dict):
+        return result
+    xml_content = result.get("xml_content")
+    if not result.get("success") or not xml_content:
+        return result
+
+    record = parse_nfe(xml_content)
+    if record is None:
+        return result
+    result["parsed"] = record.to_dict()
+    if result_format == "parsed":
+        del result["xml_content"]
+    return result
+
+
+# Benchmark: pico de memória do parse completo x item a item (1 a 990 itens)
+
+SAMPLE_KEY = "35250513516247000107550010000113401146202508"
+
+SAMPLE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe"><NFe><infNFe Id="NFe{chave}" versao="4.00">
+<ide><cUF>35</cUF><natOp>Venda de produção do estabelecimento</natOp><mod>55</mod><serie>1</serie><nNF>11340</nNF><dhEmi>2025-05-27T10:11:52-03:00</dhEmi><tpNF>1</tpNF></ide>
+<emit><CNPJ>13516247000107</CNPJ><xNome>REAL SINALIZACAO INDUSTRIA COMERCIO E SERVICOS LTDA ME</xNome><enderEmit><xLgr>RUA ORCO</xLgr><nro>143</nro><xBairro>JARDIM ADELFIORE</xBairro><xMun>SAO PAULO</xMun><UF>SP</UF><CEP>05223110</CEP></enderEmit><IE>147973896119</IE></emit>
+<dest><CNPJ>22525037000176</CNPJ><xNome>FORT CLEAN - DISTRIBUIDORA LTDA</xNome><enderDest><xLgr>RUA PIAUI</xLgr><nro>588</nro><xBairro>NOVA IMPERATRIZ</xBairro><xMun>IMPERATRIZ</xMun><UF>MA</UF><CEP>65907100</CEP></enderDest><IE>124974090</IE></dest>
+"""
+
+SAMPLE_ITEM = """<det nItem="{n}"><prod><cProd>{n:06d}</cProd><cEAN>SEM GTIN</cEAN><xProd>ADESIVO FIXADOR LOTE {n}</xProd><NCM>35061090</NCM><CFOP>6101</CFOP><uCom>KG</uCom><qCom>12.0000</qCom><vUnCom>11.090000</vUnCom><vProd>133.08</vProd><cEANTrib>SEM GTIN</cEANTrib><uTrib>KG</uTrib><qTrib>12.0000</qTrib><vUnTrib>11.090000</vUnTrib><indTot>1</indTot></prod>
+<imposto><vTotTrib>0.00</vTotTrib><ICMS><ICMSSN102><orig>0</orig><CSOSN>102</CSOSN></ICMSSN102></ICMS><IPI><cEnq>999</cEnq><IPINT><CST>51</CST></IPINT></IPI><PIS><PISNT><CST>08</CST></PISNT></PIS><COFINS><COFINSNT><CST>08</CST></COFINSNT></COFINS></imposto>
+<infAdProd>{filler}</infAdProd></det>
+"""
+
+SAMPLE_FOOTER = """<total><ICMSTot><vProd>{total:.2f}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>0.00</vDesc><vIPI>0.00</vIPI><vNF>{total:.2f}</vNF></ICMSTot></total>
+<transp><modFrete>1</modFrete><vol><qVol>{items}</qVol><esp>VOLUMES</esp><pesoL>{weight:.3f}</pesoL><pesoB>{weight:.3f}</pesoB></vol></transp>
+</infNFe></NFe><protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><nProt>135251409488069</nProt></infProt></protNFe></nfeProc>
+"""
+
+
+def build_sample(items, chave=SAMPLE_KEY):
+    """Documento nfeProc sintético com `items` itens (~3 KB por <det>)"""
+    filler = "INFORMACAO ADICIONAL DO PRODUTO " * 60
+    parts = [SAMPLE_HEADER.format(chave=chave)]
+    parts.extend(SAMPLE_ITEM.format(n=n, filler=filler) for n in range(1, items + 1))
+    parts.append(SAMPLE_FOOTER.format(chave=chave, total=133.08 * items, items=items, weight=12.0 * items))
+    return ''.join(parts).encode('utf-8')
+
+
+def _proc_status_kb(field):
+    """Campo em kB de /proc/self/status (Linux), ou None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _peak_rss_kb():
+    """
+    Pico de RSS do processo
+
+    VmHWM é do próprio processo; o ru_maxrss, usado fora do Linux, herda o
+    pico do pai através do exec.
+    """
+    peak = _proc_status_kb('VmHWM')
+    if peak is not None:
+        return peak
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS informa em bytes, Linux em KB
+    return peak // 1024 if os.uname().sysname == 'Darwin' else peak
+
+
+def _current_rss_kb():
+    rss = _proc_status_kb('VmRSS')
+    return rss if rss is not None else _peak_rss_kb()
+
+
+def _measure(path, mode):
+    """Executado em processo próprio: parse de `path` e crescimento do pico de RSS"""
+    import time
+    baseline = _current_rss_kb()
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        if mode == 'tree':
+            # Referência: árvore completa em memória
+            root = etree.parse(f).getroot()
+            count = sum(1 for element in root.iter() if _local(element.tag) == 'det')
+        else:
+            count = sum(1 for _ in iter_items(f))
+    return {
+        "items": count,
+        "seconds": round(time.perf_counter() - started, 4),
+        "peak_rss_growth_kb": max(0, _peak_rss_kb() - baseline),
+    }
+
+
+def benchmark(item_counts, modes=('tree', 'stream')):
+    """Mede cada contagem de itens e modo num subprocesso (ru_maxrss só cresce)"""
+    import sys
+    import json
+    import tempfile
+    import subprocess
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for items in item_counts:
+            path = os.path.join(directory, f"nfe_{items}.xml")
+            with open(path, 'wb') as f:
+                f.write(build_sample(items))
+            row = {"items": items, "bytes": os.path.getsize(path)}
+            for mode in modes:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--measure", path, "--mode", mode],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                row[mode] = json.loads(output)
+            rows.append(row)
+    return rows
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark de memória do parser de NFe")
+    parser.add_argument("--items", default="1,10,100,250,500,990",
+                        help="Contagens de itens, separadas por vírgula (padrão: 1,10,100,250,500,990)")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=("tree", "stream"), default="stream", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure(args.measure, args.mode)))
+        return
+
+    item_counts = [int(n) for n in args.items.split(",") if n.strip()]
+    report = {"parser": "lxml" if HAS_LXML else "ElementTree", "results": benchmark(item_counts)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
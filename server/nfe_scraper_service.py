@@ -1,28 +1,15 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
-import re
 from urllib.parse import quote, urlencode
 import time
+from circuit_breaker import guarded_request
+from http_session import shared_session
+from xml_stream_extractor import extract_xml, body_contains
+from nfe_access_key import get_uf_from_key, decode_key, InvalidAccessKey
 
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
-
-def get_uf_from_key(invoice_key):
-    """Extract UF from NFe key"""
-    uf_map = {
-        '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
-        '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
-        '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
-        '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
-    }
-    return uf_map.get(invoice_key[:2], 'SP')
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("api")
 
 def try_nfce_consultation(invoice_key):
     """Try NFCe consultation portals"""
@@ -41,27 +28,22 @@ def try_nfce_consultation(invoice_key):
         'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8'
     }
     
-    for state, url in nfce_urls.items():
-        try:
-            response = requests.get(url, headers=headers, timeout=15, verify=False)
-            if response.status_code == 200:
-                content = response.text
-                if invoice_key in content and ('<?xml' in content or 'nfe' in content.lower()):
-                    # Look for XML content
-                    xml_patterns = [
-                        r'<nfeProc.*?</nfeProc>',
-                        r'<NFe.*?</NFe>',
-                        r'<nfe.*?</nfe>'
-                    ]
-                    
-                    for pattern in xml_patterns:
-                        xml_match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
-                        if xml_match:
-                            xml_content = xml_match.group(0)
-                            if len(xml_content) > 500:
-                                return xml_content
-        except Exception as e:
-            print(f"NFCe consultation {state} error: {e}")
+    # Only the issuing state's portal can know the key
+    url = nfce_urls.get(uf)
+    if not url:
+        return None
+    
+    try:
+        response = guarded_request(session, 'GET', url, headers=headers, timeout=15, verify=False)
+        if response.status_code == 200 and body_contains(response, invoice_key):
+            content = response.content
+            if b'<?xml' in content or b'nfe' in content.lower():
+                # Look for XML content (nfeProc or NFe envelope)
+                xml_content = extract_xml(content, invoice_key, min_length=500)
+                if xml_content:
+                    return xml_content
+    except Exception as e:
+        print(f"NFCe consultation {uf} error: {e}")
     
     return None
 
@@ -80,22 +62,14 @@ def try_qr_code_services(invoice_key):
     
     for service_url in qr_services:
         try:
-            response = requests.get(service_url, headers=headers, timeout=12)
+            response = guarded_request(session, 'GET', service_url, headers=headers, timeout=12)
             
             if response.status_code == 200:
-                content = response.text
-                
                 # Check for XML in response
-                if invoice_key in content and '<?xml' in content:
-                    xml_start = content.find('<?xml')
-                    xml_end = content.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = content.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = content[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return xml_content
+                if body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return xml_content
                 
                 # Try JSON parsing
                 try:
@@ -262,16 +236,17 @@ def try_proxy_consultation(invoice_key):
 def get_nfe_xml_via_scraping(invoice_key):
     """Get NFe XML using web scraping methods"""
     # Validate key
-    is_valid, message = validate_nfe_key(invoice_key)
-    if not is_valid:
-        return {"success": False, "error": message}
+    try:
+        key = decode_key(invoice_key)
+    except InvalidAccessKey as e:
+        return {"success": False, "error": str(e)}
     
     print(f"Buscando XML NFe para: {invoice_key}")
     
-    methods = [
-        ("Consulta NFCe Portals", try_nfce_consultation),
-        ("Serviços QR Code", try_qr_code_services)
-    ]
+    # NFC-e portals only answer for model 65 keys
+    methods = [("Serviços QR Code", try_qr_code_services)]
+    if key.is_nfce:
+        methods.insert(0, ("Consulta NFCe Portals", try_nfce_consultation))
     
     for method_name, method_func in methods:
         try:
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Cache local persistente de XMLs de NFe, endereçado pela chave de acesso
+Uma NF-e autorizada é imutável, então o XML obtido uma vez pode ser
+reaproveitado por conferência, carregamento e impressão de DANFE sem nova
+consulta à rede.
+
+Cada XML é gravado comprimido (gzip) em
+    <NFE_XML_CACHE_DIR>/<cUF>/<AAMM>/<chave>.xml.gz
+com escrita atômica (arquivo temporário + os.replace). Um LRU em memória
+na frente do disco atende repetições no mesmo processo (worker residente).
+
+Chaves que falharam ficam num cache negativo com TTL por classe de falha
+(chave inválida, não encontrada, fonte fora do ar), para que uma nova
+leitura da mesma chave ruim não gaste outro minuto de rede e navegador.
+
+Uso:
+    xml = load_xml(chave)
+    if xml is None:
+        xml = buscar_na_rede(chave)
+        store_xml(chave, xml)
+"""
+
+import os
+import json
+import time
+import gzip
+import tempfile
+import threading
+from collections import OrderedDict
+
+from fetch_metrics import span
+
+DEFAULT_CACHE_DIR = "C:\\CROSSWMS\\xml_cache" if os.name == 'nt' else "/tmp/crosswms/xml_cache"
+CACHE_DIR = os.environ.get("NFE_XML_CACHE_DIR", DEFAULT_CACHE_DIR)
+MEMORY_ENTRIES = int(os.environ.get("NFE_XML_CACHE_MEMORY_ENTRIES", "256"))
+
+FAILURE_INVALID_KEY = "invalid_key"
+FAILURE_NOT_FOUND = "not_found"
+FAILURE_SOURCE_DOWN = "source_down"
+
+# TTL (segundos) do cache negativo por classe de falha, configurável por ambiente
+NEGATIVE_TTL = {
+    FAILURE_INVALID_KEY: int(os.environ.get("NFE_NEGATIVE_TTL_INVALID_KEY", str(7 * 24 * 3600))),
+    FAILURE_NOT_FOUND: int(os.environ.get("NFE_NEGATIVE_TTL_NOT_FOUND", "3600")),
+    FAILURE_SOURCE_DOWN: int(os.environ.get("NFE_NEGATIVE_TTL_SOURCE_DOWN", "300")),
+}
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _is_cacheable_key(invoice_key):
+    return bool(invoice_key) and len(invoice_key) == 44 and invoice_key.isdigit()
+
+
+def cache_path(invoice_key, cache_dir=None):
+    """Caminho do arquivo de cache para a chave (particionado por UF e AAMM)"""
+    return os.path.join(cache_dir or CACHE_DIR, invoice_key[:2], invoice_key[2:6], f"{invoice_key}.xml.gz")
+
+
+def failure_path(invoice_key, cache_dir=None):
+    """Caminho da entrada do cache negativo para a chave"""
+    return os.path.join(cache_dir or CACHE_DIR, invoice_key[:2], invoice_key[2:6], f"{invoice_key}.fail.json")
+
+
+def _atomic_write(path, data):
+    """Grava bytes em `path` via arquivo temporário + os.replace"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _remember(invoice_key, xml_content):
+    with _memory_lock:
+        _memory[invoice_key] = xml_content
+        _memory.move_to_end(invoice_key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def load_xml(invoice_key, cache_dir=None):
+    """Retorna o XML em cache para a chave, ou None se ainda não foi obtido"""
+    with span("cache_lookup", chave=invoice_key) as current:
+        xml_content = _load_xml(invoice_key, cache_dir)
+        current.set(hit=xml_content is not None)
+    return xml_content
+
+
+def _load_xml(invoice_key, cache_dir):
+    if not _is_cacheable_key(invoice_key):
+        return None
+
+    with _memory_lock:
+        xml_content = _memory.get(invoice_key)
+        if xml_content is not None:
+            _memory.move_to_end(invoice_key)
+            return xml_content
+
+    try:
+        with gzip.open(cache_path(invoice_key, cache_dir), "rt", encoding="utf-8") as f:
+            xml_content = f.read()
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        print(f"Cache de XML corrompido para {invoice_key}: {e}")
+        return None
+
+    _remember(invoice_key, xml_content)
+    return xml_content
+
+
+def store_xml(invoice_key, xml_content, cache_dir=None):
+    """
+    Grava o XML no cache de forma atômica
+
+    Returns:
+        str: caminho do arquivo gravado, ou None se o XML não pertence à chave
+    """
+    if not _is_cacheable_key(invoice_key) or not xml_content or invoice_key not in xml_content:
+        return None
+
+    path = cache_path(invoice_key, cache_dir)
+    try:
+        _atomic_write(path, gzip.compress(xml_content.encode("utf-8"), mtime=0))
+    except OSError as e:
+        print(f"Erro ao gravar XML no cache: {e}")
+        return None
+
+    clear_failure(invoice_key, cache_dir)
+    _remember(invoice_key, xml_content)
+    return path
+
+
+def record_failure(invoice_key, failure_class, error=None, ttl=None, cache_dir=None):
+    """Registra no cache negativo que a chave não pôde ser resolvida"""
+    if not _is_cacheable_key(invoice_key):
+        return None
+
+    ttl = NEGATIVE_TTL.get(failure_class, NEGATIVE_TTL[FAILURE_NOT_FOUND]) if ttl is None else ttl
+    if ttl <= 0:
+        return None
+
+    now = time.time()
+    entry = {
+        "failure_class": failure_class,
+        "error": error,
+        "recorded_at": now,
+        "expires_at": now + ttl
+    }
+    try:
+        _atomic_write(failure_path(invoice_key, cache_dir), json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+    except OSError as e:
+        print(f"Erro ao gravar cache negativo: {e}")
+        return None
+    return entry
+
+
+def lookup_failure(invoice_key, cache_dir=None):
+    """Retorna a falha registrada e ainda válida para a chave, ou None"""
+    if not _is_cacheable_key(invoice_key):
+        return None
+
+    path = failure_path(invoice_key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        clear_failure(invoice_key, cache_dir)
+        return None
+
+    if entry.get("expires_at", 0) <= time.time():
+        clear_failure(invoice_key, cache_dir)
+        return None
+    return entry
+
+
+def clear_failure(invoice_key, cache_dir=None):
+    """Remove a entrada do cache negativo (ex.: para forçar nova busca)"""
+    if not _is_cacheable_key(invoice_key):
+        return
+    try:
+        os.remove(failure_path(invoice_key, cache_dir))
+    except OSError:
+        pass
+
+
+def negative_result(entry):
+    """Resposta padrão para uma chave barrada pelo cache negativo"""
+    return {
+        "success": False,
+        "error": entry.get("error") or "Chave consultada recentemente sem sucesso",
+        "failure_class": entry.get("failure_class"),
+        "negative_cache": True,
+        "retry_after": max(0, int(entry.get("expires_at", 0) - time.time()))
+    }
@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
-import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException
-import re
+from http_session import shared_session
+from xml_stream_extractor import xml_text, extract_xml, body_contains
+from browser_waits import wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import get_uf_from_key, decode_key, InvalidAccessKey
+
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("api")
 
 def setup_chrome():
     options = Options()
@@ -21,16 +26,6 @@ def setup_chrome():
     options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
     return webdriver.Chrome(options=options)
 
-def get_uf_from_key(invoice_key):
-    """Extract UF from NFe key"""
-    uf_map = {
-        '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
-        '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
-        '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
-        '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
-    }
-    return uf_map.get(invoice_key[:2], 'SP')
-
 def try_portal_nfe(invoice_key):
     """Try Portal Nacional da NFe"""
     driver = None
@@ -50,9 +45,10 @@ def try_portal_nfe(invoice_key):
         
         # Click search button
         search_button = driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_btnConsultar")
+        before = search_state(driver)
         search_button.click()
         
-        time.sleep(5)
+        wait_for_search_result(driver, before, timeout=10)
         
         # Look for XML download link or content
         xml_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'XML') or contains(@href, '.xml')]")
@@ -61,9 +57,9 @@ def try_portal_nfe(invoice_key):
             href = element.get_attribute('href')
             if href and '.xml' in href:
                 # Download the XML
-                response = requests.get(href, timeout=15)
-                if response.status_code == 200 and invoice_key in response.text:
-                    return response.text
+                response = session.get(href, timeout=15)
+                if response.status_code == 200 and body_contains(response, invoice_key):
+                    return xml_text(response.content)
         
         # Check page source for embedded XML
         page_source = driver.page_source
@@ -104,8 +100,6 @@ def try_sefaz_portal(invoice_key):
         print(f"Accessing SEFAZ {uf} portal for key: {invoice_key}")
         driver.get(portal_url)
         
-        wait = WebDriverWait(driver, 10)
-        
         # Look for input fields for NFe key
         input_selectors = [
             "input[name*='chave']",
@@ -114,13 +108,7 @@ def try_sefaz_portal(invoice_key):
             "input[type='text']"
         ]
         
-        key_input = None
-        for selector in input_selectors:
-            try:
-                key_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                break
-            except:
-                continue
+        key_input = find_first(driver, "input", input_selectors, timeout=10, visible=False)
         
         if key_input:
             key_input.clear()
@@ -130,8 +118,9 @@ def try_sefaz_portal(invoice_key):
             search_buttons = driver.find_elements(By.XPATH, "//button[contains(text(), 'Consultar') or contains(text(), 'Buscar')] | //input[@type='submit']")
             
             if search_buttons:
+                before = search_state(driver)
                 search_buttons[0].click()
-                time.sleep(5)
+                wait_for_search_result(driver, before, timeout=10)
                 
                 # Look for XML content
                 page_source = driver.page_source
@@ -188,13 +177,11 @@ def try_direct_api_calls(invoice_key):
             'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NfeConsulta4/nfeConsultaNF'
         }
         
-        response = requests.post(ws_url, data=soap_envelope, headers=headers, timeout=20)
+        response = session.post(ws_url, data=soap_envelope, headers=headers, timeout=20)
         
-        if response.status_code == 200 and invoice_key in response.text:
+        if response.status_code == 200 and body_contains(response, invoice_key):
             # Extract XML from SOAP response
-            xml_match = re.search(r'<nfeProc.*?</nfeProc>', response.text, re.DOTALL)
-            if xml_match:
-                return xml_match.group(0)
+            return extract_xml(response.content, invoice_key)
     
     except Exception as e:
         print(f"Direct API call error for {uf}: {e}")
@@ -203,17 +190,20 @@ def try_direct_api_calls(invoice_key):
 
 def get_nfe_xml_official(invoice_key):
     """Main function using official channels only"""
-    if not invoice_key or len(invoice_key) != 44 or not invoice_key.isdigit():
-        return {"success": False, "error": "Chave da NFe deve ter 44 dígitos numéricos"}
+    try:
+        key = decode_key(invoice_key)
+    except InvalidAccessKey as e:
+        return {"success": False, "error": str(e)}
     
     print(f"Buscando XML oficial para chave: {invoice_key}")
     
-    # Try official methods in order of reliability
-    methods = [
-        ("Portal Nacional da NFe", try_portal_nfe),
-        ("Portal SEFAZ Estadual", try_sefaz_portal),
-        ("WebService SEFAZ", try_direct_api_calls)
-    ]
+    # Try official methods in order of reliability; the portals are
+    # model-specific (Portal Nacional: NF-e 55, state portals: NFC-e 65)
+    if key.is_nfce:
+        methods = [("Portal SEFAZ Estadual", try_sefaz_portal)]
+    else:
+        methods = [("Portal Nacional da NFe", try_portal_nfe)]
+    methods.append(("WebService SEFAZ", try_direct_api_calls))
     
     for method_name, method_func in methods:
         try:
@@ -2,38 +2,37 @@
 import sys
 import json
 import os
-import requests
 import time
 import re
 from urllib.parse import quote
+from nfe_xml_cache import load_xml, store_xml, cache_path
+from strategy_stats import order_strategies, record_outcome
+from http_session import create_session
+from xml_stream_extractor import extract_xml, fetch_xml, xml_text, body_contains, body_contains_any
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
 class OptimizedRPAFinal:
     def __init__(self):
-        self.session = requests.Session()
+        # Sessão própria (cookies) sobre o pool de conexões compartilhado
+        self.session = create_session("browser", headers={'Cache-Control': 'max-age=0'})
         self.download_folder = "C:\\CROSSWMS"
-        self.setup_session()
-    
-    def setup_session(self):
-        """Configura sessão HTTP otimizada"""
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0'
-        })
     
     def execute_rpa(self, invoice_key):
         """Executa RPA otimizado com foco em resultados práticos"""
         
         print(f"Iniciando RPA otimizado para chave: {invoice_key}")
         
+        # NF-e autorizada é imutável: reaproveita o XML já obtido
+        cached_xml = load_xml(invoice_key)
+        if cached_xml:
+            return {
+                "success": True,
+                "xml_content": cached_xml,
+                "file_path": cache_path(invoice_key),
+                "method": "local_cache",
+                "message": "XML obtido do cache local"
+            }
+        
         # Estratégia principal: Simulação HTTP completa
         result = self.execute_http_rpa(invoice_key)
         if result.get('success'):
@@ -57,16 +56,24 @@ class OptimizedRPAFinal:
             if main_response.status_code != 200:
                 return {"success": False, "attempts": attempts, "error": "Erro ao acessar site principal"}
             
-            # Passo 2: Tenta múltiplas estratégias de consulta
+            # Passo 2: Tenta múltiplas estratégias de consulta, das mais rápidas
+            # e confiáveis para a UF da chave às mais lentas (histórico local)
             consultation_strategies = [
                 self.try_direct_consultation,
                 self.try_form_submission,
                 self.try_api_endpoints,
                 self.try_xml_discovery
             ]
+            uf = get_uf_from_key(invoice_key)
+            consultation_strategies = order_strategies(
+                "optimized_rpa_final", consultation_strategies, uf, name=lambda strategy: strategy.__name__
+            )
             
             for strategy in consultation_strategies:
+                started = time.monotonic()
                 result = strategy(invoice_key, attempts)
+                record_outcome("optimized_rpa_final", strategy.__name__, uf,
+                               bool(result.get('success')), time.monotonic() - started)
                 if result.get('success'):
                     return result
             
@@ -95,8 +102,8 @@ class OptimizedRPAFinal:
                 
                 if response.status_code == 200:
                     # Verifica se encontrou dados da NFe
-                    if invoice_key in response.text and self.has_success_indicators(response.text):
-                        xml_content = self.extract_xml_content(response.text, invoice_key)
+                    if body_contains(response, invoice_key) and self.has_success_indicators(response.content):
+                        xml_content = self.extract_xml_content(response.content, invoice_key)
                         if xml_content:
                             local_file = self.save_xml_locally(xml_content, invoice_key)
                             return {
@@ -108,14 +115,14 @@ class OptimizedRPAFinal:
                             }
                         
                         # Procura link de download
-                        download_url = self.find_download_link(response.text)
+                        download_url = self.find_download_link(response.content)
                         if download_url:
-                            xml_response = self.session.get(download_url, timeout=15)
-                            if xml_response.status_code == 200 and xml_response.text.startswith('<?xml'):
-                                local_file = self.save_xml_locally(xml_response.text, invoice_key)
+                            xml_content = fetch_xml(self.session, download_url)
+                            if xml_content:
+                                local_file = self.save_xml_locally(xml_content, invoice_key)
                                 return {
                                     "success": True,
-                                    "xml_content": xml_response.text,
+                                    "xml_content": xml_content,
                                     "file_path": local_file,
                                     "method": "direct_download",
                                     "message": "XML baixado via link direto"
@@ -153,8 +160,8 @@ class OptimizedRPAFinal:
                 response = self.session.post(f'https://meudanfe.com.br{endpoint}', data=form_data, timeout=20)
                 attempts.append(f"POST {endpoint}: {response.status_code}")
                 
-                if response.status_code == 200 and self.has_success_indicators(response.text):
-                    xml_content = self.extract_xml_content(response.text, invoice_key)
+                if response.status_code == 200 and self.has_success_indicators(response.content):
+                    xml_content = self.extract_xml_content(response.content, invoice_key)
                     if xml_content:
                         local_file = self.save_xml_locally(xml_content, invoice_key)
                         return {
@@ -210,11 +217,12 @@ class OptimizedRPAFinal:
                                 }
                     except:
                         # Não é JSON, pode ser XML direto
-                        if response.text.startswith('<?xml') and invoice_key in response.text:
-                            local_file = self.save_xml_locally(response.text, invoice_key)
+                        if response.content.startswith(b'<?xml') and body_contains(response, invoice_key):
+                            xml_content = xml_text(response.content)
+                            local_file = self.save_xml_locally(xml_content, invoice_key)
                             return {
                                 "success": True,
-                                "xml_content": response.text,
+                                "xml_content": xml_content,
                                 "file_path": local_file,
                                 "method": "api_xml",
                                 "message": "XML obtido via API direta"
@@ -243,12 +251,13 @@ class OptimizedRPAFinal:
                 response = self.session.get(f'https://meudanfe.com.br{path}', timeout=10)
                 attempts.append(f"XML {path}: {response.status_code}")
                 
-                if response.status_code == 200 and response.text.startswith('<?xml'):
-                    if invoice_key in response.text and len(response.text) > 1000:
-                        local_file = self.save_xml_locally(response.text, invoice_key)
+                if response.status_code == 200 and response.content.startswith(b'<?xml'):
+                    if body_contains(response, invoice_key) and len(response.content) > 1000:
+                        xml_content = xml_text(response.content)
+                        local_file = self.save_xml_locally(xml_content, invoice_key)
                         return {
                             "success": True,
-                            "xml_content": response.text,
+                            "xml_content": xml_content,
                             "file_path": local_file,
                             "method": "xml_discovery",
                             "message": "XML descoberto automaticamente"
@@ -260,46 +269,31 @@ class OptimizedRPAFinal:
             attempts.append(f"Erro descoberta: {str(e)}")
             return {"success": False}
     
-    def has_success_indicators(self, html_content):
-        """Verifica indicadores de sucesso na resposta"""
+    def has_success_indicators(self, content):
+        """Verifica indicadores de sucesso no corpo bruto da resposta"""
         indicators = ['sucesso', 'encontrada', 'autorizada', 'válida', 'baixar xml', 'download']
-        return any(indicator in html_content.lower() for indicator in indicators)
+        return body_contains_any(content, *indicators, ignore_case=True)
     
-    def extract_xml_content(self, html_content, invoice_key):
-        """Extrai conteúdo XML da resposta"""
+    def extract_xml_content(self, content, invoice_key):
+        """Extrai conteúdo XML do corpo bruto (só o trecho do XML é decodificado)"""
         try:
-            xml_patterns = [
-                r'<\?xml[^>]*>.*?</nfeProc>',
-                r'<\?xml[^>]*>.*?</NFe>',
-                r'<nfeProc[^>]*>.*?</nfeProc>',
-                r'<NFe[^>]*>.*?</NFe>'
-            ]
-            
-            for pattern in xml_patterns:
-                match = re.search(pattern, html_content, re.DOTALL | re.IGNORECASE)
-                if match and invoice_key in match.group(0):
-                    xml_content = match.group(0)
-                    if len(xml_content) > 2000:
-                        return xml_content
-            
-            return None
-            
+            return extract_xml(content, invoice_key, min_length=2000)
         except Exception:
             return None
     
-    def find_download_link(self, html_content):
-        """Encontra link de download na resposta"""
+    def find_download_link(self, content):
+        """Encontra link de download no corpo bruto da resposta"""
         try:
             patterns = [
-                r'href\s*=\s*["\']([^"\']*download[^"\']*xml[^"\']*)["\']',
-                r'href\s*=\s*["\']([^"\']*xml[^"\']*download[^"\']*)["\']',
-                r'href\s*=\s*["\']([^"\']*baixar[^"\']*)["\']'
+                rb'href\s*=\s*["\']([^"\']*download[^"\']*xml[^"\']*)["\']',
+                rb'href\s*=\s*["\']([^"\']*xml[^"\']*download[^"\']*)["\']',
+                rb'href\s*=\s*["\']([^"\']*baixar[^"\']*)["\']'
             ]
             
             for pattern in patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
+                match = re.search(pattern, content, re.IGNORECASE)
                 if match:
-                    link = match.group(1)
+                    link = match.group(1).decode('utf-8', errors='replace')
                     if link.startswith('/'):
                         return f'https://meudanfe.com.br{link}'
                     elif link.startswith('http'):
@@ -313,23 +307,11 @@ class OptimizedRPAFinal:
             return None
     
     def save_xml_locally(self, xml_content, invoice_key):
-        """Salva XML na pasta local"""
-        try:
-            # Cria pasta se não existir
-            os.makedirs(self.download_folder, exist_ok=True)
-            
-            filename = f"NFe_{invoice_key}.xml"
-            filepath = os.path.join(self.download_folder, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(xml_content)
-            
+        """Salva XML no cache local compartilhado (comprimido, escrita atômica)"""
+        filepath = store_xml(invoice_key, xml_content)
+        if filepath:
             print(f"XML salvo em: {filepath}")
-            return filepath
-            
-        except Exception as e:
-            print(f"Erro ao salvar XML: {e}")
-            return None
+        return filepath
     
     def generate_practical_guidance(self, invoice_key, attempts):
         """Gera orientação prática para o usuário"""
@@ -363,16 +345,6 @@ class OptimizedRPAFinal:
             ]
         }
 
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
-
 def main():
     """Ponto de entrada"""
     if len(sys.argv) != 2:
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
 import os
 import subprocess
 from selenium import webdriver
@@ -12,83 +11,85 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from chrome_driver_pool import get_pool, release_driver
+from download_watcher import wait_for_file
+from lean_page_profile import apply_lean_options, apply_lean_blocking
+from browser_waits import wait_for_value, wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import validate_nfe_key
 
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+def create_replit_chrome(download_dir):
+    """Create Chrome for Replit environment"""
+    options = Options()
+    
+    # Essential options for Replit
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-plugins")
+    options.add_argument("--disable-javascript")
+    options.add_argument("--window-size=1366,768")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    
+    # Use system Chromium
+    chromium_path = "/nix/store/zi4f80l169xlmivz8vja8wlphq74qqk0-chromium-125.0.6422.141/bin/chromium-browser"
+    options.binary_location = chromium_path
+    
+    # Download settings (directory provided by the driver pool)
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True
+    }
+    # Carregamento eager e imagens bloqueadas (o --disable-images é ignorado)
+    apply_lean_options(options, prefs)
+    options.add_experimental_option("prefs", prefs)
+    
+    # Try to use existing chromedriver or download one
+    chromedriver_path = None
+    
+    # Check if chromedriver exists in common locations
+    possible_paths = [
+        "/usr/bin/chromedriver",
+        "/usr/local/bin/chromedriver",
+        "./chromedriver"
+    ]
+    
+    for path in possible_paths:
+        if os.path.exists(path) and os.access(path, os.X_OK):
+            chromedriver_path = path
+            break
+    
+    if not chromedriver_path:
+        # Try to download chromedriver for this version
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            chromedriver_path = ChromeDriverManager().install()
+        except Exception:
+            # Fallback: try to use a specific version
+            chromedriver_path = "/usr/bin/chromedriver"
+    
+    # Create service
+    service = Service(chromedriver_path)
+    
+    # Create driver
+    driver = webdriver.Chrome(service=service, options=options)
+    
+    # Set timeouts
+    driver.set_page_load_timeout(30)
+    driver.implicitly_wait(5)
+    
+    # Bloqueia fontes, mídia, anúncios e analytics por padrão de URL
+    return apply_lean_blocking(driver)
 
 def setup_replit_chrome():
-    """Setup Chrome for Replit environment"""
+    """Borrow a warm Chrome for Replit environment from the shared pool"""
     try:
-        options = Options()
-        
-        # Essential options for Replit
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-plugins")
-        options.add_argument("--disable-images")
-        options.add_argument("--disable-javascript")
-        options.add_argument("--window-size=1366,768")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
-        # Use system Chromium
-        chromium_path = "/nix/store/zi4f80l169xlmivz8vja8wlphq74qqk0-chromium-125.0.6422.141/bin/chromium-browser"
-        options.binary_location = chromium_path
-        
-        # Download settings
-        download_dir = "/tmp/xml_downloads"
-        os.makedirs(download_dir, exist_ok=True)
-        
-        prefs = {
-            "download.default_directory": download_dir,
-            "download.prompt_for_download": False,
-            "download.directory_upgrade": True
-        }
-        options.add_experimental_option("prefs", prefs)
-        
-        # Try to use existing chromedriver or download one
-        chromedriver_path = None
-        
-        # Check if chromedriver exists in common locations
-        possible_paths = [
-            "/usr/bin/chromedriver",
-            "/usr/local/bin/chromedriver",
-            "./chromedriver"
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path) and os.access(path, os.X_OK):
-                chromedriver_path = path
-                break
-        
-        if not chromedriver_path:
-            # Try to download chromedriver for this version
-            try:
-                from webdriver_manager.chrome import ChromeDriverManager
-                chromedriver_path = ChromeDriverManager().install()
-            except Exception:
-                # Fallback: try to use a specific version
-                chromedriver_path = "/usr/bin/chromedriver"
-        
-        # Create service
-        service = Service(chromedriver_path)
-        
-        # Create driver
-        driver = webdriver.Chrome(service=service, options=options)
-        
-        # Set timeouts
-        driver.set_page_load_timeout(30)
-        driver.implicitly_wait(5)
-        
-        return driver, download_dir
+        driver = get_pool("replit_chrome", create_replit_chrome).acquire(timeout=60)
+        return driver, driver.download_dir
         
     except Exception as e:
         print(f"Erro ao configurar Chrome: {e}")
@@ -102,14 +103,7 @@ def execute_meudanfe_rpa(driver, invoice_key):
         # Navigate to the site
         driver.get("https://meudanfe.com.br")
         
-        # Wait for page load
-        wait = WebDriverWait(driver, 15)
-        time.sleep(3)
-        
-        # Try to find search input
-        search_input = None
-        
-        # Multiple selectors to try
+        # Wait for the search input (multiple selectors, one probe)
         input_selectors = [
             "input[type='text']",
             "input[placeholder*='chave']",
@@ -121,33 +115,19 @@ def execute_meudanfe_rpa(driver, invoice_key):
             "#chave"
         ]
         
-        for selector in input_selectors:
-            try:
-                elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                for element in elements:
-                    if element.is_displayed() and element.is_enabled():
-                        search_input = element
-                        print(f"Campo encontrado com seletor: {selector}")
-                        break
-                if search_input:
-                    break
-            except Exception:
-                continue
+        search_input = find_first(driver, "input", input_selectors, timeout=15, enabled=True)
         
         if not search_input:
             return {"success": False, "error": "Campo de busca não encontrado no meudanfe.com.br"}
         
         # Enter the invoice key
         search_input.clear()
-        time.sleep(0.5)
         search_input.send_keys(invoice_key)
-        time.sleep(0.5)
+        wait_for_value(search_input, invoice_key)
         
         print(f"Chave inserida: {invoice_key}")
         
-        # Try to find and click search button
-        search_button = None
-        
+        # Try to find and click search button (CSS first, then text-based buttons)
         button_selectors = [
             "button[type='submit']",
             "input[type='submit']",
@@ -155,33 +135,13 @@ def execute_meudanfe_rpa(driver, invoice_key):
             ".btn-primary",
             ".search-btn"
         ]
+        button_texts = ["Buscar", "Consultar", "Pesquisar"]
+        button_selectors += [f"//button[contains(text(), '{text}')]" for text in button_texts]
         
-        for selector in button_selectors:
-            try:
-                buttons = driver.find_elements(By.CSS_SELECTOR, selector)
-                for button in buttons:
-                    if button.is_displayed() and button.is_enabled():
-                        search_button = button
-                        break
-                if search_button:
-                    break
-            except Exception:
-                continue
-        
-        # Try text-based button search
-        if not search_button:
-            button_texts = ["Buscar", "Consultar", "Pesquisar"]
-            for text in button_texts:
-                try:
-                    xpath = f"//button[contains(text(), '{text}')]"
-                    button = driver.find_element(By.XPATH, xpath)
-                    if button.is_displayed():
-                        search_button = button
-                        break
-                except Exception:
-                    continue
+        search_button = find_first(driver, "search", button_selectors, enabled=True)
         
         # Submit the search
+        before = search_state(driver)
         if search_button:
             try:
                 driver.execute_script("arguments[0].click();", search_button)
@@ -194,48 +154,24 @@ def execute_meudanfe_rpa(driver, invoice_key):
             print("Busca enviada via Enter")
         
         # Wait for results
-        time.sleep(5)
-        
-        # Look for XML or download links
-        download_link = None
+        wait_for_search_result(driver, before)
         
+        # Look for XML or download links (CSS first, then text-based links)
         download_selectors = [
             "a[href*='.xml']",
             "a[href*='xml']",
             "a[href*='download']"
         ]
+        download_texts = ["Download", "XML", "Baixar"]
+        download_selectors += [f"//a[contains(text(), '{text}')]" for text in download_texts]
         
-        for selector in download_selectors:
-            try:
-                links = driver.find_elements(By.CSS_SELECTOR, selector)
-                for link in links:
-                    if link.is_displayed():
-                        download_link = link
-                        break
-                if download_link:
-                    break
-            except Exception:
-                continue
-        
-        # Try text-based download links
-        if not download_link:
-            download_texts = ["Download", "XML", "Baixar"]
-            for text in download_texts:
-                try:
-                    xpath = f"//a[contains(text(), '{text}')]"
-                    link = driver.find_element(By.XPATH, xpath)
-                    if link.is_displayed():
-                        download_link = link
-                        break
-                except Exception:
-                    continue
+        download_link = find_first(driver, "download", download_selectors)
         
         if download_link:
             try:
                 driver.execute_script("arguments[0].click();", download_link)
                 print("Download iniciado")
-                time.sleep(3)
-                return check_xml_download(invoice_key)
+                return check_xml_download(invoice_key, driver.download_dir)
             except Exception as e:
                 print(f"Erro ao fazer download: {e}")
         
@@ -262,33 +198,20 @@ def execute_meudanfe_rpa(driver, invoice_key):
         print(f"Erro durante automação: {e}")
         return {"success": False, "error": f"Erro na automação: {str(e)}"}
 
-def check_xml_download(invoice_key):
+def check_xml_download(invoice_key, download_dir="/tmp/xml_downloads"):
     """Check if XML file was downloaded"""
-    download_dir = "/tmp/xml_downloads"
-    
     try:
-        for i in range(8):  # Wait up to 8 seconds
-            if os.path.exists(download_dir):
-                files = os.listdir(download_dir)
-                xml_files = [f for f in files if f.endswith('.xml')]
-                
-                if xml_files:
-                    # Get the newest file
-                    latest_file = max([os.path.join(download_dir, f) for f in xml_files], 
-                                    key=os.path.getctime)
-                    
-                    with open(latest_file, 'r', encoding='utf-8') as f:
-                        xml_content = f.read()
-                    
-                    # Verify it contains our invoice key
-                    if invoice_key in xml_content:
-                        return {
-                            "success": True,
-                            "xml_content": xml_content,
-                            "message": f"XML baixado: {os.path.basename(latest_file)}"
-                        }
+        # Wait up to 8 seconds for the finished file (event-driven, no polling)
+        xml_file = wait_for_file(download_dir, invoice_key, timeout=8)
+        if xml_file:
+            with open(xml_file, 'r', encoding='utf-8') as f:
+                xml_content = f.read()
             
-            time.sleep(1)
+            return {
+                "success": True,
+                "xml_content": xml_content,
+                "message": f"XML baixado: {os.path.basename(xml_file)}"
+            }
         
         return {"success": False, "error": "Download não completado ou arquivo não contém chave correta"}
         
@@ -315,21 +238,8 @@ def run_rpa_automation(invoice_key):
         return result
         
     finally:
-        # Cleanup
-        try:
-            driver.quit()
-        except Exception:
-            pass
-        
-        # Clean download directory
-        try:
-            if download_dir and os.path.exists(download_dir):
-                for file in os.listdir(download_dir):
-                    file_path = os.path.join(download_dir, file)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-        except Exception:
-            pass
+        # Return driver to the pool (cookies, tabs and downloads are reset there)
+        release_driver(driver)
 
 def main():
     """Entry point"""
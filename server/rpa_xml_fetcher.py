@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
 import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -9,6 +8,14 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from http_session import shared_session
+from browser_waits import wait_until, element_present, wait_for_search_result, search_state
+from selector_probe import find_first
+from xml_stream_extractor import xml_text, body_contains
+from nfe_access_key import validate_nfe_key
+
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("browser")
 
 def get_chrome_driver():
     options = Options()
@@ -21,8 +28,9 @@ def get_chrome_driver():
     return webdriver.Chrome(options=options)
 
 def extract_xml_from_meudanfe(invoice_key):
-    if not invoice_key or len(invoice_key) != 44:
-        return {"success": False, "error": "Chave deve ter 44 dígitos"}
+    is_valid, message = validate_nfe_key(invoice_key)
+    if not is_valid:
+        return {"success": False, "error": message}
     
     driver = None
     try:
@@ -31,7 +39,6 @@ def extract_xml_from_meudanfe(invoice_key):
         
         # Access meudanfe.com.br
         driver.get("https://meudanfe.com.br/")
-        wait = WebDriverWait(driver, 10)
         
         # Find and fill the input field
         input_selectors = [
@@ -40,13 +47,7 @@ def extract_xml_from_meudanfe(invoice_key):
             "input[type='text']"
         ]
         
-        input_element = None
-        for selector in input_selectors:
-            try:
-                input_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                break
-            except TimeoutException:
-                continue
+        input_element = find_first(driver, "input", input_selectors, timeout=10, visible=False)
         
         if not input_element:
             return {"success": False, "error": "Campo de entrada não encontrado"}
@@ -55,68 +56,45 @@ def extract_xml_from_meudanfe(invoice_key):
         input_element.send_keys(invoice_key)
         
         # Find and click search button
-        search_button = None
-        try:
-            search_button = driver.find_element(By.XPATH, "//button[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]")
-        except NoSuchElementException:
-            try:
-                search_button = driver.find_element(By.CSS_SELECTOR, "input[type='submit']")
-            except NoSuchElementException:
-                try:
-                    search_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-                except NoSuchElementException:
-                    pass
-        
+        search_button = find_first(driver, "search", [
+            "//button[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]",
+            "input[type='submit']",
+            "button[type='submit']"
+        ], visible=False)
         if not search_button:
-            # Try XPath approach
-            try:
-                search_button = driver.find_element(By.XPATH, "//button[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]")
-            except NoSuchElementException:
-                return {"success": False, "error": "Botão de busca não encontrado"}
+            return {"success": False, "error": "Botão de busca não encontrado"}
         
+        before = search_state(driver)
         search_button.click()
-        time.sleep(3)
+        wait_for_search_result(driver, before)
         
         # Look for XML download links
-        xml_link = None
-        try:
-            xml_link = driver.find_element(By.CSS_SELECTOR, "a[href*='xml']")
-        except NoSuchElementException:
-            try:
-                xml_link = driver.find_element(By.XPATH, "//a[contains(@href, 'xml') or contains(text(), 'XML')]")
-            except NoSuchElementException:
-                try:
-                    xml_link = driver.find_element(By.XPATH, "//button[contains(text(), 'XML')]")
-                except NoSuchElementException:
-                    pass
-        
-        if not xml_link:
-            try:
-                xml_link = driver.find_element(By.XPATH, "//a[contains(@href, 'xml') or contains(text(), 'XML')]")
-            except NoSuchElementException:
-                pass
+        xml_link = find_first(driver, "download", [
+            "a[href*='xml']",
+            "//a[contains(@href, 'xml') or contains(text(), 'XML')]",
+            "//button[contains(text(), 'XML')]"
+        ], visible=False)
         
         if xml_link:
             href = xml_link.get_attribute('href')
             if href:
                 # Download XML using requests
                 try:
-                    response = requests.get(href, timeout=15)
-                    if response.status_code == 200 and response.text.strip():
-                        xml_content = response.text
-                        if '<?xml' in xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": "XML obtido com sucesso"
-                            }
+                    response = session.get(href, timeout=15)
+                    if response.status_code == 200 and body_contains(response, '<?xml'):
+                        xml_content = xml_text(response.content)
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": "XML obtido com sucesso"
+                        }
                 except requests.RequestException:
                     pass
             
             # Try clicking the link
             try:
                 xml_link.click()
-                time.sleep(2)
+                wait_until(driver, element_present("//pre | //textarea | //*[contains(text(), '<?xml')]"), timeout=5)
                 
                 # Check if XML content appeared on page
                 xml_elements = driver.find_elements(By.XPATH, "//pre | //textarea | //*[contains(text(), '<?xml')]")
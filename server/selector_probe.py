@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Busca de elementos por lista de seletores em uma única consulta ao navegador
+Em vez de um WebDriverWait (ou find_elements) por seletor, todos os
+candidatos vão num só execute_script, que devolve o primeiro elemento que
+casar, na ordem da lista. A espera, quando houver, repete essa consulta até
+um prazo único para a lista inteira.
+
+O seletor que casou fica memorizado por site e papel ("input", "search",
+"download"...) num JSON (NFE_LEARNED_SELECTORS) e passa a ser tentado
+primeiro nas próximas buscas.
+
+Seletores aceitos: CSS, XPath (começando com "/" ou "(") e o atalho
+"tag.classe:contains('texto')" usado nas listas antigas.
+
+Uso:
+    search_input = find_first(driver, "input", input_selectors, timeout=8)
+    download_link = find_first(driver, "download", download_selectors)
+"""
+
+import os
+import re
+import json
+import threading
+from urllib.parse import urlparse
+
+from browser_waits import wait_until
+
+if os.name == 'nt':
+    MEMO_PATH = os.environ.get("NFE_LEARNED_SELECTORS", r"C:\CROSSWMS\learned_selectors.json")
+else:
+    MEMO_PATH = os.environ.get("NFE_LEARNED_SELECTORS", "/tmp/crosswms/learned_selectors.json")
+
+_CONTAINS_RE = re.compile(r"""^([\w*-]*)(?:\.([\w-]+))?:contains\(['"](.+)['"]\)$""")
+
+PROBE_SCRIPT = """
+const candidates = arguments[0];
+const requireVisible = arguments[1];
+const requireEnabled = arguments[2];
+const usable = (node) => {
+    if (requireVisible && !(node.offsetWidth || node.offsetHeight || node.getClientRects().length)) return false;
+    if (requireEnabled && node.disabled) return false;
+    return true;
+};
+for (let i = 0; i < candidates.length; i++) {
+    const [kind, selector] = candidates[i];
+    let nodes = [];
+    try {
+        if (kind === 'xpath') {
+            const found = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let j = 0; j < found.snapshotLength; j++) nodes.push(found.snapshotItem(j));
+        } else {
+            nodes = document.querySelectorAll(selector);
+        }
+    } catch (e) {
+        continue;
+    }
+    for (const node of nodes) {
+        if (usable(node)) return [i, node];
+    }
+}
+return null;
+"""
+
+
+def to_candidate(selector):
+    """("xpath" | "css", seletor) para um seletor da lista"""
+    match = _CONTAINS_RE.match(selector)
+    if match:
+        tag, css_class, text = match.groups()
+        class_test = f"[contains(@class, '{css_class}')]" if css_class else ''
+        return 'xpath', f"//{tag or '*'}{class_test}[contains(text(), '{text}')]"
+    if selector.startswith(('/', '(')):
+        return 'xpath', selector
+    return 'css', selector
+
+
+class LearnedSelectors:
+    """Seletor que funcionou por site e papel, persistido em JSON"""
+
+    def __init__(self, path=MEMO_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def ordered(self, site, role, selectors):
+        """A lista com o seletor aprendido na frente"""
+        with self._lock:
+            learned = self._load().get(site, {}).get(role)
+        if learned in selectors:
+            return [learned] + [s for s in selectors if s != learned]
+        return list(selectors)
+
+    def remember(self, site, role, selector):
+        with self._lock:
+            data = self._load()
+            if data.get(site, {}).get(role) == selector:
+                return
+            data.setdefault(site, {})[role] = selector
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Não foi possível salvar seletores aprendidos: {e}")
+
+
+learned_selectors = LearnedSelectors()
+
+
+def probe(driver, selectors, visible=True, enabled=False):
+    """
+    Uma consulta ao navegador para a lista inteira
+
+    Returns:
+        (seletor, elemento) do primeiro candidato que casou, ou (None, None)
+    """
+    result = driver.execute_script(PROBE_SCRIPT, [to_candidate(s) for s in selectors], visible, enabled)
+    if not result:
+        return None, None
+    index, element = result
+    return selectors[index], element
+
+
+def find_first(driver, role, selectors, timeout=0, site=None, visible=True, enabled=False):
+    """
+    Primeiro elemento que casa com algum seletor, tentando antes o aprendido
+
+    Args:
+        driver: WebDriver
+        role: papel do elemento na página ("input", "search", "download"...)
+        selectors: candidatos (CSS, XPath ou "tag:contains('texto')")
+        timeout: prazo total em segundos (0 = consulta única, sem esperar)
+        site: chave da memorização (padrão: host da página atual)
+        visible: exige elemento visível
+        enabled: exige elemento habilitado
+
+    Returns:
+        WebElement ou None
+    """
+    site = site or urlparse(driver.current_url).hostname or 'local'
+    ordered = learned_selectors.ordered(site, role, selectors)
+
+    def check(d):
+        selector, element = probe(d, ordered, visible, enabled)
+        return (selector, element) if element is not None else False
+
+    if timeout > 0:
+        found = wait_until(driver, check, timeout=timeout)
+    else:
+        found = check(driver)
+    if not found:
+        return None
+
+    selector, element = found
+    learned_selectors.remember(site, role, selector)
+    return element
@@ -2,9 +2,7 @@
 import sys
 import json
 import os
-import time
 import glob
-import shutil
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -12,46 +10,64 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from chrome_driver_pool import get_pool, release_driver
+from cdp_download_capture import click_and_capture
+from browser_waits import wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import validate_nfe_key
+
+def create_selenium_driver(download_dir):
+    """Configura Chrome WebDriver com download automático"""
+    chrome_options = Options()
+    
+    # Configura pasta de download
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    chrome_options.add_experimental_option("prefs", prefs)
+    
+    # Configurações do Chrome
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # Tenta usar ChromeDriver local
+    if os.path.exists("./chromedriver"):
+        service = Service("./chromedriver")
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    else:
+        # Fallback para ChromeDriver no PATH
+        driver = webdriver.Chrome(options=chrome_options)
+    
+    # Remove indicadores de automação em todas as páginas carregadas
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+    })
+    
+    return driver
 
 class MeuDanfeSeleniumRPA:
     def __init__(self, download_folder="C:\\CROSSWMS"):
+        self.download_root = download_folder
         self.download_folder = download_folder
         self.driver = None
         self.setup_driver()
     
     def setup_driver(self):
-        """Configura Chrome WebDriver com download automático"""
-        chrome_options = Options()
-        
-        # Configura pasta de download
-        prefs = {
-            "download.default_directory": self.download_folder,
-            "download.prompt_for_download": False,
-            "download.directory_upgrade": True,
-            "safebrowsing.enabled": True
-        }
-        chrome_options.add_experimental_option("prefs", prefs)
-        
-        # Configurações do Chrome
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
+        """Empresta um Chrome pré-lançado do pool compartilhado"""
         try:
-            # Tenta usar ChromeDriver local
-            if os.path.exists("./chromedriver"):
-                service = Service("./chromedriver")
-                self.driver = webdriver.Chrome(service=service, options=chrome_options)
-            else:
-                # Fallback para ChromeDriver no PATH
-                self.driver = webdriver.Chrome(options=chrome_options)
+            pool = get_pool("selenium_download", create_selenium_driver, download_root=self.download_root)
+            self.driver = pool.acquire(timeout=60)
             
-            # Remove indicadores de automação
-            self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            # Cada driver do pool baixa em sua própria subpasta
+            self.download_folder = self.driver.download_dir
             
         except Exception as e:
             print(f"Erro ao inicializar Chrome: {e}")
@@ -84,15 +100,7 @@ class MeuDanfeSeleniumRPA:
                 'input[type="text"]'
             ]
             
-            input_element = None
-            for selector in input_selectors:
-                try:
-                    input_element = WebDriverWait(self.driver, 5).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                    )
-                    break
-                except TimeoutException:
-                    continue
+            input_element = find_first(self.driver, "input", input_selectors, timeout=5, enabled=True)
             
             if not input_element:
                 # Procura por campo de input de forma mais ampla
@@ -120,13 +128,7 @@ class MeuDanfeSeleniumRPA:
                 '.btn:contains("Buscar")'
             ]
             
-            search_button = None
-            for selector in button_selectors:
-                try:
-                    search_button = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    break
-                except NoSuchElementException:
-                    continue
+            search_button = find_first(self.driver, "search", button_selectors, visible=False)
             
             # Se não encontrou, procura por texto "Buscar" em qualquer elemento
             if not search_button:
@@ -141,10 +143,11 @@ class MeuDanfeSeleniumRPA:
             
             # Clica no botão de busca
             print("Clicando no botão de busca...")
+            before = search_state(self.driver)
             search_button.click()
             
             # Aguarda carregamento dos resultados
-            time.sleep(3)
+            wait_for_search_result(self.driver, before)
             
             # Procura por indicações de sucesso
             page_text = self.driver.page_source.lower()
@@ -160,13 +163,7 @@ class MeuDanfeSeleniumRPA:
                     '.btn:contains("XML")'
                 ]
                 
-                download_button = None
-                for selector in download_selectors:
-                    try:
-                        download_button = self.driver.find_element(By.CSS_SELECTOR, selector)
-                        break
-                    except NoSuchElementException:
-                        continue
+                download_button = find_first(self.driver, "download", download_selectors, visible=False)
                 
                 # Procura por texto "Baixar XML" ou "Download"
                 if not download_button:
@@ -178,24 +175,24 @@ class MeuDanfeSeleniumRPA:
                 
                 if download_button:
                     print("Clicando no botão de download...")
-                    download_button.click()
-                    
-                    # Aguarda download completar
-                    xml_file = self.wait_for_download(invoice_key)
+                    # Captura o XML em memória (CDP); sem CDP, espera o arquivo no disco
+                    xml_content = click_and_capture(
+                        self.driver, download_button.click, invoice_key, self.download_folder
+                    )
                     
-                    if xml_file:
-                        # Lê o conteúdo do XML baixado
-                        xml_content = self.read_xml_file(xml_file)
-                        
-                        if xml_content and invoice_key in xml_content:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "file_path": xml_file,
-                                "message": "XML baixado com sucesso via RPA Selenium"
-                            }
-                        else:
-                            return {"success": False, "error": "XML baixado mas conteúdo inválido"}
+                    if xml_content and invoice_key in xml_content:
+                        # Grava direto na pasta final (o reset do driver limpa a subpasta)
+                        final_path = os.path.join(self.download_root, f"{invoice_key}.xml")
+                        with open(final_path, 'w', encoding='utf-8') as f:
+                            f.write(xml_content)
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "file_path": final_path,
+                            "message": "XML baixado com sucesso via RPA Selenium"
+                        }
+                    elif xml_content:
+                        return {"success": False, "error": "XML baixado mas conteúdo inválido"}
                     else:
                         return {"success": False, "error": "Download não completou no tempo esperado"}
                 else:
@@ -209,7 +206,8 @@ class MeuDanfeSeleniumRPA:
         
         finally:
             if self.driver:
-                self.driver.quit()
+                release_driver(self.driver)
+                self.driver = None
     
     def cleanup_old_xmls(self):
         """Remove XMLs antigos da pasta de download"""
@@ -220,50 +218,6 @@ class MeuDanfeSeleniumRPA:
                 os.remove(file)
         except Exception as e:
             print(f"Erro ao limpar pasta: {e}")
-    
-    def wait_for_download(self, invoice_key, timeout=30):
-        """Aguarda download do XML completar"""
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            # Procura por arquivos XML na pasta
-            xml_files = glob.glob(os.path.join(self.download_folder, "*.xml"))
-            
-            for file in xml_files:
-                # Verifica se não é arquivo temporário de download
-                if not file.endswith('.crdownload') and not file.endswith('.tmp'):
-                    # Verifica se arquivo contém a chave NFe
-                    try:
-                        with open(file, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            if invoice_key in content:
-                                print(f"XML encontrado: {file}")
-                                return file
-                    except:
-                        continue
-            
-            time.sleep(1)
-        
-        return None
-    
-    def read_xml_file(self, file_path):
-        """Lê conteúdo do arquivo XML"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            print(f"Erro ao ler XML: {e}")
-            return None
-
-def validate_nfe_key(invoice_key):
-    """Valida formato da chave NFe"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave NFe deve ter exatamente 44 dígitos"
-    
-    if not invoice_key.isdigit():
-        return False, "Chave NFe deve conter apenas números"
-    
-    return True, "Chave válida"
 
 def main():
     """Ponto de entrada"""
@@ -1,30 +1,65 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import re
+import time
+import threading
+from functools import partial
 from urllib.parse import quote
 import xml.etree.ElementTree as ET
+from strategy_racer import race_strategies
+from strategy_stats import order_strategies, record_outcome
+from circuit_breaker import guarded_request
+from http_session import shared_session, create_session
+from nfe_xml_cache import (
+    load_xml, store_xml, lookup_failure, record_failure, clear_failure, negative_result,
+    FAILURE_INVALID_KEY, FAILURE_NOT_FOUND, FAILURE_SOURCE_DOWN
+)
+from xml_stream_extractor import extract_xml, body_contains
+from nfe_access_key import validate_nfe_key, get_uf_from_key
 
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("api")
 
-def get_uf_from_key(invoice_key):
-    """Extract UF from NFe key"""
-    uf_map = {
-        '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
-        '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL',
-        '28': 'SE', '29': 'BA', '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP', '41': 'PR',
-        '42': 'SC', '43': 'RS', '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
-    }
-    return uf_map.get(invoice_key[:2], 'SP')
+# Only authoritative answers classify a failure: a SEFAZ cStat, or the portal
+# explicitly saying the NF-e was not found. Third-party APIs (a 404 from a
+# dead API) say nothing about the key. Each lookup collects its own set.
+_CSTAT_RE = re.compile(rb'<cStat>(\d{3})</cStat>')
+CSTAT_INVALID_KEY = b'236'
+CSTAT_SERVICE_DOWN = {b'108', b'109'}
+_PORTAL_NOT_FOUND_RE = re.compile(
+    r'(?:NF-?e|nota|chave)[^<]{0,60}?n(?:ã|a)o\s+(?:foi\s+)?(?:encontrad|localizad)|n(?:ã|a)o\s+consta\s+na\s+base'.encode('utf-8'),
+    re.IGNORECASE
+)
+_outcomes_lock = threading.Lock()
+
+def note_outcome(outcomes, outcome):
+    """Record a source outcome ("answered" or "invalid_key") in the lookup's set"""
+    if outcomes is not None:
+        with _outcomes_lock:
+            outcomes.add(outcome)
+
+def note_sefaz_response(outcomes, response):
+    """Record the cStat of a SEFAZ consultation reply (108/109: service paused)"""
+    match = _CSTAT_RE.search(response.content)
+    if not match or match.group(1) in CSTAT_SERVICE_DOWN:
+        return
+    note_outcome(outcomes, "invalid_key" if match.group(1) == CSTAT_INVALID_KEY else "answered")
+
+def note_portal_response(outcomes, response):
+    """Record the portal explicitly reporting the NF-e as not found"""
+    if response.status_code == 200 and _PORTAL_NOT_FOUND_RE.search(response.content):
+        note_outcome(outcomes, "answered")
 
-def try_receita_federal_api(invoice_key):
+def classify_failure(outcomes):
+    """Map the collected source outcomes to a negative-cache failure class"""
+    if "invalid_key" in outcomes:
+        return FAILURE_INVALID_KEY
+    if "answered" not in outcomes:
+        return FAILURE_SOURCE_DOWN
+    return FAILURE_NOT_FOUND
+
+def try_receita_federal_api(invoice_key, outcomes=None):
     """Try Receita Federal NFe consultation"""
     try:
         # Official Receita Federal NFe consultation endpoint
@@ -51,27 +86,19 @@ def try_receita_federal_api(invoice_key):
             'User-Agent': 'NFe-Consultation/1.0'
         }
         
-        response = requests.post(url, data=soap_body, headers=headers, timeout=30)
+        response = guarded_request(session, 'POST', url, data=soap_body, headers=headers, timeout=30)
+        note_sefaz_response(outcomes, response)
         
-        if response.status_code == 200:
-            content = response.text
-            if invoice_key in content and 'protNFe' in content:
-                # Extract NFe XML from SOAP response
-                xml_match = re.search(r'<nfeProc.*?</nfeProc>', content, re.DOTALL)
-                if xml_match:
-                    return xml_match.group(0)
-                
-                # Try alternative extraction
-                xml_match = re.search(r'<NFe.*?</NFe>', content, re.DOTALL)
-                if xml_match:
-                    return xml_match.group(0)
+        if response.status_code == 200 and body_contains(response, invoice_key, 'protNFe'):
+            # Extract NFe XML (nfeProc, or a bare NFe) from SOAP response
+            return extract_xml(response.content, invoice_key)
     
     except Exception as e:
         print(f"Receita Federal API error: {e}")
     
     return None
 
-def try_sefaz_webservice(invoice_key):
+def try_sefaz_webservice(invoice_key, outcomes=None):
     """Try SEFAZ webservice based on UF"""
     uf = get_uf_from_key(invoice_key)
     
@@ -112,20 +139,19 @@ def try_sefaz_webservice(invoice_key):
             'User-Agent': 'NFe-Consultation/1.0'
         }
         
-        response = requests.post(ws_url, data=soap_envelope, headers=headers, timeout=25)
+        response = guarded_request(session, 'POST', ws_url, data=soap_envelope, headers=headers, timeout=25)
+        note_sefaz_response(outcomes, response)
         
-        if response.status_code == 200 and invoice_key in response.text:
+        if response.status_code == 200 and body_contains(response, invoice_key):
             # Extract XML from SOAP response
-            xml_match = re.search(r'<nfeProc.*?</nfeProc>', response.text, re.DOTALL)
-            if xml_match:
-                return xml_match.group(0)
+            return extract_xml(response.content, invoice_key)
     
     except Exception as e:
         print(f"SEFAZ {uf} webservice error: {e}")
     
     return None
 
-def try_portal_consultation(invoice_key):
+def try_portal_consultation(invoice_key, outcomes=None):
     """Try direct portal consultation"""
     try:
         # Portal Nacional da NFe
@@ -140,8 +166,8 @@ def try_portal_consultation(invoice_key):
         }
         
         # Make initial request to get session
-        session = requests.Session()
-        response = session.get(portal_url, headers=headers, timeout=15)
+        portal_session = create_session("browser")
+        response = guarded_request(portal_session, 'GET', portal_url, headers=headers, timeout=15)
         
         if response.status_code == 200:
             # Look for form fields and viewstate
@@ -151,27 +177,24 @@ def try_portal_consultation(invoice_key):
             }
             
             # Extract viewstate if present
-            viewstate_match = re.search(r'name="__VIEWSTATE" value="([^"]*)"', response.text)
+            viewstate_match = re.search(rb'name="__VIEWSTATE" value="([^"]*)"', response.content)
             if viewstate_match:
-                form_data['__VIEWSTATE'] = viewstate_match.group(1)
+                form_data['__VIEWSTATE'] = viewstate_match.group(1).decode('ascii')
             
             # Submit form
-            response = session.post(portal_url, data=form_data, headers=headers, timeout=20)
+            response = guarded_request(portal_session, 'POST', portal_url, data=form_data, headers=headers, timeout=20)
+            note_portal_response(outcomes, response)
             
-            if response.status_code == 200 and invoice_key in response.text:
+            if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
                 # Look for XML content in response
-                if '<?xml' in response.text:
-                    xml_start = response.text.find('<?xml')
-                    xml_end = response.text.find('</nfeProc>', xml_start)
-                    if xml_end != -1:
-                        return response.text[xml_start:xml_end + 10]
+                return extract_xml(response.content, invoice_key)
     
     except Exception as e:
         print(f"Portal consultation error: {e}")
     
     return None
 
-def try_public_nfe_apis(invoice_key):
+def try_public_nfe_apis(invoice_key, outcomes=None):
     """Try third-party public NFe APIs"""
     public_apis = [
         f"https://api.nfe.eti.br/v1/nfe/{invoice_key}",
@@ -184,46 +207,73 @@ def try_public_nfe_apis(invoice_key):
         'Accept': 'application/json, application/xml, text/xml'
     }
     
-    for api_url in public_apis:
-        try:
-            response = requests.get(api_url, headers=headers, timeout=15)
-            
-            if response.status_code == 200:
-                content = response.text
-                
-                # Check if response contains XML
-                if '<?xml' in content and invoice_key in content:
-                    # Try to extract clean XML
-                    xml_start = content.find('<?xml')
-                    xml_end = content.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = content.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = content[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:  # Ensure it's substantial XML
-                            return xml_content
-                
-                # Try JSON response
-                try:
-                    json_data = response.json()
-                    if 'xml' in json_data and invoice_key in str(json_data['xml']):
-                        return json_data['xml']
-                except:
-                    pass
+    uf = get_uf_from_key(invoice_key)
+    endpoint = lambda url: url.replace(invoice_key, "{chave}")
+    
+    for api_url in order_strategies("simple_nfe_api.public_apis", public_apis, uf, name=endpoint):
+        started = time.monotonic()
+        xml_content = fetch_public_api(api_url, invoice_key, headers)
+        record_outcome("simple_nfe_api.public_apis", endpoint(api_url), uf, xml_content is not None, time.monotonic() - started)
+        if xml_content is not None:
+            return xml_content
+    
+    return None
+
+def fetch_public_api(api_url, invoice_key, headers):
+    """Query one public NFe API; returns the XML or None"""
+    try:
+        response = guarded_request(session, 'GET', api_url, headers=headers, timeout=15)
         
-        except Exception as e:
-            print(f"Public API {api_url} error: {e}")
-            continue
+        if response.status_code == 200:
+            # Check if response contains XML
+            if body_contains(response, '<?xml', invoice_key):
+                # Try to extract clean XML (ensure it's substantial XML)
+                xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                if xml_content:
+                    return xml_content
+            
+            # Try JSON response
+            try:
+                json_data = response.json()
+                if 'xml' in json_data and invoice_key in str(json_data['xml']):
+                    return json_data['xml']
+            except:
+                pass
     
+    except Exception as e:
+        print(f"Public API {api_url} error: {e}")
+
     return None
 
-def get_nfe_xml_simple(invoice_key):
-    """Main function with multiple consultation methods"""
-    # Validate key
+def get_nfe_xml_simple(invoice_key, force_refresh=False):
+    """
+    Main function with multiple consultation methods
+
+    Keys that recently failed are answered from the negative cache until
+    their TTL expires; force_refresh=True ignores that entry and refetches.
+    """
+    # Validate key (format, UF, model and check digit) before any source is hit
     is_valid, message = validate_nfe_key(invoice_key)
     if not is_valid:
-        return {"success": False, "error": message}
+        return {"success": False, "error": message, "failure_class": FAILURE_INVALID_KEY}
+    
+    # NF-e autorizada é imutável: reaproveita o XML já obtido
+    cached_xml = load_xml(invoice_key)
+    if cached_xml:
+        return {
+            "success": True,
+            "xml_content": cached_xml,
+            "message": "XML obtido do cache local",
+            "invoice_key": invoice_key
+        }
+    
+    if force_refresh:
+        clear_failure(invoice_key)
+    else:
+        failure = lookup_failure(invoice_key)
+        if failure:
+            print(f"Chave {invoice_key} barrada pelo cache negativo ({failure['failure_class']})")
+            return negative_result(failure)
     
     print(f"Iniciando consulta NFe para chave: {invoice_key}")
     
@@ -234,35 +284,51 @@ def get_nfe_xml_simple(invoice_key):
         ("APIs Públicas", try_public_nfe_apis)
     ]
     
-    for method_name, method_func in methods:
-        try:
-            print(f"Tentando: {method_name}")
-            xml_content = method_func(invoice_key)
-            
-            if xml_content and len(xml_content) > 500 and invoice_key in xml_content:
-                print(f"✅ XML obtido via {method_name}")
-                return {
-                    "success": True,
-                    "xml_content": xml_content,
-                    "message": f"XML obtido via {method_name}",
-                    "invoice_key": invoice_key
-                }
-        except Exception as e:
-            print(f"Erro em {method_name}: {e}")
-            continue
+    # Fastest/most reliable sources for this UF first, from recorded outcomes
+    uf = get_uf_from_key(invoice_key)
+    methods = order_strategies("simple_nfe_api", methods, uf)
+    
+    # What the sources said about this key in this lookup, to classify a failure
+    outcomes = set()
+    
+    # Race the methods (hedged) and keep the first valid XML
+    method_name, xml_content = race_strategies(
+        [(name, partial(method, outcomes=outcomes)) for name, method in methods], invoice_key,
+        validate=lambda xml: bool(xml) and len(xml) > 500 and invoice_key in xml,
+        on_outcome=lambda name, accepted, elapsed: record_outcome("simple_nfe_api", name, uf, accepted, elapsed)
+    )
+    
+    if method_name:
+        print(f"✅ XML obtido via {method_name}")
+        store_xml(invoice_key, xml_content)
+        return {
+            "success": True,
+            "xml_content": xml_content,
+            "message": f"XML obtido via {method_name}",
+            "invoice_key": invoice_key
+        }
+    
+    error = f"Não foi possível obter o XML da NFe {invoice_key}. A chave pode estar incorreta ou a nota fiscal pode não ter sido autorizada pela SEFAZ."
+    failure_class = classify_failure(outcomes)
+    record_failure(invoice_key, failure_class, error)
     
     return {
         "success": False,
-        "error": f"Não foi possível obter o XML da NFe {invoice_key}. A chave pode estar incorreta ou a nota fiscal pode não ter sido autorizada pela SEFAZ.",
+        "error": error,
+        "failure_class": failure_class,
         "tried_methods": [method[0] for method in methods]
     }
 
 def main():
-    if len(sys.argv) != 2:
+    args = sys.argv[1:]
+    force_refresh = "--force" in args
+    args = [arg for arg in args if arg != "--force"]
+    
+    if len(args) != 1:
         result = {"success": False, "error": "Chave NFe é obrigatória"}
     else:
-        invoice_key = sys.argv[1].strip()
-        result = get_nfe_xml_simple(invoice_key)
+        invoice_key = args[0].strip()
+        result = get_nfe_xml_simple(invoice_key, force_refresh=force_refresh)
     
     print(json.dumps(result, ensure_ascii=False))
 
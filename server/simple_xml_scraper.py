@@ -1,23 +1,26 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
 import tempfile
-import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from download_watcher import wait_for_file
+from browser_waits import wait_for_search_result, search_state
+from selector_probe import find_first
+from nfe_access_key import validate_nfe_key
 
 def fetch_xml_from_meudanfe(chave_nota_fiscal):
     """Fetch XML from meudanfe.com.br using Selenium automation"""
     
-    if not chave_nota_fiscal or len(chave_nota_fiscal) != 44:
+    is_valid, message = validate_nfe_key(chave_nota_fiscal)
+    if not is_valid:
         return {
             "success": False,
-            "error": "Chave de nota fiscal deve ter exatamente 44 dígitos"
+            "error": message
         }
     
     # Setup Chrome options
@@ -45,23 +48,14 @@ def fetch_xml_from_meudanfe(chave_nota_fiscal):
         # Navigate to meudanfe.com.br
         driver.get("https://meudanfe.com.br/")
         
-        # Wait for page to load and find input field
-        wait = WebDriverWait(driver, 20)
-        
-        # Find the input field for the access key
+        # Wait for page to load and find the input field for the access key
         input_selectors = [
             "//input[contains(@placeholder, 'CHAVE DE ACESSO')]",
             "//input[contains(@placeholder, 'chave')]",
             "//input[@type='text']"
         ]
         
-        chave_input = None
-        for selector in input_selectors:
-            try:
-                chave_input = wait.until(EC.presence_of_element_located((By.XPATH, selector)))
-                break
-            except TimeoutException:
-                continue
+        chave_input = find_first(driver, "input", input_selectors, timeout=20, visible=False)
         
         if not chave_input:
             return {
@@ -80,13 +74,7 @@ def fetch_xml_from_meudanfe(chave_nota_fiscal):
             "//input[@type='submit']"
         ]
         
-        search_button = None
-        for selector in button_selectors:
-            try:
-                search_button = wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                break
-            except TimeoutException:
-                continue
+        search_button = find_first(driver, "search", button_selectors, timeout=20, enabled=True)
         
         if not search_button:
             return {
@@ -94,10 +82,11 @@ def fetch_xml_from_meudanfe(chave_nota_fiscal):
                 "error": "Botão de busca não encontrado no site"
             }
         
+        before = search_state(driver)
         search_button.click()
         
         # Wait for results page
-        time.sleep(5)
+        wait_for_search_result(driver, before)
         
         # Look for XML download link
         xml_selectors = [
@@ -107,35 +96,18 @@ def fetch_xml_from_meudanfe(chave_nota_fiscal):
             "//a[contains(text(), 'Baixar')]"
         ]
         
-        xml_link = None
-        for selector in xml_selectors:
-            try:
-                xml_link = driver.find_element(By.XPATH, selector)
-                break
-            except NoSuchElementException:
-                continue
+        xml_link = find_first(driver, "download", xml_selectors, visible=False)
         
         if xml_link:
             try:
                 # Click the XML download link
                 xml_link.click()
-                time.sleep(3)
                 
-                # Check if file was downloaded
-                xml_files = []
-                for _ in range(10):  # Wait up to 10 seconds for download
-                    try:
-                        files = os.listdir(download_dir)
-                        xml_files = [f for f in files if f.endswith('.xml')]
-                        if xml_files:
-                            break
-                        time.sleep(1)
-                    except:
-                        time.sleep(1)
+                # Wait for the download to finish
+                xml_file_path = wait_for_file(download_dir, chave_nota_fiscal, timeout=13)
                 
-                if xml_files:
+                if xml_file_path:
                     # Read the downloaded XML file
-                    xml_file_path = os.path.join(download_dir, xml_files[0])
                     with open(xml_file_path, 'r', encoding='utf-8') as file:
                         xml_content = file.read()
                     
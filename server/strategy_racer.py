@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Execução concorrente (com hedge) de estratégias de consulta de NFe
+Em vez de percorrer as estratégias uma a uma, inicia a primeira
+imediatamente e cada seguinte após `hedge_delay` segundos (ou assim que a
+anterior falhar). O primeiro XML validado vence; estratégias ainda não
+iniciadas são canceladas e as que estão em andamento são abandonadas.
+
+Uso:
+    name, xml = race_strategies(methods, invoice_key, validate)
+"""
+
+import os
+import time
+import queue
+import threading
+
+from fetch_metrics import current_context
+
+DEFAULT_HEDGE_DELAY = float(os.environ.get("NFE_STRATEGY_HEDGE_DELAY", "1.0"))
+DEFAULT_DEADLINE = float(os.environ.get("NFE_STRATEGY_DEADLINE", "50"))
+
+
+def race_strategies(strategies, invoice_key, validate, hedge_delay=DEFAULT_HEDGE_DELAY,
+                    deadline=DEFAULT_DEADLINE, on_outcome=None):
+    """
+    Corre as estratégias e devolve a primeira resposta válida
+
+    Args:
+        strategies: lista de (nome, função(invoice_key))
+        invoice_key: chave NFe repassada para cada estratégia
+        validate: função(resultado) -> bool que aceita o resultado
+        hedge_delay: atraso entre o início de uma estratégia e a próxima
+                     (0 inicia todas ao mesmo tempo)
+        deadline: tempo máximo total em segundos
+        on_outcome: função(nome, aceito, segundos) chamada ao fim de cada
+                    estratégia, inclusive as que terminam depois da vencedora
+
+    Returns:
+        tuple: (nome, resultado) da estratégia vencedora ou (None, None)
+    """
+    results = queue.Queue()
+    cancelled = threading.Event()
+    started_at = time.monotonic()
+
+    def run(name, func):
+        strategy_started = time.monotonic()
+        try:
+            value = func(invoice_key)
+        except Exception as e:
+            print(f"Erro em {name}: {e}")
+            value = None
+        try:
+            accepted = bool(validate(value))
+        except Exception:
+            accepted = False
+        if on_outcome is not None:
+            try:
+                on_outcome(name, accepted, time.monotonic() - strategy_started)
+            except Exception as e:
+                print(f"Erro ao registrar resultado de {name}: {e}")
+        if not cancelled.is_set():
+            results.put((name, value, accepted))
+
+    pending = list(strategies)
+    running = 0
+    next_start = started_at
+
+    while pending or running:
+        now = time.monotonic()
+        remaining = deadline - (now - started_at)
+        if remaining <= 0:
+            break
+
+        # Inicia a próxima estratégia quando o hedge vence ou nada está rodando
+        if pending and (now >= next_start or running == 0):
+            name, func = pending.pop(0)
+            print(f"Tentando: {name}")
+            # Contexto copiado: spans da estratégia ficam no trace da busca
+            threading.Thread(target=current_context().run, args=(run, name, func), daemon=True).start()
+            running += 1
+            next_start = now + hedge_delay
+            continue
+
+        wait = remaining
+        if pending:
+            wait = min(wait, max(0.0, next_start - now))
+
+        try:
+            name, value, accepted = results.get(timeout=wait)
+        except queue.Empty:
+            continue
+
+        running -= 1
+        if accepted:
+            cancelled.set()
+            return name, value
+
+        # Falhou: não espera o hedge para iniciar a próxima
+        next_start = time.monotonic()
+
+    cancelled.set()
+    return None, None
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Estatísticas de estratégias de consulta de NFe (resultado e latência)
+Cada tentativa registra sucesso/falha e tempo gasto por escopo (serviço),
+estratégia (ou endpoint) e UF num SQLite local. A ordem das estratégias é
+recalculada a cada consulta pelo tempo esperado até o sucesso:
+
+    tempo_total_gasto / sucessos
+
+com um prior (uma tentativa de NFE_STRATEGY_PRIOR_LATENCY segundos e meio
+sucesso) para que estratégias novas ainda sejam experimentadas. Os contadores
+decaem a cada registro (NFE_STRATEGY_STATS_DECAY), então uma fonte que caiu
+desce na fila em poucas consultas e volta quando se recupera.
+
+Uso:
+    methods = order_strategies("simple_nfe_api", methods, uf)
+    record_outcome("simple_nfe_api", name, uf, success, elapsed)
+
+    python3 strategy_stats.py [escopo]    # mostra a tabela atual
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import fetch_metrics
+
+DEFAULT_DB_PATH = "C:\\CROSSWMS\\strategy_stats.db" if os.name == 'nt' else "/tmp/crosswms/strategy_stats.db"
+DB_PATH = os.environ.get("NFE_STRATEGY_STATS_DB", DEFAULT_DB_PATH)
+PRIOR_LATENCY = float(os.environ.get("NFE_STRATEGY_PRIOR_LATENCY", "5"))
+DECAY = float(os.environ.get("NFE_STRATEGY_STATS_DECAY", "0.95"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strategy_stats (
+    scope TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    uf TEXT NOT NULL,
+    attempts REAL NOT NULL DEFAULT 0,
+    successes REAL NOT NULL DEFAULT 0,
+    total_time REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, strategy, uf)
+)
+"""
+
+
+class StrategyStats:
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        # Pasta inexistente/somente leitura levanta OSError: registro e ordem
+        # são de melhor esforço e nunca interrompem a consulta
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+            self._conn.commit()
+        return self._conn
+
+    def record(self, scope, strategy, uf, success, elapsed):
+        """Registra uma tentativa (contadores antigos decaem)"""
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    """
+                    INSERT INTO strategy_stats (scope, strategy, uf, attempts, successes, total_time, updated_at)
+                    VALUES (?, ?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (scope, strategy, uf) DO UPDATE SET
+                        attempts = attempts * ? + 1,
+                        successes = successes * ? + excluded.successes,
+                        total_time = total_time * ? + excluded.total_time,
+                        updated_at = excluded.updated_at
+                    """,
+                    (scope, strategy, uf or "", 1 if success else 0, float(elapsed), time.time(),
+                     DECAY, DECAY, DECAY)
+                )
+                conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erro ao registrar estatística de estratégia: {e}")
+
+    def snapshot(self, scope, uf=None):
+        """Retorna {estratégia: (tentativas, sucessos, tempo_total)} do escopo/UF"""
+        try:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT strategy, attempts, successes, total_time FROM strategy_stats WHERE scope = ? AND uf = ?",
+                    (scope, uf or "")
+                ).fetchall()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erro ao ler estatísticas de estratégia: {e}")
+            return {}
+        return {strategy: (attempts, successes, total_time) for strategy, attempts, successes, total_time in rows}
+
+    def expected_time(self, stats):
+        """Tempo esperado até o sucesso para (tentativas, sucessos, tempo_total)"""
+        attempts, successes, total_time = stats or (0, 0, 0)
+        return (total_time + PRIOR_LATENCY) / (successes + 0.5)
+
+    def order(self, scope, strategies, uf=None, name=None):
+        """
+        Ordena estratégias pelo menor tempo esperado até o sucesso
+
+        Args:
+            scope: serviço (ex.: "simple_nfe_api")
+            strategies: lista de estratégias na ordem padrão
+            uf: UF da chave
+            name: função(estratégia) -> nome registrado (padrão: item[0])
+
+        Returns:
+            list: nova lista ordenada (empates mantêm a ordem padrão)
+        """
+        name = name or (lambda strategy: strategy[0])
+        stats = self.snapshot(scope, uf)
+        return sorted(strategies, key=lambda strategy: self.expected_time(stats.get(name(strategy))))
+
+
+_default = StrategyStats()
+
+
+def order_strategies(scope, strategies, uf=None, name=None):
+    return _default.order(scope, strategies, uf, name)
+
+
+def record_outcome(scope, strategy, uf, success, elapsed):
+    fetch_metrics.record("strategy", elapsed, status="ok" if success else "failed",
+                         scope=scope, strategy=strategy, uf=uf)
+    _default.record(scope, strategy, uf, success, elapsed)
+
+
+def main():
+    scope = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        query = "SELECT scope, uf, strategy, attempts, successes, total_time FROM strategy_stats"
+        params = ()
+        if scope:
+            query += " WHERE scope = ?"
+            params = (scope,)
+        rows = conn.execute(query + " ORDER BY scope, uf", params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Erro ao abrir {DB_PATH}: {e}")
+        sys.exit(1)
+
+    for scope, uf, strategy, attempts, successes, total_time in rows:
+        expected = _default.expected_time((attempts, successes, total_time))
+        print(f"{scope:<28} {uf or '-':<3} {strategy:<36} "
+              f"tentativas={attempts:6.1f} sucessos={successes:6.1f} "
+              f"latência={total_time / attempts if attempts else 0:6.2f}s esperado={expected:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
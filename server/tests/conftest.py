@@ -0,0 +1,33 @@
+"""
+Configuração comum dos testes dos módulos Python do servidor
+Os módulos ficam soltos em server/ e se importam como irmãos; os caches em
+disco (XML, falhas, estatísticas, seletores) vão para um diretório
+temporário antes de qualquer import.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+_scratch = tempfile.mkdtemp(prefix="nfe_tests_")
+os.environ.setdefault("NFE_XML_CACHE_DIR", os.path.join(_scratch, "xml_cache"))
+os.environ.setdefault("NFE_STRATEGY_STATS_DB", os.path.join(_scratch, "strategy_stats.db"))
+os.environ.setdefault("NFE_LEARNED_SELECTORS", os.path.join(_scratch, "learned_selectors.json"))
+os.environ.setdefault("NFE_SPANS", "")
+
+
+@pytest.fixture
+def make_key():
+    """Chave válida (cDV correto) de SP, modelo 55, com o número informado"""
+    from nfe_access_key import check_digit
+
+    def build(number, cuf='35', modelo='55'):
+        body = f"{cuf}250513516247000107{modelo}001{number:09d}1{number % 10**8:08d}"
+        return body + str(check_digit(body))
+    return build
@@ -0,0 +1,148 @@
+"""
+WebDriver de mentira sobre páginas HTML estáticas (lxml), para os testes
+Responde a find_element(s) por XPath/ID/tag, ao PROBE_SCRIPT do
+selector_probe e ao XPATH_NODES_SCRIPT do browser_waits, e a cliques: um elemento com data-next="https://..." navega
+para outra página; data-next="nome" troca o DOM sem mudar a URL (como um
+SPA), após data-delay segundos. Como um driver real, find_element(s) sem
+resultado espera o implicitly_wait antes de desistir.
+
+Uso:
+    driver = FakeDriver({"https://meudanfe.com.br/": FORM_HTML, ...})
+    driver.get("https://meudanfe.com.br/")
+"""
+
+import itertools
+import threading
+import time
+
+import lxml.html
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException
+
+from browser_waits import XPATH_NODES_SCRIPT
+from selector_probe import PROBE_SCRIPT
+
+_ids = itertools.count(1)
+
+
+class FakeElement:
+    def __init__(self, driver, node):
+        self.parent = driver
+        self._node = node
+
+    @property
+    def id(self):
+        return self._node.get('data-fake-id')
+
+    @property
+    def tag_name(self):
+        return self._node.tag
+
+    @property
+    def text(self):
+        return self._node.text_content().strip()
+
+    def get_attribute(self, name):
+        return self._node.get(name)
+
+    def is_displayed(self):
+        return self._node.get('hidden') is None
+
+    def is_enabled(self):
+        return self._node.get('disabled') is None
+
+    def clear(self):
+        self._node.set('value', '')
+
+    def send_keys(self, *values):
+        self._node.set('value', (self._node.get('value') or '') + ''.join(values))
+
+    def click(self):
+        self.parent.clicks.append(self.text)
+        self.parent._follow(self._node)
+
+
+class FakeDriver:
+    def __init__(self, pages, download_dir=None):
+        self.pages = pages
+        self.download_dir = download_dir
+        self.current_url = 'about:blank'
+        self.clicks = []
+        self.implicit_wait = 0
+        self._root = lxml.html.document_fromstring('<html><body></body></html>')
+
+    def _render(self, html):
+        root = lxml.html.document_fromstring(html)
+        for node in root.iter():
+            if isinstance(node.tag, str):
+                node.set('data-fake-id', str(next(_ids)))
+        self._root = root
+
+    def get(self, url):
+        self.current_url = url
+        self._render(self.pages[url])
+
+    def _follow(self, node):
+        target = node.get('data-next')
+        if not target:
+            return
+        if target.startswith('http'):
+            self.get(target)
+            return
+        delay = float(node.get('data-delay') or 0)
+        if delay > 0:
+            threading.Timer(delay, self._render, args=(self.pages[target],)).start()
+        else:
+            self._render(self.pages[target])
+
+    def implicitly_wait(self, seconds):
+        self.implicit_wait = seconds
+
+    def find_elements(self, by=By.ID, value=None):
+        deadline = time.monotonic() + self.implicit_wait
+        while True:
+            found = self._query(by, value)
+            if found or time.monotonic() >= deadline:
+                return found
+            time.sleep(0.05)
+
+    def _query(self, by, value):
+        if by == By.ID:
+            value = f"//*[@id='{value}']"
+        elif by == By.TAG_NAME:
+            value = f"//{value}"
+        elif by != By.XPATH:
+            return []
+        return [FakeElement(self, node) for node in self._root.xpath(value) if hasattr(node, 'tag')]
+
+    def find_element(self, by=By.ID, value=None):
+        found = self.find_elements(by, value)
+        if not found:
+            raise NoSuchElementException(f"{by}={value}")
+        return found[0]
+
+    def execute_script(self, script, *args):
+        if script == PROBE_SCRIPT:
+            candidates, visible, enabled = args
+            for index, (kind, selector) in enumerate(candidates):
+                if kind != 'xpath':
+                    continue
+                for element in self._query(By.XPATH, selector):
+                    if (not visible or element.is_displayed()) and (not enabled or element.is_enabled()):
+                        return [index, element]
+            return None
+        if script == XPATH_NODES_SCRIPT:
+            xpaths, visible = args
+            return [
+                element for xpath in xpaths for element in self._query(By.XPATH, xpath)
+                if not visible or element.is_displayed()
+            ]
+        if 'readyState' in script:
+            return 'complete'
+        return None
+
+    def save_screenshot(self, path):
+        return True
+
+    def quit(self):
+        pass
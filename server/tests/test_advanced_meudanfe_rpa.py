@@ -0,0 +1,42 @@
+"""Consulta ao meudanfe.com.br e o cache negativo compartilhado"""
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from advanced_meudanfe_rpa import MeuDanfeRPA
+from nfe_xml_cache import FAILURE_NOT_FOUND, lookup_failure, record_failure
+
+
+def answer(status):
+    def request(method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response._content = b"<html><body>Pagina nao existe</body></html>"
+        return response
+    return request
+
+
+@pytest.mark.parametrize("status", [404, 403, 503])
+def test_guessed_endpoints_failing_leave_no_negative_entry(make_key, status):
+    key = make_key(9100 + status)
+    rpa = MeuDanfeRPA()
+    rpa.session.request = answer(status)
+
+    result = rpa.execute_consultation(key)
+
+    assert result["success"] is False
+    assert lookup_failure(key) is None
+
+
+def test_recorded_failure_still_answers_and_force_refresh_bypasses(make_key):
+    key = make_key(9200)
+    record_failure(key, FAILURE_NOT_FOUND, "SEFAZ: NF-e não consta na base", ttl=60)
+    rpa = MeuDanfeRPA()
+    rpa.session.request = answer(404)
+
+    assert rpa.execute_consultation(key)["negative_cache"] is True
+    assert "negative_cache" not in rpa.execute_consultation(key, force_refresh=True)
+    assert lookup_failure(key) is None
@@ -0,0 +1,68 @@
+"""Concorrência por host e primeiro resultado do AsyncHTTPEngine"""
+
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip("requests")
+
+from async_http_engine import AsyncHTTPEngine, Probe
+
+
+class SlowSession:
+    """Cada requisição leva `delay` segundos; registra o pico de simultâneas"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.adapters = {}
+
+    def mount(self, prefix, adapter):
+        self.adapters[prefix] = adapter
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return types.SimpleNamespace(status_code=200, url=url, close=lambda: None)
+
+
+def probes(count):
+    return [Probe("GET", f"https://meudanfe.com.br/p{i}") for i in range(count)]
+
+
+def test_per_host_limit_bounds_concurrency():
+    session = SlowSession()
+    engine = AsyncHTTPEngine(session, per_host_limit=4)
+
+    asyncio.run(engine.first_match(probes(12), lambda probe, response: None))
+
+    assert session.peak == 4
+    assert engine.responses == 12
+
+
+def test_probes_within_limit_run_in_one_round():
+    session = SlowSession(delay=0.2)
+    engine = AsyncHTTPEngine(session, per_host_limit=26)
+    started = time.monotonic()
+
+    asyncio.run(engine.first_match(probes(26), lambda probe, response: None))
+
+    assert session.peak == 26
+    assert session.adapters["https://"]._pool_maxsize >= 26
+    assert time.monotonic() - started < 0.6
+
+
+def test_first_accepted_result_wins():
+    engine = AsyncHTTPEngine(SlowSession(delay=0.01), per_host_limit=8)
+    accept = lambda probe, response: response.url if response.url.endswith("p3") else None
+
+    assert asyncio.run(engine.first_match(probes(6), accept)) == "https://meudanfe.com.br/p3"
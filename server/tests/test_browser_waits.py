@@ -0,0 +1,75 @@
+"""wait_for_search_result só aceita indicadores que surgem depois do clique"""
+
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("lxml")
+
+from browser_waits import search_state, wait_for_page, wait_for_search_result
+from fake_browser import FakeDriver
+
+FORM_URL = "https://meudanfe.com.br/"
+
+FORM_HTML = """<html><body>
+<p>Erro? Baixe o XML pelo aplicativo</p>
+<a href="/app">Baixar o aplicativo</a>
+<input placeholder="CHAVE DE ACESSO"/>
+<button data-next="resultado" data-delay="0.3">Buscar</button>
+</body></html>"""
+
+RESULT_HTML = """<html><body>
+<a href="/download/nota.xml">Baixar XML</a>
+</body></html>"""
+
+
+def form_driver(**pages):
+    driver = FakeDriver({FORM_URL: FORM_HTML, "resultado": RESULT_HTML, **pages})
+    driver.get(FORM_URL)
+    return driver
+
+
+def test_waits_for_result_rendered_after_click():
+    driver = form_driver()
+    before = search_state(driver)
+    started = time.monotonic()
+    driver.find_element("xpath", "//button").click()
+
+    found = wait_for_search_result(driver, before, timeout=5)
+
+    assert found is not None and found.text == "Baixar XML"
+    assert time.monotonic() - started >= 0.25
+
+
+def test_form_indicators_do_not_count_as_result():
+    driver = form_driver()
+    before = search_state(driver)
+
+    assert wait_for_search_result(driver, before, timeout=0.3) is None
+
+
+def test_url_change_counts_as_result():
+    driver = FakeDriver({FORM_URL: FORM_HTML, "https://meudanfe.com.br/r": "<html><body></body></html>"})
+    driver.get(FORM_URL)
+    before = search_state(driver)
+    driver.get("https://meudanfe.com.br/r")
+
+    assert wait_for_search_result(driver, before, timeout=1) == "https://meudanfe.com.br/r"
+
+
+def test_implicit_wait_does_not_slow_down_polling():
+    # Como replit_chrome_rpa/meudanfe_rpa: cada XPath sem resultado custaria 10 s
+    driver = form_driver()
+    driver.implicitly_wait(10)
+
+    started = time.monotonic()
+    before = search_state(driver)
+    assert time.monotonic() - started < 0.5
+
+    driver.find_element("xpath", "//button").click()
+    found = wait_for_search_result(driver, before, timeout=5)
+    assert found is not None and found.text == "Baixar XML"
+    assert wait_for_page(driver, "//input[@id='inexistente']", "//a", timeout=1).text == "Baixar XML"
+    assert wait_for_search_result(driver, search_state(driver), timeout=0.3) is None
+    assert time.monotonic() - started < 2
@@ -0,0 +1,142 @@
+"""Reservas de vaga do ChromeDriverPool durante warm() e acquire(), e registro por nome"""
+
+import threading
+import time
+import types
+
+import pytest
+
+import chrome_driver_pool
+from chrome_driver_pool import ChromeDriverPool
+
+
+class StubDriver:
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.current_url = "about:blank"
+        self.window_handles = ["main"]
+        self.switch_to = types.SimpleNamespace(window=lambda handle: None)
+
+    def execute_cdp_cmd(self, command, params):
+        return {}
+
+    def get(self, url):
+        self.current_url = url
+
+    def quit(self):
+        pass
+
+
+class GatedFactory:
+    """Cada lançamento espera a liberação do teste; o primeiro pode falhar"""
+
+    def __init__(self, fail_first=False):
+        self.fail_first = fail_first
+        self.gate = threading.Event()
+        self.launches = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, download_dir):
+        with self.lock:
+            self.launches += 1
+            attempt = self.launches
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            self.gate.wait(5)
+            if self.fail_first and attempt == 1:
+                raise RuntimeError("chrome não iniciou")
+            return StubDriver(download_dir)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_warm_then_acquire_reuses_warm_driver(tmp_path):
+    factory = GatedFactory()
+    factory.gate.set()
+    pool = ChromeDriverPool(factory, max_size=2, download_root=str(tmp_path))
+
+    pool.warm()
+    driver = pool.acquire(timeout=1)
+
+    assert factory.launches == 2
+    assert pool.size == 2
+    pool.release(driver)
+    assert pool.size == 2
+    pool.close_all()
+
+
+def test_acquire_during_warm_never_exceeds_max_size(tmp_path):
+    factory = GatedFactory()
+    pool = ChromeDriverPool(factory, max_size=1, download_root=str(tmp_path))
+    warm = threading.Thread(target=pool.warm)
+    warm.start()
+    time.sleep(0.05)
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=3)))
+    waiter.start()
+    time.sleep(0.05)
+    factory.gate.set()
+    warm.join(3)
+    waiter.join(3)
+
+    assert len(acquired) == 1
+    assert factory.launches == 1 and factory.peak == 1
+    assert pool.size == 1
+    pool.close_all()
+
+
+def test_failed_warm_launch_wakes_waiting_acquire(tmp_path):
+    factory = GatedFactory(fail_first=True)
+    pool = ChromeDriverPool(factory, max_size=1, download_root=str(tmp_path))
+    errors = []
+
+    def warm():
+        try:
+            pool.warm()
+        except RuntimeError as e:
+            errors.append(e)
+
+    warm_thread = threading.Thread(target=warm)
+    warm_thread.start()
+    time.sleep(0.05)
+
+    result = {}
+
+    def acquire():
+        started = time.monotonic()
+        result["driver"] = pool.acquire(timeout=3)
+        result["waited"] = time.monotonic() - started
+
+    waiter = threading.Thread(target=acquire)
+    waiter.start()
+    time.sleep(0.05)
+    factory.gate.set()
+    warm_thread.join(3)
+    waiter.join(4)
+
+    assert errors
+    assert isinstance(result.get("driver"), StubDriver)
+    assert result["waited"] < 2
+    pool.close_all()
+
+
+def test_services_with_own_factories_use_own_pools(monkeypatch):
+    pytest.importorskip("selenium")
+    pytest.importorskip("requests")
+    import enhanced_xml_fetcher
+    import nfe_api_service
+
+    monkeypatch.setattr(chrome_driver_pool, "_pools", {})
+    for module in (nfe_api_service, enhanced_xml_fetcher):
+        monkeypatch.setattr(module, "create_chrome", lambda download_dir=None: StubDriver(download_dir))
+        module.setup_chrome()
+
+    pools = chrome_driver_pool._pools
+    assert len(pools) == 2
+    for pool in pools.values():
+        pool.close_all()
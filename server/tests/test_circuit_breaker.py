@@ -0,0 +1,137 @@
+"""Estados do disjuntor por host: fechado, aberto, meio-aberto"""
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, guarded_request
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Relógio monotônico controlado pelo teste"""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    circuit_breaker.reset()
+    yield
+    circuit_breaker.reset()
+
+
+def test_open_half_open_closed(clock):
+    breaker = CircuitBreaker("sefaz", failure_threshold=3, reset_timeout=60)
+
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.remaining_open() == 60
+
+    clock[0] += 59
+    assert not breaker.allow()
+
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(), "só uma sonda por vez no meio-aberto"
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("portal", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.remaining_open() == 30
+    assert not breaker.allow()
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker("api", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_zero_threshold_disables_breaker():
+    breaker = CircuitBreaker("bench", failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+        assert breaker.allow()
+    assert breaker.state == CLOSED
+
+
+class StubSession:
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        response = requests.Response()
+        response.status_code = answer
+        return response
+
+
+def test_guarded_request_counts_5xx_and_network_errors():
+    url = "https://www.nfe.fazenda.gov.br/portal/consulta.aspx"
+    session = StubSession(503, requests.exceptions.ConnectTimeout("timeout"))
+    circuit_breaker.breaker_for(url).failure_threshold = 2
+
+    assert guarded_request(session, "GET", url).status_code == 503
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        guarded_request(session, "GET", url)
+    with pytest.raises(CircuitOpenError):
+        guarded_request(session, "GET", url + "?outra=1")
+
+    assert session.calls == 2
+    assert guarded_request(StubSession(200), "GET", "https://meudanfe.com.br/").status_code == 200
+
+
+def test_4xx_counts_as_success_and_reset_forgets_hosts():
+    url = "https://consultadanfe.com/"
+    breaker = circuit_breaker.breaker_for(url)
+    breaker.failure_threshold = 1
+
+    guarded_request(StubSession(404), "GET", url)
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    circuit_breaker.reset()
+    assert circuit_breaker.breaker_for(url).state == CLOSED
+
+
+def test_probe_released_when_request_raises_something_else(clock):
+    url = "https://portal.example/"
+    breaker = circuit_breaker.breaker_for(url)
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    clock[0] += breaker.reset_timeout
+
+    with pytest.raises(ValueError):
+        guarded_request(StubSession(ValueError("URL inválida")), "GET", url)
+
+    assert breaker.state == HALF_OPEN
+    assert guarded_request(StubSession(200), "GET", url).status_code == 200
+    assert breaker.state == CLOSED
@@ -0,0 +1,118 @@
+"""Espera de downloads: só entrega o arquivo depois de completo"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import download_watcher
+from download_watcher import wait_for_file
+
+KEY = "42250485179240000239550020004175361171503396"
+DOCUMENT = f'<?xml version="1.0" encoding="UTF-8"?><nfeProc><infNFe Id="NFe{KEY}"/></nfeProc>'.encode()
+
+
+@pytest.fixture(params=["polling", "inotify"])
+def watcher_kind(request, monkeypatch):
+    if request.param == "polling":
+        monkeypatch.setattr(download_watcher, "_libc", False)
+    elif download_watcher._inotify_libc() is None:
+        pytest.skip("inotify indisponível")
+    return request.param
+
+
+def write_in_place(path, pieces, pause):
+    """Grava no nome final, em partes (sem .crdownload), e só depois fecha"""
+    def run():
+        with open(path, "wb") as f:
+            for piece in pieces:
+                f.write(piece)
+                f.flush()
+                time.sleep(pause)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_in_background(directory, **kwargs):
+    """Dispara wait_for_file numa thread; devolve (thread, resultado)"""
+    result = {}
+
+    def run():
+        result["path"] = wait_for_file(directory, KEY, **kwargs)
+        if result["path"]:
+            with open(result["path"], "rb") as f:
+                result["content"] = f.read()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def test_file_written_in_place_is_reported_when_complete(tmp_path, watcher_kind):
+    waiting, result = wait_in_background(str(tmp_path), timeout=5)
+    time.sleep(0.2)
+
+    write_in_place(tmp_path / f"{KEY}.xml", [DOCUMENT[:20], DOCUMENT[20:40], DOCUMENT[40:]], pause=0.35).join()
+    waiting.join()
+
+    assert result == {"path": str(tmp_path / f"{KEY}.xml"), "content": DOCUMENT}
+
+
+def test_polling_does_not_hand_over_file_already_being_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_watcher, "_libc", False)
+    path = tmp_path / f"{KEY}.xml"
+    path.write_bytes(DOCUMENT[:20])
+
+    waiting, result = wait_in_background(str(tmp_path), timeout=5)
+    write_in_place(path, [DOCUMENT[:20], DOCUMENT[20:40], DOCUMENT[40:]], pause=0.35).join()
+    waiting.join()
+
+    assert result == {"path": str(path), "content": DOCUMENT}
+
+
+def test_partial_download_then_rename(tmp_path, watcher_kind):
+    partial = tmp_path / "nota.xml.crdownload"
+
+    def run():
+        partial.write_bytes(DOCUMENT[:30])
+        time.sleep(0.3)
+        partial.write_bytes(DOCUMENT)
+        os.replace(partial, tmp_path / "nota.xml")
+    threading.Thread(target=run).start()
+
+    assert wait_for_file(str(tmp_path), KEY, timeout=5) == str(tmp_path / "nota.xml")
+
+
+def downloaded_earlier(path, content):
+    path.write_bytes(content)
+    past = time.time() - 60
+    os.utime(path, (past, past))
+
+
+def test_existing_files(tmp_path, watcher_kind):
+    downloaded_earlier(tmp_path / "outra.xml", DOCUMENT.replace(KEY.encode(), b"3" * 44))
+    assert wait_for_file(str(tmp_path), KEY, timeout=0.4) is None
+
+    downloaded_earlier(tmp_path / f"{KEY}.xml", DOCUMENT)
+    started = time.monotonic()
+    assert wait_for_file(str(tmp_path), KEY, timeout=5) == str(tmp_path / f"{KEY}.xml")
+    assert time.monotonic() - started < 0.5
+
+
+def test_polling_waits_for_writes_to_settle(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_watcher, "_libc", False)
+    monkeypatch.setattr(download_watcher, "SETTLE_SECONDS", 0.3)
+    path = tmp_path / f"{KEY}.xml"
+    path.write_bytes(b"")
+    watcher = download_watcher.PollingWatcher(str(tmp_path))
+    watcher.ignore_existing(os.listdir(tmp_path))
+
+    assert watcher.next_names(0.01) == []
+    path.write_bytes(DOCUMENT[:10])
+    assert watcher.next_names(0.01) == []
+    path.write_bytes(DOCUMENT)
+    assert watcher.next_names(0.01) == []
+    time.sleep(0.3)
+    assert watcher.next_names(0.01) == [path.name]
+    assert watcher.next_names(0.01) == []
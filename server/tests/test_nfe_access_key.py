@@ -0,0 +1,90 @@
+"""Dígito verificador e decodificação (chave a chave e em lote) da chave de acesso"""
+
+import pytest
+
+from nfe_access_key import (
+    InvalidAccessKey, check_digit, decode_key, decode_each, get_uf_from_key, sample_keys,
+    validate_each, validate_nfe_key, BATCH_COLUMNS,
+)
+
+# Chave real (test_nf_417536.xml na raiz do projeto), emitida em SC
+REAL_KEY = "42250485179240000239550020004175361171503396"
+
+
+def test_check_digit_of_real_key():
+    assert check_digit(REAL_KEY[:-1]) == int(REAL_KEY[-1])
+    key = decode_key(REAL_KEY)
+    assert (key.uf, key.ano, key.mes, key.modelo, key.cnpj) == ("SC", 2025, 4, "55", "85179240000239")
+    assert key.numero == "000417536"
+
+
+def test_check_digit_is_zero_when_remainder_below_two():
+    # Soma ponderada com resto 1 no módulo 11
+    assert check_digit("3525051351624700010755001000000002100000000") == 0
+
+
+@pytest.mark.parametrize("position", range(43))
+def test_any_single_mistyped_digit_is_rejected(position):
+    wrong = str((int(REAL_KEY[position]) + 1) % 10)
+    key = REAL_KEY[:position] + wrong + REAL_KEY[position + 1:]
+    is_valid, message = validate_nfe_key(key)
+    assert not is_valid
+    assert message
+
+
+@pytest.mark.parametrize("key, fragment", [
+    ("", "44 dígitos"),
+    (REAL_KEY[:-1], "44 dígitos"),
+    (REAL_KEY[:-2] + "x6", "apenas números"),
+    ("٤" * 44, "apenas números"),
+    (REAL_KEY[:-1] + "7", "Dígito verificador"),
+])
+def test_decode_key_messages(key, fragment):
+    with pytest.raises(InvalidAccessKey, match=fragment):
+        decode_key(key)
+
+
+def test_uf_month_and_model_are_checked_after_check_digit():
+    for body, fragment in [
+        ("99" + REAL_KEY[2:43], "UF"),
+        (REAL_KEY[:4] + "13" + REAL_KEY[6:43], "Mês"),
+        (REAL_KEY[:20] + "57" + REAL_KEY[22:43], "Modelo"),
+    ]:
+        with pytest.raises(InvalidAccessKey, match=fragment):
+            decode_key(body + str(check_digit(body)))
+
+
+def test_get_uf_from_key_has_no_default():
+    assert get_uf_from_key(REAL_KEY) == "SC"
+    assert get_uf_from_key(REAL_KEY[:-1] + "7") is None
+
+
+def batch_keys():
+    keys = sample_keys(3000, invalid_ratio=0.1, seed=7)
+    return keys + [REAL_KEY, "", "123", REAL_KEY[:-2] + "x6", "é" * 44, REAL_KEY + "0"]
+
+
+def test_batch_matches_per_key_validation_path():
+    np = pytest.importorskip("numpy")
+    from nfe_access_key import decode_batch
+    keys = batch_keys()
+
+    batch = decode_batch(keys)
+
+    per_key = validate_each(keys)
+    assert [bool(v) for v in batch["valida"]] == [valid for valid, _ in per_key]
+    assert [str(uf) if valid else None for valid, uf in zip(batch["valida"], batch["uf"])] == \
+        [uf for _, uf in per_key]
+    assert batch["valida"].dtype == np.bool_
+    assert 0 < batch["valida"].sum() < len(keys)
+
+
+def test_batch_columns_match_access_key_fields():
+    pytest.importorskip("numpy")
+    from nfe_access_key import decode_batch
+    keys = batch_keys()
+
+    batch, each = decode_batch(keys), decode_each(keys)
+
+    for name in BATCH_COLUMNS:
+        assert list(batch[name]) == each[name], name
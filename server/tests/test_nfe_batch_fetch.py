@@ -0,0 +1,113 @@
+"""Busca em lote: leitura das chaves, concorrência limitada e resultados por chave"""
+
+import io
+import json
+import sys
+import threading
+import time
+import types
+from argparse import Namespace
+
+import pytest
+
+pytest.importorskip("requests")
+
+import nfe_batch_fetch
+from nfe_batch_fetch import fetch_batch, read_keys
+
+
+def test_read_keys_from_args_and_file_without_duplicates(tmp_path):
+    path = tmp_path / "chaves.txt"
+    path.write_text("B\nC, A;D\n\n  E  \nB\n", encoding="utf-8")
+
+    assert read_keys(Namespace(keys=["A", "B", " A "], file=str(path))) == ["A", "B", "C", "D", "E"]
+    assert read_keys(Namespace(keys=[], file=None)) == []
+
+
+def test_read_keys_from_stdin(monkeypatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("K1 K2\nK1\r\nK3;"))
+
+    assert read_keys(Namespace(keys=["K0"], file="-")) == ["K0", "K1", "K2", "K3"]
+    assert not sys.stdin.closed
+
+
+def test_concurrency_is_bounded():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def fetch(key):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return {"success": False, "error": key}
+
+    results = dict(fetch_batch([f"k{n}" for n in range(12)], fetch, concurrency=3))
+
+    assert len(results) == 12
+    assert peak[0] == 3
+
+
+def test_results_stream_in_completion_order():
+    release_slow = threading.Event()
+    seen = []
+
+    def fetch(key):
+        if key == "lenta":
+            release_slow.wait(5)
+        return {"success": False, "error": key}
+
+    batch = fetch_batch(["lenta", "rapida1", "rapida2"], fetch, concurrency=3)
+    for _ in range(2):
+        seen.append(next(batch)[0])
+    release_slow.set()
+    seen.extend(key for key, _ in batch)
+
+    assert sorted(seen[:2]) == ["rapida1", "rapida2"]
+    assert seen[2] == "lenta"
+
+
+def test_exception_becomes_error_result_for_that_key_only():
+    def fetch(key):
+        if key == "quebrada":
+            raise RuntimeError("timeout do portal")
+        return {"success": False, "error": "não encontrada"}
+
+    results = dict(fetch_batch(["ok1", "quebrada", "ok2"], fetch, concurrency=2))
+
+    assert results["quebrada"] == {"success": False, "error": "Erro ao buscar XML: timeout do portal"}
+    assert results["ok1"]["error"] == results["ok2"]["error"] == "não encontrada"
+
+
+def test_successful_results_get_parsed():
+    from nfe_record_parser import SAMPLE_KEY, build_sample
+    xml = build_sample(1).decode("utf-8")
+
+    [(key, result)] = fetch_batch([SAMPLE_KEY], lambda key: {"success": True, "xml_content": xml})
+
+    assert key == SAMPLE_KEY
+    assert result["parsed"]["chave_acesso"] == SAMPLE_KEY
+
+
+def test_main_writes_one_json_line_per_key(monkeypatch, capsys):
+    def fetch(key):
+        if key == "quebrada":
+            raise ValueError("falhou")
+        return {"success": False, "error": key}
+
+    monkeypatch.setattr(nfe_batch_fetch, "load_service", lambda name: (types.SimpleNamespace(), fetch))
+    monkeypatch.setattr(sys, "argv", ["nfe_batch_fetch.py", "a", "quebrada", "a", "b", "--concurrency", "2"])
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+
+    nfe_batch_fetch.main()
+
+    captured = capsys.readouterr()
+    lines = [json.loads(line) for line in captured.out.splitlines()]
+    assert sorted(line["invoice_key"] for line in lines) == ["a", "b", "quebrada"]
+    results = {line["invoice_key"]: line["result"] for line in lines}
+    assert results["quebrada"]["error"] == "Erro ao buscar XML: falhou"
+    assert results["b"] == {"success": False, "error": "b"}
+    assert "Lote concluído: 0/3" in captured.err
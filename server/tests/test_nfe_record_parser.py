@@ -0,0 +1,81 @@
+"""Registro compacto (campo "parsed") a partir do XML da NFe"""
+
+import io
+import os
+
+import pytest
+
+from nfe_record_parser import SAMPLE_KEY, attach_parsed, build_sample, iter_items, parse_nfe, NFeRecord
+
+REAL_XML = os.path.join("..", "..", "test_nf_417536.xml")
+
+
+def test_parse_sample_header_totals_and_volumes():
+    record = parse_nfe(build_sample(3))
+
+    assert record.chave_acesso == SAMPLE_KEY
+    assert (record.numero_nf, record.serie) == ("11340", "1")
+    assert record.emitente.cnpj == "13516247000107"
+    assert record.emitente.uf == "SP"
+    assert record.destinatario.uf == "MA"
+    assert record.protocolo == "135251409488069"
+    assert record.modalidade_frete == "1"
+    assert record.quantidade_volumes == 3
+    assert record.peso_bruto == pytest.approx(36.0)
+    assert record.valor_total == pytest.approx(133.08 * 3)
+    assert [item.numero for item in record.itens] == [1, 2, 3]
+    assert record.itens[0].valor_total == pytest.approx(133.08)
+
+
+@pytest.mark.parametrize("as_input", [bytes, lambda data: data.decode("utf-8"), io.BytesIO])
+def test_accepts_bytes_str_and_binary_files(as_input):
+    record = parse_nfe(as_input(build_sample(1)))
+    assert record.to_dict()["destinatario"]["razao_social"] == "FORT CLEAN - DISTRIBUIDORA LTDA"
+
+
+def test_parse_real_document():
+    path = os.path.join(os.path.dirname(__file__), REAL_XML)
+    if not os.path.exists(path):
+        pytest.skip("XML de exemplo ausente")
+    with open(path, "rb") as f:
+        record = parse_nfe(f)
+    assert record.chave_acesso == "42250485179240000239550020004175361171503396"
+    assert record.numero_nf == "417536"
+    assert record.itens
+
+
+@pytest.mark.parametrize("content", [b"", b"<html><body>erro</body></html>", b"<nfeProc><NFe>", "não é xml"])
+def test_invalid_documents_give_none(content):
+    assert parse_nfe(content) is None
+
+
+def test_iter_items_fills_header_as_it_goes():
+    record = NFeRecord()
+    items = iter_items(build_sample(4), record)
+
+    first = next(items)
+    assert first.numero == 1
+    assert record.numero_nf == "11340"
+    assert record.valor_total == 0.0
+
+    assert [item.numero for item in items] == [2, 3, 4]
+    assert record.valor_total == pytest.approx(133.08 * 4)
+    assert record.itens == []
+
+
+def test_attach_parsed_formats():
+    xml = build_sample(1).decode("utf-8")
+
+    both = attach_parsed({"success": True, "xml_content": xml}, "both")
+    assert both["xml_content"] == xml
+    assert both["parsed"]["numero_nf"] == "11340"
+
+    parsed = attach_parsed({"success": True, "xml_content": xml}, "parsed")
+    assert "xml_content" not in parsed
+    assert parsed["parsed"]["chave_acesso"] == SAMPLE_KEY
+
+    assert "parsed" not in attach_parsed({"success": True, "xml_content": xml}, "xml")
+    assert "parsed" not in attach_parsed({"success": False, "xml_content": xml}, "both")
+
+    broken = attach_parsed({"success": True, "xml_content": "<html>"}, "parsed")
+    assert broken == {"success": True, "xml_content": "<html>"}
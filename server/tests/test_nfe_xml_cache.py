@@ -0,0 +1,118 @@
+"""Cache de XML em disco/memória e cache negativo com TTL"""
+
+import gzip
+import os
+
+import pytest
+
+import nfe_xml_cache
+from nfe_xml_cache import (
+    FAILURE_INVALID_KEY, FAILURE_NOT_FOUND, FAILURE_SOURCE_DOWN,
+    cache_path, failure_path, load_xml, lookup_failure, negative_result, record_failure, store_xml,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(nfe_xml_cache.time, "time", lambda: now[0])
+    return now
+
+
+def document(key):
+    return f'<?xml version="1.0" encoding="UTF-8"?><nfeProc><chNFe>{key}</chNFe><xNome>Açúcar</xNome></nfeProc>'
+
+
+def test_store_and_load_roundtrip(tmp_path, make_key):
+    key = make_key(8001)
+
+    path = store_xml(key, document(key), cache_dir=str(tmp_path))
+
+    assert path == os.path.join(str(tmp_path), "35", "2505", f"{key}.xml.gz")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert f.read() == document(key)
+    assert load_xml(key, cache_dir=str(tmp_path)) == document(key)
+
+
+def test_disk_hit_survives_memory_eviction(tmp_path, make_key):
+    key = make_key(8002)
+    store_xml(key, document(key), cache_dir=str(tmp_path))
+    with nfe_xml_cache._memory_lock:
+        nfe_xml_cache._memory.pop(key, None)
+
+    assert load_xml(key, cache_dir=str(tmp_path)) == document(key)
+
+
+def test_rejects_foreign_xml_and_bad_keys(tmp_path, make_key):
+    key, other = make_key(8003), make_key(8004)
+    assert store_xml(key, document(other), cache_dir=str(tmp_path)) is None
+    assert load_xml(key, cache_dir=str(tmp_path)) is None
+    assert store_xml("123", document("123"), cache_dir=str(tmp_path)) is None
+    assert record_failure("../../etc", FAILURE_NOT_FOUND, cache_dir=str(tmp_path)) is None
+
+
+def test_corrupted_file_is_a_miss(tmp_path, make_key):
+    key = make_key(8005)
+    path = cache_path(key, str(tmp_path))
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"nao e gzip")
+
+    assert load_xml(key, cache_dir=str(tmp_path)) is None
+
+
+def test_negative_entry_expires_after_ttl(tmp_path, make_key, clock):
+    key = make_key(8006)
+
+    entry = record_failure(key, FAILURE_SOURCE_DOWN, "SEFAZ fora do ar", ttl=300, cache_dir=str(tmp_path))
+
+    assert lookup_failure(key, cache_dir=str(tmp_path)) == entry
+    clock[0] += 120
+    result = negative_result(lookup_failure(key, cache_dir=str(tmp_path)))
+    assert result["negative_cache"] and result["retry_after"] == 180
+    assert result["failure_class"] == FAILURE_SOURCE_DOWN
+
+    clock[0] += 180
+    assert lookup_failure(key, cache_dir=str(tmp_path)) is None
+    assert not os.path.exists(failure_path(key, str(tmp_path)))
+
+
+def test_default_ttl_per_failure_class(tmp_path, make_key, clock, monkeypatch):
+    monkeypatch.setitem(nfe_xml_cache.NEGATIVE_TTL, FAILURE_INVALID_KEY, 1000)
+    monkeypatch.setitem(nfe_xml_cache.NEGATIVE_TTL, FAILURE_NOT_FOUND, 10)
+    invalid, missing, unknown = make_key(8007), make_key(8008), make_key(8009)
+
+    record_failure(invalid, FAILURE_INVALID_KEY, cache_dir=str(tmp_path))
+    record_failure(missing, FAILURE_NOT_FOUND, cache_dir=str(tmp_path))
+    record_failure(unknown, "outra", cache_dir=str(tmp_path))
+    clock[0] += 10
+
+    assert lookup_failure(invalid, cache_dir=str(tmp_path))["failure_class"] == FAILURE_INVALID_KEY
+    assert lookup_failure(missing, cache_dir=str(tmp_path)) is None
+    assert lookup_failure(unknown, cache_dir=str(tmp_path)) is None
+
+
+def test_zero_ttl_disables_negative_cache(tmp_path, make_key):
+    key = make_key(8010)
+    assert record_failure(key, FAILURE_NOT_FOUND, ttl=0, cache_dir=str(tmp_path)) is None
+    assert lookup_failure(key, cache_dir=str(tmp_path)) is None
+
+
+def test_store_clears_negative_entry(tmp_path, make_key):
+    key = make_key(8011)
+    record_failure(key, FAILURE_NOT_FOUND, ttl=3600, cache_dir=str(tmp_path))
+
+    store_xml(key, document(key), cache_dir=str(tmp_path))
+
+    assert lookup_failure(key, cache_dir=str(tmp_path)) is None
+
+
+def test_unreadable_negative_entry_is_dropped(tmp_path, make_key):
+    key = make_key(8012)
+    path = failure_path(key, str(tmp_path))
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("{")
+
+    assert lookup_failure(key, cache_dir=str(tmp_path)) is None
+    assert not os.path.exists(path)
@@ -0,0 +1,67 @@
+"""Classificação das falhas do simple_nfe_api para o cache negativo"""
+
+import types
+
+import pytest
+
+pytest.importorskip("requests")
+
+import simple_nfe_api
+from nfe_xml_cache import FAILURE_INVALID_KEY, FAILURE_NOT_FOUND, FAILURE_SOURCE_DOWN, lookup_failure
+
+
+def reply(body, status_code=200):
+    return types.SimpleNamespace(status_code=status_code, content=body.encode("utf-8"), text=body)
+
+
+@pytest.mark.parametrize("body, expected", [
+    ("<retConsSitNFe><cStat>217</cStat><xMotivo>NF-e não consta na base</xMotivo></retConsSitNFe>", {"answered"}),
+    ("<retConsSitNFe><cStat>236</cStat></retConsSitNFe>", {"invalid_key"}),
+    ("<retConsSitNFe><cStat>109</cStat><xMotivo>Serviço paralisado</xMotivo></retConsSitNFe>", set()),
+    ("<html><body>Service Unavailable</body></html>", set()),
+])
+def test_sefaz_reply_outcomes(body, expected):
+    outcomes = set()
+    simple_nfe_api.note_sefaz_response(outcomes, reply(body))
+    assert outcomes == expected
+
+
+@pytest.mark.parametrize("body, status_code, expected", [
+    ("<div class='erro'>NF-e não encontrada para a chave informada</div>", 200, {"answered"}),
+    ("<h1>404 - Página não encontrada</h1>", 404, set()),
+    ("<h1>Página não encontrada</h1>", 200, set()),
+])
+def test_portal_reply_outcomes(body, status_code, expected):
+    outcomes = set()
+    simple_nfe_api.note_portal_response(outcomes, reply(body, status_code))
+    assert outcomes == expected
+
+
+def stub_methods(monkeypatch, sefaz_outcome=None):
+    def sefaz(invoice_key, outcomes=None):
+        if sefaz_outcome:
+            simple_nfe_api.note_outcome(outcomes, sefaz_outcome)
+        return None
+
+    def silent(invoice_key, outcomes=None):
+        return None
+
+    monkeypatch.setattr(simple_nfe_api, "try_sefaz_webservice", sefaz)
+    for name in ("try_receita_federal_api", "try_portal_consultation", "try_public_nfe_apis"):
+        monkeypatch.setattr(simple_nfe_api, name, silent)
+
+
+@pytest.mark.parametrize("number, sefaz_outcome, failure_class", [
+    (7001, None, FAILURE_SOURCE_DOWN),
+    (7002, "answered", FAILURE_NOT_FOUND),
+    (7003, "invalid_key", FAILURE_INVALID_KEY),
+])
+def test_failure_class_comes_from_this_lookup(monkeypatch, make_key, number, sefaz_outcome, failure_class):
+    stub_methods(monkeypatch, sefaz_outcome)
+    key = make_key(number)
+
+    result = simple_nfe_api.get_nfe_xml_simple(key)
+
+    assert not result["success"]
+    assert result["failure_class"] == failure_class
+    assert lookup_failure(key)["failure_class"] == failure_class
@@ -0,0 +1,102 @@
+"""Corrida com hedge entre estratégias de consulta"""
+
+import threading
+import time
+
+from strategy_racer import race_strategies
+
+KEY = "35250513516247000107550010000113401146202508"
+
+
+class Strategy:
+    """Estratégia de mentira: espera `delay` (ou um evento) e devolve `value`"""
+
+    def __init__(self, value, delay=0.0, release=None, error=None):
+        self.value = value
+        self.delay = delay
+        self.release = release
+        self.error = error
+        self.calls = []
+        self.finished = threading.Event()
+
+    def __call__(self, invoice_key):
+        self.calls.append(invoice_key)
+        try:
+            if self.release is not None:
+                self.release.wait(5)
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return self.value
+        finally:
+            self.finished.set()
+
+
+def valid(value):
+    return value is not None and KEY in value
+
+
+def test_first_valid_result_wins_and_later_strategies_never_start():
+    slow = Strategy(f"<nfeProc>{KEY}</nfeProc> lenta", release=threading.Event())
+    fast = Strategy(f"<nfeProc>{KEY}</nfeProc>", delay=0.01)
+    unstarted = Strategy(f"<nfeProc>{KEY}</nfeProc> sobra")
+
+    name, value = race_strategies(
+        [("lenta", slow), ("rapida", fast), ("sobra", unstarted)],
+        KEY, valid, hedge_delay=0.05, deadline=5,
+    )
+
+    assert (name, value) == ("rapida", fast.value)
+    assert slow.calls == [KEY]
+    slow.release.set()
+    assert slow.finished.wait(2)
+    time.sleep(0.1)
+    assert unstarted.calls == []
+
+
+def test_failure_starts_next_strategy_without_waiting_hedge():
+    broken = Strategy(None, error=RuntimeError("fora do ar"))
+    rejected = Strategy("<html>captcha</html>")
+    good = Strategy(f"<nfeProc>{KEY}</nfeProc>")
+
+    started = time.monotonic()
+    name, _ = race_strategies(
+        [("quebrada", broken), ("recusada", rejected), ("boa", good)],
+        KEY, valid, hedge_delay=10, deadline=5,
+    )
+
+    assert name == "boa"
+    assert time.monotonic() - started < 1
+
+
+def test_outcomes_reported_including_losers():
+    outcomes = []
+    loser_release = threading.Event()
+    loser = Strategy(f"<nfeProc>{KEY}</nfeProc> tarde", release=loser_release)
+    winner = Strategy(f"<nfeProc>{KEY}</nfeProc>")
+
+    name, _ = race_strategies(
+        [("perdedora", loser), ("vencedora", winner)], KEY, valid,
+        hedge_delay=0, deadline=5, on_outcome=lambda *args: outcomes.append(args[:2]),
+    )
+    loser_release.set()
+    assert loser.finished.wait(2)
+    time.sleep(0.05)
+
+    assert name == "vencedora"
+    assert sorted(outcomes) == [("perdedora", True), ("vencedora", True)]
+
+
+def test_deadline_returns_nothing():
+    stuck = Strategy(f"<nfeProc>{KEY}</nfeProc>", release=threading.Event())
+
+    started = time.monotonic()
+    assert race_strategies([("travada", stuck)], KEY, valid, hedge_delay=0, deadline=0.2) == (None, None)
+    assert time.monotonic() - started < 1
+    stuck.release.set()
+
+
+def test_all_rejected_returns_nothing():
+    strategies = [(str(n), Strategy("<html>erro</html>")) for n in range(3)]
+    assert race_strategies(strategies, KEY, valid, hedge_delay=0.01, deadline=5) == (None, None)
+    assert all(strategy.calls == [KEY] for _, strategy in strategies)
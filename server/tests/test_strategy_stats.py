@@ -0,0 +1,28 @@
+"""Ordem por tempo esperado e registro de melhor esforço do StrategyStats"""
+
+from strategy_stats import StrategyStats
+
+STRATEGIES = [("lenta", None), ("rapida", None), ("nova", None)]
+
+
+def test_order_prefers_fast_successful_strategy(tmp_path):
+    stats = StrategyStats(str(tmp_path / "stats.db"))
+    for _ in range(3):
+        stats.record("svc", "lenta", "SP", False, 8.0)
+        stats.record("svc", "rapida", "SP", True, 0.2)
+
+    ordered = [name for name, _ in stats.order("svc", STRATEGIES, "SP")]
+
+    assert ordered == ["rapida", "nova", "lenta"]
+    assert [name for name, _ in stats.order("svc", STRATEGIES, "RJ")] == ["lenta", "rapida", "nova"]
+
+
+def test_unwritable_path_never_raises(tmp_path):
+    blocker = tmp_path / "arquivo"
+    blocker.write_text("não é pasta")
+    stats = StrategyStats(str(blocker / "sub" / "stats.db"))
+
+    stats.record("svc", "rapida", "SP", True, 0.2)
+
+    assert stats.snapshot("svc", "SP") == {}
+    assert stats.order("svc", STRATEGIES, "SP") == STRATEGIES
@@ -0,0 +1,77 @@
+"""Protocolo JSON-lines do xml_fetch_worker: cancelamento libera a vaga"""
+
+import io
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+
+import xml_fetch_worker
+
+
+class BlockingScraper:
+    """Fica "no navegador" até ser abortado ou liberado"""
+    started = []
+
+    def __init__(self, headless=True):
+        self.aborted = False
+        self.done = threading.Event()
+
+    def fetch_xml(self, chave):
+        BlockingScraper.started.append(chave)
+        if chave.startswith("rapida"):
+            return {"success": True, "message": chave}
+        self.done.wait(5)
+        return {"success": False, "error": "Busca cancelada"}
+
+    def abort(self):
+        self.aborted = True
+        self.done.set()
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    BlockingScraper.started = []
+    monkeypatch.setattr(xml_fetch_worker, "MeuDanfeXMLScraper", BlockingScraper)
+    worker = xml_fetch_worker.XMLFetchWorker(max_workers=1, output=io.StringIO())
+    yield worker
+    worker.executor.shutdown(wait=True)
+
+
+def responses(worker):
+    return [json.loads(line) for line in worker.output.getvalue().splitlines()]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_cancel_frees_queued_and_running_slots(worker):
+    worker.handle_line(json.dumps({"id": "a", "chave": "lenta-a"}))
+    worker.handle_line(json.dumps({"id": "b", "chave": "lenta-b"}))
+    assert wait_for(lambda: BlockingScraper.started == ["lenta-a"])
+
+    worker.handle_line(json.dumps({"id": "b", "op": "cancel"}))
+    worker.handle_line(json.dumps({"id": "a", "op": "cancel"}))
+    worker.handle_line(json.dumps({"id": "c", "chave": "rapida-c"}))
+
+    assert wait_for(lambda: responses(worker))
+    assert BlockingScraper.started == ["lenta-a", "rapida-c"]
+    assert [message["id"] for message in responses(worker)] == ["c"]
+    assert worker.running == {} and worker.queued == {}
+
+
+def test_cancel_after_completion_is_ignored(worker):
+    worker.handle_line(json.dumps({"id": "a", "chave": "rapida-a"}))
+    assert wait_for(lambda: responses(worker))
+
+    worker.handle_line(json.dumps({"id": "a", "op": "cancel"}))
+
+    assert worker.cancelled == set()
+    assert responses(worker)[0]["result"] == {"success": True, "message": "rapida-a"}
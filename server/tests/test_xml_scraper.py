@@ -0,0 +1,67 @@
+"""Smoke test do MeuDanfeXMLScraper.fetch_xml com um driver de mentira"""
+
+import types
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("lxml")
+
+import xml_scraper
+from fake_browser import FakeDriver
+from nfe_record_parser import build_sample
+from nfe_xml_cache import load_xml
+
+FORM_HTML = """<html><body>
+<a href="/app">Baixar o aplicativo</a>
+<input placeholder="DIGITE A CHAVE DE ACESSO"/>
+<button data-next="https://meudanfe.com.br/resultado">Buscar</button>
+</body></html>"""
+
+RESULT_HTML = """<html><body>
+<a href="https://meudanfe.com.br/download/{key}.xml">Baixar XML</a>
+</body></html>"""
+
+
+class StubPool:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def acquire(self, timeout=None):
+        return self.driver
+
+
+def test_fetch_xml_searches_and_downloads(monkeypatch, tmp_path, make_key):
+    key = make_key(4201)
+    xml_bytes = build_sample(3, chave=key)
+    xml_content = xml_bytes.decode("utf-8")
+    driver = FakeDriver({
+        "https://meudanfe.com.br/": FORM_HTML,
+        "https://meudanfe.com.br/resultado": RESULT_HTML.format(key=key),
+    }, download_dir=str(tmp_path))
+    released, downloads = [], []
+
+    def get(url, timeout=None):
+        downloads.append(url)
+        return types.SimpleNamespace(status_code=200, content=xml_bytes)
+
+    monkeypatch.setattr(xml_scraper, "get_scraper_pool", lambda headless: StubPool(driver))
+    monkeypatch.setattr(xml_scraper, "release_driver", released.append)
+    monkeypatch.setattr(xml_scraper, "session", types.SimpleNamespace(get=get))
+
+    result = xml_scraper.MeuDanfeXMLScraper().fetch_xml(key)
+
+    assert result["success"], result.get("error")
+    assert result["xml_content"] == xml_content
+    assert driver.clicks == ["Buscar"]
+    assert downloads == [f"https://meudanfe.com.br/download/{key}.xml"]
+    assert released == [driver]
+    assert load_xml(key) == xml_content
+
+
+def test_fetch_xml_rejects_invalid_key_without_driver(monkeypatch):
+    monkeypatch.setattr(xml_scraper, "get_scraper_pool", lambda headless: pytest.fail("driver requested"))
+
+    result = xml_scraper.MeuDanfeXMLScraper().fetch_xml("123")
+
+    assert not result["success"]
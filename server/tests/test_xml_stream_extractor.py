@@ -0,0 +1,86 @@
+"""Extração do documento NFe de um corpo recebido em pedaços"""
+
+import pytest
+
+from nfe_record_parser import build_sample
+from xml_stream_extractor import (
+    XMLStreamExtractor, body_contains, body_contains_any, extract_chunks, extract_xml,
+)
+
+KEY = "42250485179240000239550020004175361171503396"
+OTHER_KEY = "35250513516247000107550010000113401146202508"
+DOCUMENT = build_sample(2, chave=KEY).strip()
+PAGE = b"<html><body><p>carregando</p><pre>" + DOCUMENT + b"</pre><script>var x = '</nfeProc>';</script></body></html>"
+
+
+def pieces(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 10, 64, 255, 256, 257, 4096, len(PAGE)])
+def test_document_split_across_chunks(size):
+    assert extract_chunks(pieces(PAGE, size), KEY) == DOCUMENT
+
+
+def test_every_split_point_of_root_and_closing_tags():
+    for marker in (b"<nfeProc", b"</nfeProc>", b"<?xml"):
+        start = PAGE.index(marker)
+        for cut in range(start, start + len(marker) + 1):
+            assert extract_chunks([PAGE[:cut], PAGE[cut:]], KEY) == DOCUMENT, (marker, cut)
+
+
+def test_skips_documents_for_other_keys_and_short_ones():
+    other = build_sample(1, chave=OTHER_KEY).strip()
+    body = other + b"\n" + DOCUMENT
+
+    assert extract_chunks(pieces(body, 100), KEY) == DOCUMENT
+    assert extract_chunks(pieces(body, 100), None) == other
+    assert extract_chunks(pieces(body, 100), None, min_length=len(other) + 1) == DOCUMENT
+    assert extract_chunks(pieces(other, 100), KEY) is None
+
+
+def test_stops_consuming_once_found():
+    consumed = []
+
+    def chunks():
+        for chunk in pieces(DOCUMENT + b"x" * 10000, 512):
+            consumed.append(chunk)
+            yield chunk
+
+    assert extract_chunks(chunks(), KEY) == DOCUMENT
+    assert sum(map(len, consumed)) < len(DOCUMENT) + 512
+
+
+def test_feed_keeps_result_after_completion():
+    extractor = XMLStreamExtractor(KEY)
+    for chunk in pieces(PAGE, 33):
+        extractor.feed(chunk)
+    assert extractor.result == DOCUMENT
+    assert extractor.feed(b"<nfeProc>outro</nfeProc>") == DOCUMENT
+
+
+def test_extract_xml_keeps_input_type():
+    assert extract_xml(PAGE.decode("utf-8"), KEY) == DOCUMENT.decode("utf-8")
+    assert extract_xml(PAGE, KEY) == DOCUMENT.decode("utf-8")
+    assert extract_xml(b"<html>sem nota</html>", KEY) is None
+
+
+class RawResponse:
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        raise AssertionError("o corpo não deve ser decodificado")
+
+
+def test_body_markers_search_raw_bytes():
+    page = "<p>NF-e não encontrada</p><a>Baixar XML</a>".encode("utf-8")
+
+    for source in (page, RawResponse(page)):
+        assert body_contains(source, "Baixar XML", b"<p>")
+        assert not body_contains(source, "Baixar XML", KEY)
+        assert body_contains_any(source, "sucesso", "não encontrada")
+        assert body_contains_any(source, "baixar xml", ignore_case=True)
+        assert not body_contains_any(source, "baixar xml")
+    assert not body_contains_any(RawResponse(None), "x")
@@ -1,39 +1,19 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
 import time
 import re
 from urllib.parse import quote, urlencode
-
-def validate_nfe_key(invoice_key):
-    """Validate NFe key format"""
-    if not invoice_key or len(invoice_key) != 44:
-        return False, "Chave deve ter 44 dígitos"
-    if not invoice_key.isdigit():
-        return False, "Chave deve conter apenas números"
-    return True, "Chave válida"
+from http_session import create_session
+from xml_stream_extractor import extract_xml, xml_text, body_contains
+from nfe_access_key import validate_nfe_key
 
 def create_session_with_headers():
-    """Create session with browser-like headers"""
-    session = requests.Session()
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    """Create session with browser-like headers (pooled connections)"""
+    return create_session("browser", headers={
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Sec-Fetch-User': '?1',
         'Cache-Control': 'max-age=0'
-    }
-    
-    session.headers.update(headers)
-    return session
+    })
 
 def simulate_meudanfe_rpa(session, invoice_key):
     """Simulate RPA process for meudanfe.com.br"""
@@ -65,47 +45,38 @@ def simulate_meudanfe_rpa(session, invoice_key):
                 response = session.get(endpoint, timeout=12)
                 
                 if response.status_code == 200:
-                    content = response.text
-                    
                     # Check for XML content
-                    if invoice_key in content and '<?xml' in content:
-                        xml_start = content.find('<?xml')
-                        xml_end = content.find('</nfeProc>', xml_start)
-                        if xml_end == -1:
-                            xml_end = content.find('</NFe>', xml_start)
-                        
-                        if xml_end != -1:
-                            xml_content = content[xml_start:xml_end + 10]
-                            if len(xml_content) > 1000:
-                                return {
-                                    "success": True,
-                                    "xml_content": xml_content,
-                                    "message": f"XML obtido via RPA do endpoint: {endpoint}"
-                                }
+                    if body_contains(response, invoice_key, '<?xml'):
+                        xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                        if xml_content:
+                            return {
+                                "success": True,
+                                "xml_content": xml_content,
+                                "message": f"XML obtido via RPA do endpoint: {endpoint}"
+                            }
                     
-                    # Check for download links
+                    # Check for download links (bytes regex; only the href is decoded)
                     download_patterns = [
-                        r'href="([^"]*\.xml[^"]*)"',
-                        r'href="([^"]*download[^"]*)"',
-                        r'href="([^"]*xml[^"]*)"'
+                        rb'href="([^"]*\.xml[^"]*)"',
+                        rb'href="([^"]*download[^"]*)"',
+                        rb'href="([^"]*xml[^"]*)"'
                     ]
                     
                     for pattern in download_patterns:
-                        matches = re.findall(pattern, content, re.IGNORECASE)
+                        matches = re.findall(pattern, response.content, re.IGNORECASE)
                         for match in matches:
-                            download_url = match
+                            download_url = match.decode('utf-8', errors='replace')
                             if not download_url.startswith('http'):
                                 download_url = main_url + ('/' if not download_url.startswith('/') else '') + download_url
                             
                             try:
                                 download_response = session.get(download_url, timeout=10)
-                                if download_response.status_code == 200 and invoice_key in download_response.text:
-                                    if '<?xml' in download_response.text:
-                                        return {
-                                            "success": True,
-                                            "xml_content": download_response.text,
-                                            "message": f"XML baixado via RPA: {download_url}"
-                                        }
+                                if download_response.status_code == 200 and body_contains(download_response, invoice_key, '<?xml'):
+                                    return {
+                                        "success": True,
+                                        "xml_content": xml_text(download_response.content),
+                                        "message": f"XML baixado via RPA: {download_url}"
+                                    }
                             except Exception:
                                 continue
                 
@@ -136,37 +107,25 @@ def simulate_meudanfe_rpa(session, invoice_key):
                 
                 # Try POST
                 response = session.post(endpoint, data=form_data, timeout=12)
-                if response.status_code == 200 and invoice_key in response.text and '<?xml' in response.text:
-                    xml_start = response.text.find('<?xml')
-                    xml_end = response.text.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = response.text.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = response.text[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML obtido via formulário: {endpoint}"
-                            }
+                if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": f"XML obtido via formulário: {endpoint}"
+                        }
                 
                 # Try GET with params
                 response = session.get(endpoint, params=form_data, timeout=12)
-                if response.status_code == 200 and invoice_key in response.text and '<?xml' in response.text:
-                    xml_start = response.text.find('<?xml')
-                    xml_end = response.text.find('</nfeProc>', xml_start)
-                    if xml_end == -1:
-                        xml_end = response.text.find('</NFe>', xml_start)
-                    
-                    if xml_end != -1:
-                        xml_content = response.text[xml_start:xml_end + 10]
-                        if len(xml_content) > 1000:
-                            return {
-                                "success": True,
-                                "xml_content": xml_content,
-                                "message": f"XML obtido via GET: {endpoint}"
-                            }
+                if response.status_code == 200 and body_contains(response, invoice_key, '<?xml'):
+                    xml_content = extract_xml(response.content, invoice_key, min_length=1000)
+                    if xml_content:
+                        return {
+                            "success": True,
+                            "xml_content": xml_content,
+                            "message": f"XML obtido via GET: {endpoint}"
+                        }
                 
             except Exception as e:
                 print(f"Erro no formulário {endpoint}: {e}")
@@ -0,0 +1,221 @@
+/**
+ * XML Fetch Worker Client
+ *
+ * Keeps a single resident `xml_fetch_worker.py` process alive and sends it
+ * invoice keys over a JSON-lines stdin/stdout protocol, matching responses
+ * to requests by id. Avoids paying Python startup, selenium imports and
+ * scraper setup on every request.
+ *
+ * Timeouts: when a request times out the client resolves it and sends
+ * {"op": "cancel"} for its id. The worker drops the job if it is still
+ * queued, or discards its Chrome driver if it is running, so an abandoned
+ * fetch stops holding one of the `workers` executor slots. Time spent
+ * queued behind other running fetches still counts against each request's
+ * timeout, so `workers` (NFE_FETCH_WORKERS, default 2) should cover the
+ * route's expected concurrent requests.
+ *
+ * Usage:
+ *   const result = await xmlFetchWorker.fetch(chaveNotaFiscal, 60000);
+ */
+
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+
+export interface ParsedNFeParty {
+  razao_social: string;
+  cnpj: string;
+  inscricao_estadual: string;
+  logradouro: string;
+  numero: string;
+  bairro: string;
+  cidade: string;
+  uf: string;
+  cep: string;
+  telefone: string;
+}
+
+/**
+ * Compact record produced by nfe_record_parser.py (`parsed` field)
+ */
+export interface ParsedNFe {
+  chave_acesso: string;
+  numero_nf: string;
+  serie: string;
+  data_emissao: string;
+  data_saida: string;
+  natureza_operacao: string;
+  tipo_operacao: string;
+  protocolo: string;
+  emitente: ParsedNFeParty;
+  destinatario: ParsedNFeParty;
+  transporte: {
+    modalidade_frete: string;
+    transportador: ParsedNFeParty | null;
+    volumes: Array<{
+      quantidade: number;
+      especie: string;
+      marca: string;
+      numeracao: string;
+      peso_liquido: number;
+      peso_bruto: number;
+    }>;
+  };
+  peso_bruto: number;
+  peso_liquido: number;
+  volumes: number;
+  totais: {
+    valor_produtos: number;
+    valor_frete: number;
+    valor_seguro: number;
+    valor_desconto: number;
+    valor_icms: number;
+    valor_ipi: number;
+    valor_total: number;
+  };
+  valor_total: number;
+  itens: Array<{
+    numero: number;
+    codigo: string;
+    descricao: string;
+    ncm: string;
+    cfop: string;
+    unidade: string;
+    quantidade: number;
+    valor_unitario: number;
+    valor_total: number;
+  }>;
+}
+
+export interface XmlFetchResult {
+  success: boolean;
+  xml_content?: string;
+  parsed?: ParsedNFe;
+  message?: string;
+  error?: string;
+  timeout?: boolean;
+}
+
+interface PendingRequest {
+  resolve: (result: XmlFetchResult) => void;
+  timer: NodeJS.Timeout;
+}
+
+const WORKER_SCRIPT = '/home/runner/workspace/server/xml_fetch_worker.py';
+const WORKERS = Number(process.env.NFE_FETCH_WORKERS) || 2;
+
+export class XmlFetchWorkerClient {
+  private process: ChildProcessWithoutNullStreams | null = null;
+  private pending = new Map<string, PendingRequest>();
+  private buffer = '';
+  private nextId = 0;
+
+  constructor(private scriptPath: string = WORKER_SCRIPT, private workers: number = WORKERS) {}
+
+  /**
+   * Fetches the XML for one key through the resident worker
+   */
+  fetch(chaveNotaFiscal: string, timeoutMs: number = 60000): Promise<XmlFetchResult> {
+    const worker = this.ensureProcess();
+    const id = `${process.pid}-${++this.nextId}`;
+
+    return new Promise((resolve) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        this.cancel(worker, id);
+        resolve({
+          success: false,
+          timeout: true,
+          error: 'Timeout na automação. O processo demorou mais que o esperado.'
+        });
+      }, timeoutMs);
+
+      this.pending.set(id, { resolve, timer });
+      worker.stdin.write(JSON.stringify({ id, chave: chaveNotaFiscal }) + '\n');
+    });
+  }
+
+  /**
+   * Frees the worker slot held by an abandoned request
+   */
+  private cancel(worker: ChildProcessWithoutNullStreams, id: string) {
+    if (this.process !== worker || !worker.stdin.writable) return;
+    worker.stdin.write(JSON.stringify({ id, op: 'cancel' }) + '\n');
+  }
+
+  private ensureProcess(): ChildProcessWithoutNullStreams {
+    if (this.process) {
+      return this.process;
+    }
+
+    const worker = spawn('python3', [this.scriptPath, '--workers', String(this.workers), '--warm']);
+
+    // Decodes UTF-8 across chunk boundaries (accented characters in the XML)
+    worker.stdout.setEncoding('utf8');
+    worker.stderr.setEncoding('utf8');
+
+    worker.stdout.on('data', (data: string) => this.handleOutput(data));
+
+    worker.stderr.on('data', (data: string) => {
+      console.error('[XmlFetchWorker] stderr:', data);
+    });
+
+    // Spawn failures (e.g. python3 missing) and broken stdin pipes
+    worker.on('error', (error: Error) => {
+      console.error('[XmlFetchWorker] Erro no processo do worker:', error.message);
+      this.discard(worker, 'Worker de automação indisponível. Tente novamente.');
+    });
+
+    worker.stdin.on('error', (error: Error) => {
+      console.error('[XmlFetchWorker] Erro ao escrever no worker:', error.message);
+    });
+
+    worker.on('close', (code: number) => {
+      console.error(`[XmlFetchWorker] Worker encerrado com código ${code}`);
+      this.discard(worker, 'Worker de automação encerrado inesperadamente. Tente novamente.');
+    });
+
+    this.process = worker;
+    return worker;
+  }
+
+  private discard(worker: ChildProcessWithoutNullStreams, error: string) {
+    if (this.process !== worker) return;
+    this.process = null;
+    this.buffer = '';
+    this.failPending(error);
+  }
+
+  private handleOutput(data: string) {
+    this.buffer += data;
+
+    let newline = this.buffer.indexOf('\n');
+    while (newline !== -1) {
+      const line = this.buffer.slice(0, newline).trim();
+      this.buffer = this.buffer.slice(newline + 1);
+      newline = this.buffer.indexOf('\n');
+
+      if (!line) continue;
+
+      try {
+        const message = JSON.parse(line);
+        const request = this.pending.get(message.id);
+        if (request) {
+          clearTimeout(request.timer);
+          this.pending.delete(message.id);
+          request.resolve(message.result);
+        }
+      } catch (parseError) {
+        console.error('[XmlFetchWorker] Resposta inválida do worker:', line);
+      }
+    }
+  }
+
+  private failPending(error: string) {
+    this.pending.forEach((request) => {
+      clearTimeout(request.timer);
+      request.resolve({ success: false, error });
+    });
+    this.pending.clear();
+  }
+}
+
+export const xmlFetchWorker = new XmlFetchWorkerClient();
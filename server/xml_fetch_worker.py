@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Worker residente para busca de XML no meudanfe.com.br
+Mantém MeuDanfeXMLScraper e suas dependências carregados e atende várias
+chaves via protocolo JSON-lines em stdin/stdout.
+
+Protocolo (uma linha JSON por mensagem):
+    entrada: {"id": "abc", "chave": "<44 dígitos>"}
+             {"id": "abc", "op": "ping"}
+             {"id": "abc", "op": "metrics"}
+             {"id": "abc", "op": "cancel"}
+             {"id": "abc", "op": "shutdown"}
+    saída:   {"id": "abc", "result": {...}, "timing": {"queued_ms": 12.0, "run_ms": 8400.0}}
+
+"timing" separa a espera na fila do executor (buscas simultâneas ocupadas)
+do tempo da busca em si; o cliente Node lê apenas "result". Cada busca abre
+um trace (fetch_metrics): os spans por etapa vão para o canal NFE_SPANS e o
+op "metrics" (ou GET /metrics com --metrics-port) devolve os agregados em
+texto Prometheus.
+
+"cancel" (enviado pelo cliente Node quando a rota desiste, aos 60 s) libera
+a vaga da busca: se ainda está na fila, sai dela; se já está rodando, o
+driver Chrome é descartado e a busca termina com erro logo em seguida.
+Buscas canceladas não recebem resposta.
+
+A saída padrão é reservada ao protocolo; mensagens de progresso dos
+scrapers são redirecionadas para stderr. Resultados com XML trazem também o
+registro estruturado em "parsed" (ver nfe_record_parser, NFE_RESULT_FORMAT).
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from xml_scraper import MeuDanfeXMLScraper, get_scraper_pool
+from nfe_record_parser import attach_parsed
+from fetch_metrics import trace, span, prometheus_text, serve_metrics, METRICS_PORT
+
+
+class XMLFetchWorker:
+    def __init__(self, max_workers=1, headless=True, output=None):
+        self.headless = headless
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs_lock = threading.Lock()
+        self.queued = {}
+        self.running = {}
+        self.cancelled = set()
+
+    def send(self, message):
+        """Escreve uma resposta no canal do protocolo"""
+        line = json.dumps(message, ensure_ascii=False)
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def fetch(self, request_id, chave, received=None):
+        """Executa a busca de uma chave e responde com o mesmo id"""
+        started = time.monotonic()
+        scraper = MeuDanfeXMLScraper(headless=self.headless)
+        with self.jobs_lock:
+            self.queued.pop(request_id, None)
+            self.running[request_id] = scraper
+            if request_id in self.cancelled:
+                self.cancelled.discard(request_id)
+                scraper.abort()
+        with trace(chave), span("fetch", queued_ms=round((started - (received or started)) * 1000, 1)) as current:
+            try:
+                result = attach_parsed(scraper.fetch_xml(chave))
+            except Exception as e:
+                result = {"success": False, "error": f"Erro no worker: {str(e)}"}
+            if scraper.aborted:
+                current.set(status="cancelled")
+            elif not result.get("success"):
+                current.set(status="failed")
+        with self.jobs_lock:
+            self.running.pop(request_id, None)
+        if scraper.aborted:
+            return
+        timing = {
+            "queued_ms": round((started - (received or started)) * 1000, 1),
+            "run_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        self.send({"id": request_id, "result": result, "timing": timing})
+
+    def handle_line(self, line):
+        """Processa uma linha recebida; retorna False para encerrar"""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            self.send({"id": None, "result": {"success": False, "error": "Requisição JSON inválida"}})
+            return True
+
+        request_id = request.get("id")
+        op = request.get("op", "fetch")
+
+        if op == "ping":
+            self.send({"id": request_id, "result": {"success": True, "message": "pong"}})
+            return True
+
+        if op == "metrics":
+            self.send({"id": request_id, "result": {"success": True, "metrics": prometheus_text()}})
+            return True
+
+        if op == "cancel":
+            self.cancel(request_id)
+            return True
+
+        if op == "shutdown":
+            return False
+
+        chave = str(request.get("chave") or "").strip()
+        with self.jobs_lock:
+            self.queued[request_id] = self.executor.submit(self.fetch, request_id, chave, time.monotonic())
+        return True
+
+    def cancel(self, request_id):
+        """Tira a busca da fila ou aborta o driver dela, liberando a vaga do executor"""
+        with self.jobs_lock:
+            future = self.queued.pop(request_id, None)
+            if future is not None and future.cancel():
+                return
+            scraper = self.running.get(request_id)
+            if scraper is None:
+                if future is not None:
+                    # Começou mas ainda não se registrou: fetch aborta ao registrar
+                    self.cancelled.add(request_id)
+                return
+        scraper.abort()
+
+    def serve(self, stream=None):
+        """Loop principal: lê requisições até EOF ou shutdown"""
+        stream = stream or sys.stdin
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if not self.handle_line(line):
+                break
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker residente de busca de XML")
+    parser.add_argument("--workers", type=int, default=1, help="Buscas simultâneas (padrão: 1)")
+    parser.add_argument("--no-headless", action="store_true", help="Exibe o navegador")
+    parser.add_argument("--warm", action="store_true", help="Pré-lança os drivers Chrome na inicialização")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Porta local para GET /metrics (padrão: NFE_METRICS_PORT; 0 desliga)")
+    args = parser.parse_args()
+
+    # Reserva stdout para o protocolo; prints dos scrapers vão para stderr
+    protocol_output = sys.stdout
+    sys.stdout = sys.stderr
+
+    worker = XMLFetchWorker(
+        max_workers=max(1, args.workers),
+        headless=not args.no_headless,
+        output=protocol_output
+    )
+
+    # Um driver Chrome por busca simultânea
+    pool = get_scraper_pool(not args.no_headless, max_size=worker.max_workers)
+    if args.warm:
+        threading.Thread(target=pool.warm, args=(worker.max_workers,), daemon=True).start()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    worker.serve()
+
+
+if __name__ == "__main__":
+    main()
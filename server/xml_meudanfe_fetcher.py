@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 import sys
 import json
-import time
-import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from http_session import shared_session
+from browser_waits import wait_for_search_result, search_state
+from xml_stream_extractor import xml_text, body_contains
+from nfe_access_key import validate_nfe_key
+
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("browser")
 
 def create_driver():
     options = Options()
@@ -21,8 +26,9 @@ def create_driver():
 
 def fetch_xml_from_meudanfe(chave_nfe):
     # Validate input
-    if not chave_nfe or len(chave_nfe) != 44:
-        return {"success": False, "error": "Chave deve ter 44 dígitos"}
+    is_valid, message = validate_nfe_key(chave_nfe)
+    if not is_valid:
+        return {"success": False, "error": message}
     
     driver = None
     try:
@@ -46,10 +52,11 @@ def fetch_xml_from_meudanfe(chave_nfe):
         search_button = wait.until(
             EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]"))
         )
+        before = search_state(driver)
         search_button.click()
         
         # Wait for results
-        time.sleep(5)
+        wait_for_search_result(driver, before)
         
         # Look for XML download link
         xml_links = driver.find_elements(By.XPATH, "//a[contains(@href, '.xml') or contains(text(), 'XML')]")
@@ -59,16 +66,14 @@ def fetch_xml_from_meudanfe(chave_nfe):
             
             if xml_url:
                 # Download XML using requests
-                response = requests.get(xml_url, timeout=30)
+                response = session.get(xml_url, timeout=30)
                 
                 if response.status_code == 200:
-                    xml_content = response.text
-                    
                     # Validate XML content
-                    if xml_content and '<?xml' in xml_content and len(xml_content) > 500:
+                    if body_contains(response, '<?xml') and len(response.content) > 500:
                         return {
                             "success": True,
-                            "xml_content": xml_content,
+                            "xml_content": xml_text(response.content),
                             "message": "XML baixado com sucesso via automação RPA!"
                         }
                     else:
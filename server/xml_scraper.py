@@ -5,9 +5,6 @@ Automatically fetches XML files using invoice access keys
 """
 
 import os
-import time
-import tempfile
-import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -17,44 +14,97 @@ from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import sys
 import json
+import threading
+from functools import partial
+from chrome_driver_pool import get_pool, release_driver
+from nfe_xml_cache import load_xml, store_xml
+from http_session import shared_session
+from cdp_download_capture import click_and_capture
+from lean_page_profile import apply_lean_options, apply_lean_blocking
+from browser_waits import wait_for_search_result, search_state
+from selector_probe import find_first
+from xml_stream_extractor import xml_text
+from nfe_access_key import validate_nfe_key
+from fetch_metrics import span
+
+# Shared HTTP session: connections are reused across keys and calls
+session = shared_session("browser")
+
+def create_scraper_driver(download_dir, headless=True):
+    """Configure Chrome WebDriver with appropriate settings"""
+    chrome_options = Options()
+    
+    if headless:
+        chrome_options.add_argument("--headless")
+    
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-plugins")
+    chrome_options.add_argument("--disable-javascript")
+    
+    # Set download preferences
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    # Eager page load, images off (replaces the ignored --disable-images)
+    apply_lean_options(chrome_options, prefs)
+    chrome_options.add_experimental_option("prefs", prefs)
+    
+    # Use system chromedriver (installed via nix)
+    driver = webdriver.Chrome(options=chrome_options)
+    # Block fonts, media, ads and analytics by URL pattern
+    return apply_lean_blocking(driver)
+
+def get_scraper_pool(headless=True, **options):
+    """Shared WebDriver pool for the scraper (one per headless mode)"""
+    name = "xml_scraper_headless" if headless else "xml_scraper"
+    return get_pool(name, partial(create_scraper_driver, headless=headless), **options)
 
 class MeuDanfeXMLScraper:
     def __init__(self, headless=True):
         self.headless = headless
         self.driver = None
-        self.download_dir = tempfile.mkdtemp()
+        self.download_dir = None
+        self.aborted = False
+        self._driver_lock = threading.Lock()
         
     def setup_driver(self):
-        """Configure Chrome WebDriver with appropriate settings"""
-        chrome_options = Options()
-        
-        if self.headless:
-            chrome_options.add_argument("--headless")
-        
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-plugins")
-        chrome_options.add_argument("--disable-images")
-        chrome_options.add_argument("--disable-javascript")
-        
-        # Set download preferences
-        prefs = {
-            "download.default_directory": self.download_dir,
-            "download.prompt_for_download": False,
-            "download.directory_upgrade": True,
-            "safebrowsing.enabled": True
-        }
-        chrome_options.add_experimental_option("prefs", prefs)
-        
+        """Borrow a pre-launched Chrome WebDriver from the shared pool"""
         try:
-            # Use system chromedriver (installed via nix)
-            self.driver = webdriver.Chrome(options=chrome_options)
-                
+            driver = get_scraper_pool(self.headless).acquire(timeout=60)
         except Exception as e:
             raise Exception(f"Failed to initialize Chrome WebDriver: {str(e)}")
+        
+        with self._driver_lock:
+            aborted = self.aborted
+            if not aborted:
+                self.driver = driver
+        if aborted:
+            release_driver(driver)
+            raise Exception("Busca cancelada")
+        
+        # Each pooled driver downloads into its own directory
+        self.download_dir = driver.download_dir
+    
+    def abort(self):
+        """Cancel a running fetch: discard the borrowed driver so pending calls fail fast"""
+        with self._driver_lock:
+            self.aborted = True
+            driver, self.driver = self.driver, None
+        if driver is not None:
+            release_driver(driver, discard=True)
+    
+    def _release(self):
+        with self._driver_lock:
+            driver, self.driver = self.driver, None
+        if driver is not None:
+            release_driver(driver)
     
     def fetch_xml(self, chave_nota_fiscal):
         """
@@ -66,17 +116,28 @@ class MeuDanfeXMLScraper:
         Returns:
             dict: Result containing success status and XML content or error message
         """
-        if not chave_nota_fiscal or len(chave_nota_fiscal) != 44:
+        is_valid, message = validate_nfe_key(chave_nota_fiscal)
+        if not is_valid:
             return {
                 "success": False,
-                "error": "Chave de nota fiscal deve ter exatamente 44 dígitos"
+                "error": message
+            }
+        
+        # An authorized NF-e never changes: reuse a previously fetched XML
+        cached_xml = load_xml(chave_nota_fiscal)
+        if cached_xml:
+            return {
+                "success": True,
+                "xml_content": cached_xml,
+                "message": "XML obtido do cache local"
             }
         
         try:
             self.setup_driver()
             
             # Navigate to meudanfe.com.br
-            self.driver.get("https://meudanfe.com.br/")
+            with span("page_load", page="home"):
+                self.driver.get("https://meudanfe.com.br/")
             
             # Wait for page to load
             wait = WebDriverWait(self.driver, 15)
@@ -94,10 +155,11 @@ class MeuDanfeXMLScraper:
             search_button = wait.until(
                 EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Buscar') or contains(text(), 'BUSCAR')]"))
             )
+            before = search_state(self.driver)
             search_button.click()
             
             # Wait for results page
-            time.sleep(3)
+            wait_for_search_result(self.driver, before)
             
             # Look for XML download link or button
             try:
@@ -109,13 +171,7 @@ class MeuDanfeXMLScraper:
                     "//a[contains(text(), 'Download XML')]"
                 ]
                 
-                xml_link = None
-                for selector in xml_selectors:
-                    try:
-                        xml_link = wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                        break
-                    except TimeoutException:
-                        continue
+                xml_link = find_first(self.driver, "download", xml_selectors, timeout=15, enabled=True)
                 
                 if xml_link:
                     print(f"Link XML encontrado, fazendo download...")
@@ -125,21 +181,22 @@ class MeuDanfeXMLScraper:
                         xml_url = xml_link.get_attribute('href')
                         if xml_url and xml_url.endswith('.xml'):
                             # Download XML directly
-                            response = requests.get(xml_url, timeout=30)
+                            response = session.get(xml_url, timeout=30)
                             if response.status_code == 200:
-                                xml_content = response.text
+                                xml_content = xml_text(response.content)
                             else:
-                                # Click the link and wait for download
-                                xml_link.click()
-                                time.sleep(8)
-                                xml_content = self._get_downloaded_xml()
+                                # Click the link and capture the download
+                                xml_content = click_and_capture(
+                                    self.driver, xml_link.click, chave_nota_fiscal, self.download_dir, timeout=18
+                                )
                         else:
-                            # Click the link and wait for download
-                            xml_link.click()
-                            time.sleep(8)
-                            xml_content = self._get_downloaded_xml()
+                            # Click the link and capture the download
+                            xml_content = click_and_capture(
+                                self.driver, xml_link.click, chave_nota_fiscal, self.download_dir, timeout=18
+                            )
                         
                         if xml_content and len(xml_content) > 100:  # Basic validation
+                            store_xml(chave_nota_fiscal, xml_content)
                             return {
                                 "success": True,
                                 "xml_content": xml_content,
@@ -192,25 +249,7 @@ class MeuDanfeXMLScraper:
                 "error": f"Erro durante automação: {str(e)}"
             }
         finally:
-            if self.driver:
-                self.driver.quit()
-    
-    def _get_downloaded_xml(self):
-        """Get the content of the downloaded XML file"""
-        try:
-            # Wait for file to be downloaded
-            for _ in range(10):  # Wait up to 10 seconds
-                files = os.listdir(self.download_dir)
-                xml_files = [f for f in files if f.endswith('.xml')]
-                if xml_files:
-                    xml_file_path = os.path.join(self.download_dir, xml_files[0])
-                    with open(xml_file_path, 'r', encoding='utf-8') as file:
-                        return file.read()
-                time.sleep(1)
-            return None
-        except Exception as e:
-            print(f"Erro ao ler arquivo XML baixado: {str(e)}")
-            return None
+            self._release()
 
 def main():
     """Main function for command line usage"""
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Extração incremental do XML da NFe a partir do corpo de respostas HTTP
+Recebe o corpo em pedaços (response.iter_content) e procura o envelope
+<nfeProc> (ou <NFe> avulso) numa única passada: antes da abertura só guarda a
+cauda necessária para uma tag partida entre pedaços; depois da abertura
+acumula apenas o documento e para de ler assim que chega o fechamento.
+Documentos de outra chave são descartados e a busca continua. Nunca há mais
+de um documento em memória.
+
+Substitui os re.search(r'<\\?xml[^>]*>.*?</nfeProc>', ..., re.DOTALL) que
+rodavam várias vezes sobre o HTML inteiro já decodificado.
+
+O pipeline trabalha em bytes: checagens de chave e marcadores são buscas em
+response.content (sem response.text, que decodifica o corpo inteiro e, sem
+charset no Content-Type, roda a detecção de encoding sobre ele) e só o trecho
+do XML extraído é decodificado, pelo encoding declarado no prólogo.
+
+Uso:
+    response = session.get(url, stream=True, timeout=20)
+    xml_content = stream_xml(response, invoice_key)      # str ou None
+
+    xml_content = extract_xml(page_source, invoice_key)  # corpo já em memória
+    xml_content = fetch_xml(session, download_url, invoice_key)
+
+    if body_contains(response, invoice_key, '<?xml'):
+        xml_content = extract_xml(response.content, invoice_key)
+    if body_contains_any(response, 'sucesso', 'baixar xml', ignore_case=True):
+        ...
+"""
+
+import os
+import re
+
+from fetch_metrics import span
+
+CHUNK_SIZE = 16 * 1024
+MAX_DOCUMENT_BYTES = int(os.environ.get("NFE_XML_STREAM_MAX_BYTES", str(10 * 1024 * 1024)))
+
+_ROOT_RE = re.compile(rb'<(nfeProc|NFe)(?=[\s>/])', re.IGNORECASE)
+_PROLOG_RE = re.compile(rb'<\?xml[^>]*\?>\s*$')
+_ENCODING_RE = re.compile(rb'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)["\']')
+# Cauda mantida antes da abertura: prólogo + início de tag partida
+_SEARCH_TAIL = 256
+
+
+def xml_text(data):
+    """Decodifica bytes de XML usando o encoding declarado no prólogo (padrão UTF-8)"""
+    match = _ENCODING_RE.match(data.lstrip()[:200])
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        return data.decode(encoding)
+    except (LookupError, UnicodeDecodeError):
+        return data.decode('utf-8', errors='replace')
+
+
+def _raw_body(source):
+    """Corpo bruto de uma resposta (ou os próprios bytes)"""
+    content = source.content if hasattr(source, 'content') else source
+    return content or b''
+
+
+def _marker_bytes(marker):
+    return marker.encode('utf-8') if isinstance(marker, str) else marker
+
+
+def body_contains(source, *markers):
+    """True se todos os marcadores (str ou bytes) estão no corpo bruto da resposta (ou nos bytes)"""
+    content = _raw_body(source)
+    return all(_marker_bytes(m) in content for m in markers)
+
+
+def body_contains_any(source, *markers, ignore_case=False):
+    """
+    True se algum marcador está no corpo bruto da resposta (ou nos bytes)
+
+    Marcadores str são procurados em UTF-8; ignore_case só ignora a caixa
+    das letras ASCII (bytes.lower), o que basta para os textos dos portais.
+    """
+    content = _raw_body(source)
+    if ignore_case:
+        content = content.lower()
+        return any(_marker_bytes(m).lower() in content for m in markers)
+    return any(_marker_bytes(m) in content for m in markers)
+
+
+class XMLStreamExtractor:
+    """
+    Alimentado com pedaços de bytes; devolve o documento quando ele fecha
+
+    Args:
+        invoice_key: exige a chave dentro do documento (None aceita qualquer)
+        min_length: tamanho mínimo do documento aceito
+    """
+
+    def __init__(self, invoice_key=None, min_length=0):
+        self.key = invoice_key.encode('ascii') if invoice_key else None
+        self.min_length = min_length
+        self.buffer = bytearray()
+        self.closing = None      # b'</nfeProc>' depois que a abertura chegou
+        self.scan_from = 0
+        self.result = None
+
+    def feed(self, chunk):
+        """Processa um pedaço; devolve os bytes do documento quando completo"""
+        if self.result is not None:
+            return self.result
+        self.buffer += chunk
+        while self.result is None:
+            if self.closing is None:
+                if not self._find_start():
+                    break
+            elif not self._find_end():
+                break
+        return self.result
+
+    def _find_start(self):
+        match = _ROOT_RE.search(self.buffer)
+        if not match:
+            # Só a cauda pode conter o começo do prólogo ou da tag
+            del self.buffer[:-_SEARCH_TAIL]
+            return False
+
+        start, root, root_end = match.start(), match.group(1), match.end()
+        prolog_start = self.buffer.rfind(b'<?xml', 0, start)
+        if prolog_start != -1 and _PROLOG_RE.match(self.buffer, prolog_start, start):
+            start = prolog_start
+        del self.buffer[:start]
+
+        self.closing = b'</' + root + b'>'
+        self.scan_from = root_end - start
+        return True
+
+    def _find_end(self):
+        # O fechamento usa a mesma grafia da abertura encontrada
+        end = self.buffer.find(self.closing, self.scan_from)
+        if end == -1:
+            if len(self.buffer) > MAX_DOCUMENT_BYTES:
+                # Abertura sem fechamento plausível: descarta e volta a procurar
+                del self.buffer[:self.scan_from]
+                self.closing = None
+                return True
+            # O fechamento pode estar partido entre este pedaço e o próximo
+            self.scan_from = max(self.scan_from, len(self.buffer) - len(self.closing) + 1)
+            return False
+
+        end += len(self.closing)
+        document = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        self.closing = None
+        self.scan_from = 0
+        if (self.key is None or self.key in document) and len(document) >= self.min_length:
+            self.result = document
+        return True
+
+
+def extract_chunks(chunks, invoice_key=None, min_length=0):
+    """Bytes do primeiro documento aceito num iterável de pedaços (para de consumir ao achar)"""
+    extractor = XMLStreamExtractor(invoice_key, min_length)
+    with span("extraction") as current:
+        for chunk in chunks:
+            if chunk and extractor.feed(chunk) is not None:
+                break
+        current.set(found=extractor.result is not None)
+    return extractor.result
+
+
+def stream_xml(response, invoice_key=None, min_length=0, chunk_size=CHUNK_SIZE):
+    """
+    XML da NFe no corpo de uma resposta do requests
+
+    Com stream=True o corpo é lido em pedaços e a leitura para no fechamento
+    do envelope; sem stream, percorre o corpo já carregado da mesma forma.
+
+    Returns:
+        str (decodificada pelo encoding declarado no prólogo) ou None
+    """
+    try:
+        document = extract_chunks(response.iter_content(chunk_size), invoice_key, min_length)
+    finally:
+        response.close()
+    return xml_text(document) if document else None
+
+
+def extract_xml(content, invoice_key=None, min_length=0):
+    """XML da NFe num corpo já em memória (str ou bytes), numa única passada"""
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    document = extract_chunks((data,), invoice_key, min_length)
+    if not document:
+        return None
+    return document.decode('utf-8') if isinstance(content, str) else xml_text(document)
+
+
+def fetch_xml(session, url, invoice_key=None, min_length=0, timeout=15, **kwargs):
+    """GET em stream de uma URL de download de XML; str do documento ou None"""
+    response = session.get(url, timeout=timeout, stream=True, **kwargs)
+    if response.status_code != 200:
+        response.close()
+        return None
+    return stream_xml(response, invoice_key, min_length)